@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Action Plans for ULCA
+Extracts the file writes, edits, deletions and shell commands proposed in a model
+response into a typed plan, previews it as one batch and applies it after a
+single confirmation.
+"""
+
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from file_edits import DIFF_FILE_HEADER, EditConflict, apply_edit, looks_like_edit
+from project_files import IGNORED_DIRS, ULCA_CACHE_DIR
+
+# Configuration
+SHELL_LANGUAGES = {"bash", "sh", "shell", "zsh", "console", "terminal", "shell-session"}
+DIFF_LANGUAGES = {"diff", "patch", "udiff"}
+MAX_PLAN_ACTIONS = 40  # Longer plans are almost always a misparse of an example-heavy answer
+PATH_LOOKBACK_LINES = 2  # Lines above a fence searched for the file it belongs to
+
+FENCE_OPEN = re.compile(r'^(?P<indent> {0,3})(?P<fence>`{3,}|~{3,})[ \t]*(?P<info>[^`\n]*)$')
+PATH_TOKEN = r'(?P<path>[\w.\-/]*[\w\-]\.[A-Za-z0-9]{1,10}|[\w.\-]+(?:/[\w.\-]+)+|Makefile|Dockerfile|Procfile|Gemfile)'
+# "FILE: src/app.py", "### `src/app.py`", "**src/app.py**:", "Create `src/app.py`:"
+PATH_LINE = re.compile(
+    r'^\s*(?:#+\s*|[-*]\s+|\d+\.\s+)?(?:\*\*|__)?\s*'
+    r'(?:(?:new |updated |modified )?(?:file|path|filename|create|update|modify|edit|in)\b\s*:?\s*)?'
+    r'(?:\*\*|__)?`?' + PATH_TOKEN + r'`?(?:\*\*|__)?\s*(?:\([^)]*\))?\s*:?\s*(?:\*\*|__)?\s*$',
+    re.IGNORECASE
+)
+# First line of a block naming its file: "# src/app.py", "// file: src/app.ts", "<!-- index.html -->"
+PATH_COMMENT = re.compile(r'^\s*(?:#|//|--|<!--|/\*)\s*(?:file(?:name)?:\s*)?' + PATH_TOKEN + r'\s*(?:-->|\*/)?\s*$',
+                          re.IGNORECASE)
+INFO_PATH = re.compile(r'(?:^|\s)(?:(?:title|file|path|filename)=)?["\']?' + PATH_TOKEN + r'["\']?\s*$')
+DELETE_LINE = re.compile(r'^\s*DELETE:\s*`?(?P<path>[^\s`]+)`?\s*$')
+
+PlanRecorder = Callable[[Dict[str, Any]], None]
+RunCommand = Callable[[str], Tuple[Dict[str, Any], Any]]
+AsyncRunCommand = Callable[[str], Awaitable[Tuple[Dict[str, Any], Any]]]
+
+
+class FenceTracker:
+    """Finds the line closing an open fence, one line at a time, so whole texts and streams agree
+
+    Models put fenced examples inside fenced files (a README, a docstring) without
+    lengthening the outer fence, so an inner opener with an info string is paired
+    with its own closer first. When that pairing never balances, the first
+    closing line wins, as in CommonMark: callers fall back to first_closer.
+    """
+
+    def __init__(self, fence: str):
+        self.fence = fence
+        self._closing = re.compile(r'^ {0,3}' + re.escape(fence[0]) + '{' + str(len(fence)) + r',}\s*$')
+        self._depth = 0
+        self.first_closer: Optional[int] = None  # Line of the first closing line that only closed an inner block
+
+    def closes(self, line: str, number: int) -> bool:
+        """Whether this line closes the outer fence"""
+        if self._closing.match(line):
+            if self._depth == 0:
+                return True
+            if self.first_closer is None:
+                self.first_closer = number
+            self._depth -= 1
+            return False
+        inner = FENCE_OPEN.match(line)
+        if inner and inner.group("info").strip() and inner.group("fence")[0] == self.fence[0] \
+                and len(inner.group("fence")) >= len(self.fence):
+            self._depth += 1
+        return False
+
+
+def _fence_end(lines: List[str], start: int, fence: str) -> Optional[int]:
+    """Index of the line closing the fence opened at start"""
+    tracker = FenceTracker(fence)
+    for j in range(start + 1, len(lines)):
+        if tracker.closes(lines[j], j):
+            return j
+    return tracker.first_closer
+
+
+def iter_fences(text: str) -> List[Dict[str, Any]]:
+    """Fenced blocks in document order as {info, body, start, end} with line indexes"""
+    lines = text.splitlines()
+    blocks = []
+    i = 0
+    while i < len(lines):
+        match = FENCE_OPEN.match(lines[i])
+        if not match:
+            i += 1
+            continue
+        end = _fence_end(lines, i, match.group("fence"))
+        if end is None:
+            break  # Unterminated fence: a truncated response, nothing after it is reliable
+        blocks.append({"info": match.group("info").strip(), "body": "\n".join(lines[i + 1:end]),
+                       "start": i, "end": end})
+        i = end + 1
+    return blocks
+
+
+def _clean_path(path: str) -> str:
+    path = path.strip().strip('`"\'')
+    return path[2:] if path.startswith("./") else path
+
+
+def _block_path(info: str, body: str, preceding: List[str]) -> Optional[str]:
+    """The file a fenced block belongs to, from its info string, the lines above it or its first line"""
+    words = info.split()
+    if words:
+        candidate = " ".join(words[1:]) if len(words) > 1 else words[0]
+        match = INFO_PATH.search(candidate)
+        # A bare info string is a language ("python") unless it looks like a path
+        if match and (len(words) > 1 or "." in words[0] or "/" in words[0]):
+            return _clean_path(match.group("path"))
+        if ":" in words[0]:  # ```python:src/app.py
+            lang, _, path = words[0].partition(":")
+            if path:
+                return _clean_path(path)
+    for line in reversed(preceding):
+        if not line.strip():
+            continue
+        match = PATH_LINE.match(line)
+        if match:
+            return _clean_path(match.group("path"))
+        break  # Only the nearest non-blank line may name the file
+    first_line = body.split("\n", 1)[0]
+    match = PATH_COMMENT.match(first_line)
+    return _clean_path(match.group("path")) if match else None
+
+
+def split_diff(text: str) -> List[Tuple[Optional[str], str, str]]:
+    """Split a multi-file unified diff into [(path, kind, single-file diff)], kind is create/edit/delete"""
+    lines = text.splitlines()
+    starts = [i for i in range(len(lines) - 1)
+              if lines[i].startswith("--- ") and lines[i + 1].startswith("+++ ")]
+    if not starts:
+        return [(None, "edit", text)] if text.strip() else []
+    files = []
+    for number, start in enumerate(starts):
+        end = starts[number + 1] if number + 1 < len(starts) else len(lines)
+        old, new = DIFF_FILE_HEADER.match(lines[start]), DIFF_FILE_HEADER.match(lines[start + 1])
+        old_path = old.group("path") if old else None
+        new_path = new.group("path") if new else None
+        if old_path == "/dev/null":
+            kind, path = "create", new_path
+        elif new_path == "/dev/null":
+            kind, path = "delete", old_path
+        else:
+            kind, path = "edit", new_path or old_path
+        files.append((path, kind, "\n".join(lines[start:end])))
+    return files
+
+
+def _new_file_from_diff(diff: str) -> str:
+    """Content of a file created by a /dev/null diff"""
+    body = [l[1:] for l in diff.splitlines()[2:] if l.startswith("+")]
+    return "\n".join(body) + "\n"
+
+
+def _shell_commands(body: str, info: str) -> List[str]:
+    """Commands in a shell block; console transcripts only contribute their $-prompted lines"""
+    transcript = info.split()[0].lower() in ("console", "shell-session") if info else False
+    prompted = any(l.lstrip().startswith("$ ") for l in body.splitlines())
+    commands, pending = [], ""
+    for raw in body.splitlines():
+        line = raw.strip()
+        if (transcript or prompted) and not pending:
+            if not line.startswith("$ "):
+                continue  # Output shown in a transcript, not a command
+            line = line[2:].strip()
+        if not pending and (not line or line.startswith("#")):
+            continue
+        if line.endswith("\\"):
+            pending += line[:-1].rstrip() + " "
+            continue
+        commands.append((pending + line).strip())
+        pending = ""
+    if pending.strip():
+        commands.append(pending.strip())
+    return commands
+
+
+def block_actions(block: Dict[str, Any], lines: List[str]) -> List[Dict[str, Any]]:
+    """Actions for one fenced block from iter_fences; lines are the response lines up to the block"""
+    info, body = block["info"], block["body"]
+    language = info.split()[0].lower() if info else ""
+    preceding = lines[max(0, block["start"] - PATH_LOOKBACK_LINES):block["start"]]
+    path = _block_path(info, body, preceding)
+    source = block["start"] + 1
+
+    if language in DIFF_LANGUAGES or (path is None and body.lstrip().startswith(("--- ", "diff --git"))):
+        actions = []
+        for diff_path, kind, diff in split_diff(body):
+            target = diff_path or path
+            if target is None:
+                continue
+            if kind == "create":
+                actions.append({"type": "write", "path": _clean_path(target),
+                                "content": _new_file_from_diff(diff), "line": source})
+            elif kind == "delete":
+                actions.append({"type": "delete", "path": _clean_path(target), "line": source})
+            else:
+                actions.append({"type": "edit", "path": _clean_path(target), "content": diff, "line": source})
+        return actions
+    if path is None:
+        if language in SHELL_LANGUAGES:
+            return [{"type": "command", "command": c, "line": source} for c in _shell_commands(body, info)]
+        return []
+    kind = "edit" if looks_like_edit(body) else "write"
+    return [{"type": kind, "path": path, "content": body if kind == "edit" else body + "\n", "line": source}]
+
+
+def delete_action(line: str, number: int) -> Optional[Dict[str, Any]]:
+    """A delete action for a "DELETE: path" line outside any fence"""
+    match = DELETE_LINE.match(line)
+    return {"type": "delete", "path": _clean_path(match.group("path")), "line": number + 1} if match else None
+
+
+def extract_actions(response: str) -> List[Dict[str, Any]]:
+    """Turn a model response into typed actions in the order they appear
+
+    Action types: "write" (full content), "edit" (search/replace or diff),
+    "delete" and "command". Fenced blocks that name no file and are not shell or
+    diff blocks are treated as illustrations and ignored.
+    """
+    actions: List[Dict[str, Any]] = []
+    lines = response.splitlines()
+    covered = set()
+    for block in iter_fences(response):
+        covered.update(range(block["start"], block["end"] + 1))
+        actions.extend(block_actions(block, lines))
+    for number, line in enumerate(lines):
+        if number not in covered:
+            action = delete_action(line, number)
+            if action:
+                actions.append(action)
+    actions.sort(key=lambda a: a["line"])
+    return actions[:MAX_PLAN_ACTIONS]
+
+
+class ActionPlan:
+    """A batch of extracted actions, resolved against the project and applied together"""
+
+    def __init__(self, project_dir: Path, actions: List[Dict[str, Any]]):
+        self.project_dir = Path(project_dir).resolve()
+        self.actions = actions
+        self.created_at = datetime.now().isoformat()
+
+    @classmethod
+    def from_dict(cls, project_dir: Path, data: Dict[str, Any]) -> "ActionPlan":
+        """Rebuild a prepared plan saved with to_dict, keeping its before-contents for the staleness check"""
+        plan = cls(project_dir, data["actions"])
+        plan.created_at = data.get("created_at", plan.created_at)
+        return plan
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"created_at": self.created_at, "actions": self.actions}
+
+    def _target(self, rel: str) -> Optional[Path]:
+        """Resolve a project-relative path, refusing anything outside the project or in tool directories"""
+        if not rel or Path(rel).is_absolute():
+            return None
+        target = (self.project_dir / rel).resolve()
+        if self.project_dir not in target.parents:
+            return None
+        parts = target.relative_to(self.project_dir).parts
+        if any(part in IGNORED_DIRS or part == ULCA_CACHE_DIR for part in parts[:-1]):
+            return None
+        return target
+
+    def prepare(self):
+        """Compute each file action's before/after content; later edits build on earlier ones"""
+        staged: Dict[str, Optional[str]] = {}  # rel -> content after earlier actions (None = deleted)
+        for action in self.actions:
+            action.pop("error", None)
+            if action["type"] == "command":
+                action["operation"] = "run"
+                continue
+            target = self._target(action["path"])
+            if target is None:
+                action["operation"], action["error"] = action["type"], "path is outside the project"
+                continue
+            rel = action["path"]
+            if rel in staged:
+                current = staged[rel]
+            elif target.is_file():
+                try:
+                    current = target.read_text(encoding='utf-8')
+                except (OSError, UnicodeDecodeError) as e:
+                    action["operation"], action["error"] = action["type"], f"cannot read file: {e}"
+                    continue
+            else:
+                current = None
+            action["before"] = current
+
+            if action["type"] == "delete":
+                action["operation"] = "delete"
+                if current is None:
+                    action["error"] = "file does not exist"
+                    continue
+                action["after"] = None
+            elif action["type"] == "edit":
+                action["operation"] = "edit"
+                if current is None:
+                    action["error"] = "file does not exist; send its full content to create it"
+                    continue
+                try:
+                    action["after"], action["notes"] = apply_edit(rel, current, action["content"])
+                except EditConflict as e:
+                    action["error"] = str(e)
+                    continue
+            else:
+                action["operation"] = "create" if current is None else "modify"
+                if current == action["content"]:
+                    action["error"] = "content is unchanged"
+                    continue
+                action["after"] = action["content"]
+            staged[rel] = action["after"]
+
+    @property
+    def runnable(self) -> List[Dict[str, Any]]:
+        return [a for a in self.actions if "error" not in a]
+
+    def summary(self) -> str:
+        """One line per action, with line counts for file changes and the reason for rejected ones"""
+        rows = []
+        icons = {"create": "🆕", "modify": "✏️ ", "edit": "🩹", "delete": "🗑️ ", "run": "▶️ "}
+        for number, action in enumerate(self.actions, 1):
+            operation = action.get("operation", action["type"])
+            if operation == "run":
+                label = f"run: {action['command']}"
+            else:
+                label = f"{operation} {action['path']}"
+                before = (action.get("before") or "").splitlines()
+                after = (action.get("after") or "").splitlines()
+                if "error" not in action and operation != "delete":
+                    label += f" ({len(after)} lines" + (f", was {len(before)}" if action.get("before") else "") + ")"
+            if "error" in action:
+                label += f"  ⚠️  skipped: {action['error']}"
+            rows.append(f"{number:>3}. {icons.get(operation, '•')} {label}")
+        return "\n".join(rows)
+
+    def apply(self, run_command: RunCommand, record: Optional[PlanRecorder] = None) -> List[Dict[str, Any]]:
+        """Apply runnable actions in order, stopping at the first failure; returns one record per action"""
+        results: List[Dict[str, Any]] = []
+        for action in self.actions:
+            entry = self._apply_action(action, results)
+            if entry is None:
+                result, _ = run_command(action["command"])
+                entry = self._command_entry(action, result)
+            results.append(entry)
+            if record:
+                record(entry)
+        return results
+
+    async def aapply(self, run_command: AsyncRunCommand, record: Optional[PlanRecorder] = None) -> List[Dict[str, Any]]:
+        """apply() for event-loop callers: commands are awaited, file writes are quick and stay inline"""
+        results: List[Dict[str, Any]] = []
+        for action in self.actions:
+            entry = self._apply_action(action, results)
+            if entry is None:
+                result, _ = await run_command(action["command"])
+                entry = self._command_entry(action, result)
+            results.append(entry)
+            if record:
+                record(entry)
+        return results
+
+    def _entry(self, action: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "operation": action.get("operation", action["type"]),
+            "target": action.get("path") or action.get("command"),
+            "plan_created_at": self.created_at
+        }
+
+    def _apply_action(self, action: Dict[str, Any], results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Record for a rejected, skipped or file action; None means a command that still has to run"""
+        entry = self._entry(action)
+        if "error" in action:
+            entry.update(status="rejected", detail=action["error"])
+        elif any(earlier["status"] == "failed" for earlier in results):
+            entry.update(status="skipped", detail="an earlier action failed")
+        elif action["operation"] == "run":
+            return None
+        else:
+            error = self._apply_file(action)
+            entry.update(status="failed" if error else "applied", detail=error or "; ".join(action.get("notes", [])))
+        return entry
+
+    def _command_entry(self, action: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        entry = self._entry(action)
+        entry.update(status="applied" if result["returncode"] == 0 else "failed",
+                     returncode=result["returncode"], duration=round(result.get("duration", 0.0), 3))
+        return entry
+
+    def _apply_file(self, action: Dict[str, Any]) -> Optional[str]:
+        """Write or delete one file; refuses if it changed since the plan was prepared"""
+        target = self._target(action["path"])
+        try:
+            current = target.read_text(encoding='utf-8') if target.is_file() else None
+        except (OSError, UnicodeDecodeError) as e:
+            return f"cannot read file: {e}"
+        # Chained actions on one path expect exactly what the previous action wrote
+        if current != action["before"]:
+            return "file changed since the plan was made"
+        try:
+            if action["after"] is None:
+                target.unlink()
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_text(action["after"], encoding='utf-8')
+        except OSError as e:
+            return str(e)
+        return None
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Test Impact Selection for ULCA
+Maps changed files to the pytest tests that import or exercise them, using the
+symbol index's import graph plus optional per-test coverage, and runs the
+selection sharded across worker processes.
+"""
+
+import os
+import shlex
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from command_runner import OutputCallback, StreamingExecutor
+from symbol_index import SymbolIndex
+
+# Configuration
+# The first Python on PATH, so an activated virtualenv wins; some systems only have python3
+PYTHON_COMMAND = next((name for name in ("python", "python3") if shutil.which(name)), sys.executable)
+PYTEST_COMMAND = f"{shlex.quote(PYTHON_COMMAND)} -m pytest -q"
+TEST_FILE_PATTERNS = ("test_*.py", "*_test.py")
+# Changes to these can affect any test, so they always select the full suite
+FULL_SUITE_TRIGGERS = ("conftest.py", "pytest.ini", "pyproject.toml", "setup.cfg", "tox.ini",
+                       "requirements*.txt", ".coveragerc")
+COVERAGE_FILE = ".coverage"  # Written by `pytest --cov --cov-context=test`
+MAX_SHARDS = max(1, os.cpu_count() or 1)
+
+
+def is_test_file(rel: str) -> bool:
+    name = Path(rel).name
+    return any(fnmatch(name, pattern) for pattern in TEST_FILE_PATTERNS)
+
+
+def load_coverage_map(project_dir: Path, coverage_file: Path) -> Dict[str, Set[str]]:
+    """Read a coverage.py database recorded with test contexts: source file -> pytest node IDs"""
+    source_tests: Dict[str, Set[str]] = {}
+    try:
+        connection = sqlite3.connect(f"file:{coverage_file}?mode=ro", uri=True)
+    except sqlite3.Error:
+        return source_tests
+    try:
+        rows = connection.execute(
+            "SELECT DISTINCT file.path, context.context FROM line_bits "
+            "JOIN file ON file.id = line_bits.file_id JOIN context ON context.id = line_bits.context_id "
+            "UNION SELECT DISTINCT file.path, context.context FROM arc "
+            "JOIN file ON file.id = arc.file_id JOIN context ON context.id = arc.context_id"
+        ).fetchall()
+    except sqlite3.Error:
+        rows = []
+    finally:
+        connection.close()
+
+    for path, context in rows:
+        node = context.split("|")[0]  # pytest-cov appends |setup, |run or |teardown
+        if "::" not in node:
+            continue
+        try:
+            rel = Path(path).resolve().relative_to(project_dir).as_posix()
+        except ValueError:
+            continue  # Library code outside the project
+        source_tests.setdefault(rel, set()).add(node)
+    return source_tests
+
+
+class AffectedTestSelector:
+    """Chooses the tests affected by a set of changed files"""
+
+    def __init__(self, project_dir: Path, symbol_index: SymbolIndex, coverage_file: Optional[Path] = None):
+        self.project_dir = Path(project_dir).resolve()
+        self.symbol_index = symbol_index
+        self.coverage_file = Path(coverage_file) if coverage_file else self.project_dir / COVERAGE_FILE
+        self._coverage: Optional[Dict[str, Set[str]]] = None
+        self._coverage_mtime: Optional[float] = None
+
+    def coverage_map(self) -> Dict[str, Set[str]]:
+        """Per-test coverage, reloaded whenever the coverage file changes"""
+        try:
+            mtime = self.coverage_file.stat().st_mtime
+        except OSError:
+            return {}
+        if self._coverage is None or mtime != self._coverage_mtime:
+            self._coverage = load_coverage_map(self.project_dir, self.coverage_file)
+            self._coverage_mtime = mtime
+        return self._coverage
+
+    def test_files(self) -> List[str]:
+        return sorted(rel for rel in self.symbol_index.files if is_test_file(rel))
+
+    def _importing_tests(self, rel: str) -> Set[str]:
+        """Test files that import rel directly or through other project modules"""
+        tests, seen, queue = set(), {rel}, deque([rel])
+        while queue:
+            current = queue.popleft()
+            for importer in self.symbol_index.importers_of(current):
+                if importer in seen:
+                    continue
+                seen.add(importer)
+                if is_test_file(importer):
+                    tests.add(importer)
+                queue.append(importer)
+        return tests
+
+    def select(self, changed: Iterable[str]) -> Dict[str, Any]:
+        """Return the minimal node list for the changes, or a full-suite fallback with its reason"""
+        changed = sorted(set(changed))
+        coverage = self.coverage_map()
+        files: Set[str] = set()
+        nodes: Set[str] = set()
+        unmapped: List[str] = []
+
+        def full_suite(reason: str) -> Dict[str, Any]:
+            return {"full_suite": True, "reason": reason, "nodes": [], "changed": changed,
+                    "test_files": self.test_files()}
+
+        for rel in changed:
+            name = Path(rel).name
+            if any(fnmatch(name, pattern) for pattern in FULL_SUITE_TRIGGERS):
+                return full_suite(f"{rel} affects every test")
+            if not rel.endswith(".py"):
+                if any(is_test_file(t) and Path(t).parent in Path(rel).parents for t in self.test_files()):
+                    return full_suite(f"{rel} is test data with unknown users")
+                continue  # Not Python and not next to tests: pytest does not read it
+            if is_test_file(rel):
+                if (self.project_dir / rel).exists():
+                    files.add(rel)
+                continue
+            if rel not in self.symbol_index.files:
+                if (self.project_dir / rel).exists():
+                    return full_suite(f"{rel} is not in the symbol index yet")
+                continue  # Deleted module: its importers show up as changed or failing on import
+            importing = self._importing_tests(rel)
+            covered = coverage.get(rel, set())
+            if importing or covered:
+                files |= importing
+                nodes |= covered
+            elif not coverage:
+                unmapped.append(rel)
+
+        if unmapped:
+            return full_suite(f"no test imports {', '.join(unmapped[:3])} and no coverage data is recorded")
+        # A whole test file already covers its own nodes
+        nodes = {n for n in nodes if n.split("::")[0] not in files}
+        return {"full_suite": False, "reason": "import graph" + (" + coverage" if coverage else ""),
+                "nodes": sorted(files) + sorted(nodes), "changed": changed, "test_files": sorted(files)}
+
+
+def shard_nodes(nodes: List[str], shards: int) -> List[List[str]]:
+    """Split nodes into balanced shards, keeping nodes of one file together"""
+    by_file: Dict[str, List[str]] = {}
+    for node in nodes:
+        by_file.setdefault(node.split("::")[0], []).append(node)
+    buckets: List[List[str]] = [[] for _ in range(max(1, min(shards, len(by_file))))]
+    for group in sorted(by_file.values(), key=len, reverse=True):
+        min(buckets, key=len).extend(group)
+    return [bucket for bucket in buckets if bucket]
+
+
+def run_sharded(executor: StreamingExecutor, nodes: List[str], pytest_command: str = PYTEST_COMMAND,
+                shards: int = MAX_SHARDS, on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
+    """Run pytest over nodes in parallel worker processes and merge the results"""
+    started = time.monotonic()
+    groups = shard_nodes(nodes, shards) if nodes else [[]]
+    lock = threading.Lock()
+
+    def run_shard(index: int, group: List[str]) -> Dict[str, Any]:
+        prefix = f"[shard {index + 1}/{len(groups)}] " if len(groups) > 1 else ""
+
+        def forward(stream: str, line: str):
+            if on_output:
+                with lock:
+                    on_output(stream, prefix + line)
+
+        command = " ".join([pytest_command] + [shlex.quote(node) for node in group])
+        return executor.run(command, on_output=forward)
+
+    with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="ulca-pytest") as pool:
+        results = list(pool.map(run_shard, range(len(groups)), groups))
+
+    failures = [r["returncode"] for r in results if r["returncode"] not in (0, 5)]
+    if failures:
+        returncode = failures[0]
+    else:
+        # pytest exits 5 when it collects nothing; that only matters if no shard ran anything
+        returncode = 5 if all(r["returncode"] == 5 for r in results) else 0
+    cpu_times = [r["cpu_time"] for r in results if r.get("cpu_time") is not None]
+    return {
+        "returncode": returncode,
+        "cpu_time": sum(cpu_times) if cpu_times else None,
+        "max_rss_kb": max((r["max_rss_kb"] or 0 for r in results), default=None),
+        "stdout": "\n".join(r["stdout"] for r in results),
+        "stderr": "\n".join(r["stderr"] for r in results if r["stderr"]),
+        "duration": time.monotonic() - started,
+        "timed_out": any(r["timed_out"] for r in results),
+        "log_path": next((r["log_path"] for r in results if r["returncode"] not in (0, 5)), results[0]["log_path"]),
+        "shards": len(groups)
+    }
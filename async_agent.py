@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Asyncio Agent API for ULCA
+AsyncULCAgent runs a turn on an event loop: LLM replies stream over asyncio
+sockets, commands run as asyncio subprocesses and context writes happen off the
+loop, so one thread can drive many conversations. The blocking ULCAgent API is
+inherited unchanged; EventLoopThread lets blocking front ends (the GUI) share one loop.
+"""
+
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from action_plan import ActionPlan
+from llm_scheduler import CONFIRMATION, INTERACTIVE, PREEMPTIBLE, LLMPreempted, LLMTicket
+from log_distiller import LogDistiller
+from response_stream import StreamingResponseParser
+from structured_output import RESPONSE_SCHEMA
+from universal_claude_agent import APPROVE_ANSWERS, LLM_ERROR_REPLY, MAX_RETRIES, REQUEST_TIMEOUT, ULCAgent
+
+# Configuration
+HTTP_CHUNK_BYTES = 65536
+
+
+class OllamaHTTPError(Exception):
+    """Ollama answered with an HTTP error status"""
+
+
+class AsyncHTTPResponse:
+    """Status, headers and an incrementally read body of one HTTP/1.1 response"""
+
+    def __init__(self, status: int, headers: Dict[str, str], reader: asyncio.StreamReader, timeout: float):
+        self.status = status
+        self.headers = headers
+        self.reader = reader
+        self.timeout = timeout
+
+    async def _read(self, call: Coroutine) -> bytes:
+        return await asyncio.wait_for(call, self.timeout)
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Body pieces as they arrive, for chunked, sized and read-to-EOF bodies"""
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self._read(self.reader.readline())).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    while (await self._read(self.reader.readline())).strip():
+                        pass  # Trailer headers
+                    return
+                yield await self._read(self.reader.readexactly(size))
+                await self._read(self.reader.readline())
+        elif "content-length" in self.headers:
+            remaining = int(self.headers["content-length"])
+            while remaining > 0:
+                data = await self._read(self.reader.read(min(remaining, HTTP_CHUNK_BYTES)))
+                if not data:
+                    raise asyncio.IncompleteReadError(data, remaining)
+                remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await self._read(self.reader.read(HTTP_CHUNK_BYTES))
+                if not data:
+                    return
+                yield data
+
+    async def lines(self) -> AsyncIterator[bytes]:
+        """Non-empty body lines: Ollama streams one JSON object per line"""
+        buffer = b""
+        async for chunk in self.chunks():
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self.chunks()])
+
+
+class AsyncOllamaClient:
+    """Minimal HTTP/1.1 client for the local Ollama API on asyncio streams, with no extra dependency"""
+
+    def __init__(self, url: str, timeout: float = REQUEST_TIMEOUT):
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError(f"AsyncOllamaClient only speaks plain http to a local server, not {parts.scheme}")
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+        self.path = parts.path or "/"
+        self.timeout = timeout
+
+    @asynccontextmanager
+    async def post(self, payload: Dict[str, Any]) -> AsyncIterator[AsyncHTTPResponse]:
+        """POST JSON and yield the response once its headers are in; the connection closes on exit"""
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            body = json.dumps(payload).encode("utf-8")
+            writer.write((f"POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                          f"Connection: close\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if not status_line:
+                raise ConnectionError("server closed the connection without a response")
+            headers: Dict[str, str] = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if not line.strip():
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            yield AsyncHTTPResponse(int(status_line.split()[1]), headers, reader, self.timeout)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
+
+
+class AsyncULCAgent(ULCAgent):
+    """ULCAgent with coroutine versions of a conversation turn and of confirmation handling"""
+
+    def __init__(self, project_dir: str):
+        super().__init__(project_dir)
+        self._turn_lock = asyncio.Lock()  # One turn at a time per conversation; other agents are unaffected
+        self._save_requested = False
+        self._save_task: Optional[asyncio.Task] = None
+
+    def _save_context(self, context: Optional[Dict[str, Any]] = None):
+        """On the event loop, write the context from a worker thread, coalescing saves requested meanwhile"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or context is not None:
+            return super()._save_context(context)
+        self._save_requested = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._flush_context())
+
+    async def _flush_context(self):
+        while self._save_requested:
+            self._save_requested = False
+            await asyncio.to_thread(ULCAgent._save_context, self)
+
+    async def asave_context(self):
+        """Wait until every context change made so far is on disk"""
+        self._save_context()
+        if self._save_task is not None:
+            await self._save_task
+
+    async def aclose(self):
+        """Flush the context and stop background jobs and the persistent shell"""
+        await self.asave_context()
+        await asyncio.to_thread(self.jobs.shutdown)
+        await asyncio.to_thread(self._set_persistent_shell, False)
+
+    async def _acall_llm(self, prompt: str, num_predict: int = 2000, quiet: bool = False,
+                         response_format: Optional[Dict[str, Any]] = None,
+                         on_chunk: Optional[Callable[[str], None]] = None,
+                         llm_session: Optional[Dict[str, Any]] = None, priority: str = INTERACTIVE) -> str:
+        """_call_llm on the event loop; the reply is always streamed and handed to on_chunk as it arrives"""
+        payload = self._llm_payload(prompt, num_predict, True, response_format, llm_session)
+        while True:
+            try:
+                return await self._apost_llm(payload, quiet, on_chunk, llm_session, priority)
+            except LLMPreempted:
+                if not quiet:
+                    print("⏸️  Gave the model to an interactive request; queued again")
+
+    async def _apost_llm(self, payload: Dict[str, Any], quiet: bool, on_chunk: Optional[Callable[[str], None]],
+                         llm_session: Optional[Dict[str, Any]], priority: str) -> str:
+        # Replies already passed to on_chunk cannot be taken back, so only calls without one can be preempted
+        preemptible = on_chunk is None and priority in PREEMPTIBLE
+        tried: Set[str] = set()
+        for attempt in range(MAX_RETRIES):
+            pieces: List[str] = []
+            usage: Dict[str, Any] = {}
+            try:
+                if not quiet:
+                    print(f"🔄 Attempting LLM call (attempt {attempt + 1}/{MAX_RETRIES})...")
+                async with self._generate(payload, priority, tried, usage) as (ticket, response):
+                    if "format" in payload and response.status == 400:
+                        # Older Ollama versions reject schema formats; retrying will not help
+                        body = (await response.read()).decode("utf-8", errors="replace")
+                        return f"Error: LLM rejected the response format: {body[:200]}"
+                    if response.status >= 400:
+                        raise OllamaHTTPError(f"HTTP {response.status}: {(await response.read())[:200]!r}")
+                    async for raw in response.lines():
+                        if preemptible and ticket.preempted:
+                            raise LLMPreempted()  # Leaving the block closes the connection
+                        data = json.loads(raw)
+                        if "error" in data:
+                            return f"Error: LLM reported an error: {data['error']}"
+                        piece = data.get("response", "")
+                        if piece:
+                            pieces.append(piece)
+                            if on_chunk:
+                                on_chunk(piece)
+                        if data.get("done"):
+                            if llm_session is not None:
+                                llm_session["context"] = data.get("context")
+                            usage["eval_count"] = data.get("eval_count", len(pieces))
+                            break
+                return "".join(pieces).strip()
+            except LLMPreempted:
+                raise
+            except asyncio.TimeoutError:
+                if pieces:
+                    return f"Error: LLM stream interrupted after {len(pieces)} chunks: timed out"
+                if attempt < MAX_RETRIES - 1:
+                    print(f"⏰ Timeout on attempt {attempt + 1}/{MAX_RETRIES}. Retrying...")
+                    await asyncio.sleep(self._retry_delay(5, tried))
+                else:
+                    return f"Error: LLM request timed out after {MAX_RETRIES} attempts. The model might be busy or too slow."
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                if pieces:
+                    return f"Error: LLM stream interrupted after {len(pieces)} chunks: {e}"
+                if attempt < MAX_RETRIES - 1:
+                    print(f"🔌 Connection error on attempt {attempt + 1}/{MAX_RETRIES}. Retrying...")
+                    await asyncio.sleep(self._retry_delay(2 ** attempt, tried))
+                else:
+                    return f"Error: Failed to connect to LLM after {MAX_RETRIES} attempts. Check if Ollama is running."
+            except (OllamaHTTPError, ValueError) as e:
+                if pieces:
+                    return f"Error: LLM stream interrupted after {len(pieces)} chunks: {e}"
+                if attempt < MAX_RETRIES - 1:
+                    print(f"⚠️  API call failed (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
+                    await asyncio.sleep(self._retry_delay(2 ** attempt, tried))
+                else:
+                    return f"Error: Failed to communicate with LLM after {MAX_RETRIES} attempts: {e}"
+        return "Error: Failed to get response from LLM"
+
+    @asynccontextmanager
+    async def _generate(self, payload: Dict[str, Any], priority: str, tried: Set[str],
+                        usage: Dict[str, Any]) -> AsyncIterator[Tuple[LLMTicket, AsyncHTTPResponse]]:
+        """A scheduler slot, a routed endpoint and its open response for one attempt"""
+        async with self.llm_scheduler.aslot(str(self.project_dir), priority) as ticket:
+            with self.llm_pool.request(payload["model"], str(self.project_dir), tried, usage) as endpoint:
+                async with AsyncOllamaClient(endpoint.generate_url).post(payload) as response:
+                    yield ticket, response
+
+    async def _arun_streamed(self, command: str) -> Tuple[Dict[str, Any], LogDistiller]:
+        """_run_streamed as an asyncio subprocess; the pty shell is blocking, so it runs in a worker thread"""
+        # The cache key hashes the files the tool reads
+        on_output, distiller, cache_key, result = await asyncio.to_thread(self._start_command, command)
+        if result is None:
+            if self.shell is not None:
+                result = await asyncio.to_thread(self.shell.run, command, on_output=on_output)
+            else:
+                result = await self.executor.arun(command, on_output=on_output)
+            await asyncio.to_thread(self._finish_command, command, result, cache_key)
+        self._record_command_outcome(command, result, distiller)
+        return result, distiller
+
+    async def aprocess_user_input(self, user_input: str) -> str:
+        """process_user_input as a coroutine"""
+        async with self._turn_lock:
+            self.file_digests.pause()
+            try:
+                return await self._aprocess_user_input(user_input)
+            finally:
+                self.file_digests.resume()
+
+    async def _aprocess_user_input(self, user_input: str) -> str:
+        print(f"\n🤔 Processing: {user_input}")
+        parsed = None
+        session: Dict[str, Any] = {}
+        if self.context.get('llm_config', {}).get('structured_output', False):
+            print("🧠 Consulting Claude (structured)...")
+            # Prompt building runs git and may build indexes on first use
+            prompt = await asyncio.to_thread(self._build_system_prompt, user_input, True)
+            reply = await self._acall_llm(prompt, response_format=RESPONSE_SCHEMA, llm_session=session)
+            parsed = self._structured_result(reply)
+
+        if parsed is None:
+            system_prompt = await asyncio.to_thread(self._build_system_prompt, user_input)
+            print("🧠 Consulting Claude...")
+            parser = StreamingResponseParser(self._on_stream_event)
+            llm_response = await self._acall_llm(system_prompt, on_chunk=self._reply_chunk_handler(parser),
+                                                 llm_session=session)
+            if llm_response.startswith("Error:"):
+                print(f"❌ {llm_response}")
+                return LLM_ERROR_REPLY
+            # TODOs were recorded as they streamed
+            parsed = (llm_response, parser.actions, [], *parser.result()[3:])
+        # Preparing the plan reads files and saving the context writes one; other projects share this loop
+        return await asyncio.to_thread(self._handle_parsed_response, user_input, parsed, session)
+
+    async def ahandle_confirmation_response(self, user_input: str) -> str:
+        """_handle_confirmation_response as a coroutine; approval applies the plan or resumes the reply"""
+        async with self._turn_lock:
+            if not (self.confirmation_mode and user_input.lower().strip() in APPROVE_ANSWERS):
+                return self._handle_confirmation_response(user_input)  # Declining involves no I/O wait
+            print("✅ Confirmation received: PROCEEDING with action")
+            pending = self.context.get("pending_confirmation") or {}
+            plan = self.pending_plan if self.pending_action == "action_plan" else None
+            self._clear_pending_confirmation()
+            if plan:
+                return await self._aapply_plan(plan)
+            return await self._acontinue_after_confirmation(user_input, pending)
+
+    async def _aapply_plan(self, plan: ActionPlan) -> str:
+        self.file_digests.pause()
+        try:
+            results = await plan.aapply(self._arun_streamed, self._record_file_operation)
+        finally:
+            self.file_digests.resume()
+        return await asyncio.to_thread(self._summarize_plan, results)
+
+    async def _acontinue_after_confirmation(self, answer: str, pending: Dict[str, Any]) -> str:
+        prompt, session = await asyncio.to_thread(self._continuation_prompt, answer, pending)
+        print("🧠 Continuing Claude's plan...")
+        parser = StreamingResponseParser(self._on_stream_event)
+        self.file_digests.pause()
+        try:
+            reply = await self._acall_llm(prompt, on_chunk=self._reply_chunk_handler(parser), llm_session=session,
+                                          priority=CONFIRMATION)
+        finally:
+            self.file_digests.resume()
+        return await asyncio.to_thread(self._continuation_result, answer, reply, parser, session)
+
+
+class EventLoopThread:
+    """One event loop on a daemon thread, shared by all agents of a blocking front end"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="ulca-event-loop", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        """Schedule a coroutine from any thread; the returned future completes on the loop thread"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Block until a coroutine finishes on the loop"""
+        return self.submit(coroutine).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Build-Fix Loop for ULCA
+Runs a build, distils its errors, asks the model for corrected files, applies
+them with confirmation and re-runs only the failing targets until the build
+passes, stops making progress or the iteration limit is reached.
+"""
+
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from action_plan import iter_fences
+from file_edits import looks_like_edit
+from log_distiller import LogDistiller
+from project_files import IGNORED_DIRS, read_text, relative_path
+
+# Configuration
+FIX_MAX_ITERATIONS = 5
+FIX_NO_PROGRESS_LIMIT = 2  # Consecutive attempts with unchanged errors before giving up
+MAX_FIX_FILES = 4
+MAX_FIX_FILE_CHARS = 12000  # Larger files are shown as an excerpt; they can only be edited
+FIX_EXCERPT_LINES = 40
+
+FIX_PROMPT = """You are fixing a failing build in the project at {project_dir}.
+
+COMMAND: {command}
+
+DISTILLED ERRORS:
+{report}
+{history}
+SOURCE FILES:
+{files}
+
+Reply with a one-paragraph diagnosis, then your changes. For every file you change output:
+FILE: <relative path>
+```
+<<<<<<< SEARCH
+<exact lines from the file, with enough context to be unique>
+=======
+<replacement lines>
+>>>>>>> REPLACE
+```
+A FILE block may hold several SEARCH/REPLACE pairs. Only send complete file content (instead of
+SEARCH/REPLACE) to create a new file. Do not change tests unless the test itself is wrong.
+"""
+
+FILE_LINE = re.compile(r'^FILE:\s*`?(?P<path>[^\s`]+)`?\s*$')  # Directly above the fenced content
+
+RunCommand = Callable[[str], Tuple[Dict[str, Any], LogDistiller]]
+AskModel = Callable[[str], str]
+ApplyFile = Callable[[str, str], bool]
+AttemptRecorder = Callable[[Dict[str, Any]], None]
+RelatedFiles = Callable[[str], List[str]]
+AffectedCommand = Callable[[str, List[str]], Optional[str]]
+
+
+class BuildFixer:
+    """Drives the build -> distil -> patch -> targeted re-run loop"""
+
+    def __init__(self, project_dir: Path, run_command: RunCommand, ask_model: AskModel,
+                 apply_file: ApplyFile, record_attempt: Optional[AttemptRecorder] = None,
+                 related_files: Optional[RelatedFiles] = None, affected_command: Optional[AffectedCommand] = None,
+                 max_iterations: int = FIX_MAX_ITERATIONS):
+        self.project_dir = Path(project_dir).resolve()
+        self.run_command = run_command
+        self.ask_model = ask_model
+        self.apply_file = apply_file
+        self.record_attempt = record_attempt
+        self.related_files = related_files
+        self.affected_command = affected_command
+        self.max_iterations = max_iterations
+
+    def run(self, command: str) -> Dict[str, Any]:
+        """Fix the build; returns the outcome with per-attempt timings"""
+        session = datetime.now().strftime("%Y%m%d-%H%M%S")
+        started = time.monotonic()
+        attempts: List[Dict[str, Any]] = []
+        files_changed: List[str] = []
+        history: List[str] = []
+
+        result, distiller = self._run(session, 0, "build", command, attempts)
+        if result["returncode"] == 0:
+            return self._outcome("passed", command, attempts, files_changed, started)
+        signature, stale = distiller.error_signature(), 0
+
+        status = "max_iterations"
+        for iteration in range(1, self.max_iterations + 1):
+            print(f"🔧 Fix attempt {iteration}/{self.max_iterations}: {len(signature)} error block(s)")
+            files, editable = self._source_files(distiller)
+            prompt = FIX_PROMPT.format(
+                project_dir=self.project_dir,
+                command=distiller.command,
+                report=distiller.render(returncode=result["returncode"], log_path=result.get("log_path")),
+                history="\nPREVIOUS ATTEMPTS:\n" + "\n".join(history) + "\n" if history else "",
+                files=files or "(no project files referenced by the errors)"
+            )
+            llm_started = time.monotonic()
+            response = self.ask_model(prompt)
+            llm_seconds = time.monotonic() - llm_started
+            if response.startswith("Error:"):
+                status = "llm_error"
+                break
+
+            patches = self.parse_patches(response, editable)
+            if not patches:
+                status = "no_patch"
+                break
+            changed = [path for path, content in patches if self.apply_file(path, content)]
+            if not changed:
+                status = "rejected"
+                break
+            files_changed.extend(p for p in changed if p not in files_changed)
+
+            # Re-run only the failing targets first; confirm with the full build once they pass
+            rerun = distiller.narrow_command(self.project_dir)
+            if not rerun and self.affected_command:
+                rerun = self.affected_command(command, files_changed)
+            rerun = rerun or command
+            phase = "targeted" if rerun != command else "build"
+            result, new_distiller = self._run(session, iteration, phase, rerun, attempts,
+                                              changed=changed, llm_seconds=llm_seconds)
+            if result["returncode"] == 0 and rerun != command:
+                result, new_distiller = self._run(session, iteration, "verify", command, attempts)
+            if result["returncode"] == 0:
+                status = "passed"
+                break
+
+            new_signature = new_distiller.error_signature()
+            if new_signature == signature or new_signature > signature:
+                stale += 1
+            else:
+                stale = 0
+            history.append(f"- Attempt {iteration} changed {', '.join(changed)}; "
+                           f"{len(new_signature)} error block(s) remain")
+            if stale >= FIX_NO_PROGRESS_LIMIT:
+                status = "no_progress"
+                break
+            signature, distiller = new_signature, new_distiller
+
+        return self._outcome(status, command, attempts, files_changed, started)
+
+    def _run(self, session: str, iteration: int, phase: str, command: str, attempts: List[Dict[str, Any]],
+             changed: Optional[List[str]] = None, llm_seconds: Optional[float] = None):
+        started_at = datetime.now().isoformat()
+        result, distiller = self.run_command(command)
+        attempt = {
+            "fix_session": session,
+            "iteration": iteration,
+            "phase": phase,
+            "command": command,
+            "started_at": started_at,
+            "returncode": result["returncode"],
+            "wall_time": round(result.get("duration", 0.0), 3),
+            "cpu_time": round(result["cpu_time"], 3) if result.get("cpu_time") is not None else None,
+            "max_rss_kb": result.get("max_rss_kb"),
+            "error_blocks": len(distiller.error_signature()),
+            "files_changed": changed or [],
+            "llm_seconds": round(llm_seconds, 3) if llm_seconds is not None else None,
+            "log_path": result.get("log_path")
+        }
+        attempts.append(attempt)
+        if self.record_attempt:
+            self.record_attempt(attempt)
+        return result, distiller
+
+    def _outcome(self, status: str, command: str, attempts: List[Dict[str, Any]],
+                 files_changed: List[str], started: float) -> Dict[str, Any]:
+        return {
+            "status": status,
+            "command": command,
+            "iterations": max((a["iteration"] for a in attempts), default=0),
+            "attempts": attempts,
+            "files_changed": files_changed,
+            "duration": time.monotonic() - started
+        }
+
+    def _source_files(self, distiller: LogDistiller) -> Tuple[str, set]:
+        """Render the files referenced by the errors; returns (text, paths the model may rewrite)"""
+        lines_by_file: Dict[str, List[int]] = {}
+        for location in distiller.locations:
+            path, _, line = location.rpartition(":")
+            rel = self._project_relative(path)
+            if rel:
+                lines_by_file.setdefault(rel, []).append(int(line))
+        if self.related_files:
+            # Tests often fail far from the bug: add the project modules they import
+            for rel in list(lines_by_file):
+                for imported in self.related_files(rel):
+                    lines_by_file.setdefault(imported, [1])
+
+        sections, editable = [], set()
+        for rel, line_numbers in list(lines_by_file.items())[:MAX_FIX_FILES]:
+            content = read_text(self.project_dir / rel)
+            if content is None:
+                continue
+            if len(content) <= MAX_FIX_FILE_CHARS:
+                editable.add(rel)
+                sections.append(f"FILE: {rel}\n```\n{content}\n```")
+                continue
+            lines = content.splitlines()
+            first = max(0, min(line_numbers) - FIX_EXCERPT_LINES // 2 - 1)
+            last = min(len(lines), max(line_numbers) + FIX_EXCERPT_LINES // 2)
+            excerpt = "\n".join(f"{n + 1:5d}  {lines[n]}" for n in range(first, last))
+            sections.append(f"{rel} (excerpt, lines {first + 1}-{last}; edit it with SEARCH/REPLACE)\n```\n{excerpt}\n```")
+        return "\n\n".join(sections), editable
+
+    def _project_relative(self, path: str) -> Optional[str]:
+        candidate = Path(path)
+        if not candidate.is_absolute():
+            candidate = self.project_dir / candidate
+        try:
+            candidate = candidate.resolve()
+            rel = relative_path(self.project_dir, candidate)
+        except (OSError, ValueError):
+            return None
+        if not candidate.is_file() or any(part in IGNORED_DIRS for part in Path(rel).parts):
+            return None
+        return rel
+
+    def parse_patches(self, response: str, editable: set) -> List[Tuple[str, str]]:
+        """Extract FILE blocks: edits of existing files, rewrites of fully shown ones, new files"""
+        patches = []
+        lines = response.splitlines()
+        for block in iter_fences(response):
+            match = FILE_LINE.match(lines[block["start"] - 1]) if block["start"] else None
+            if not match:
+                continue
+            rel = match.group("path").strip()
+            content = block["body"]
+            target = (self.project_dir / rel).resolve()
+            if Path(rel).is_absolute() or self.project_dir not in target.parents:
+                print(f"⚠️  Ignoring patch outside the project: {rel}")
+                continue
+            if target.exists() and rel not in editable and not looks_like_edit(content):
+                print(f"⚠️  Ignoring rewrite of {rel}: its full content was not shown to the model")
+                continue
+            patches.append((rel, content + "\n"))
+        return patches
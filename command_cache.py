@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Command Result Cache for ULCA
+Reuses the result of idempotent checks (tests, type checkers, linters) when the
+command, working directory, relevant environment and input files are unchanged.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import time
+from datetime import datetime
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from project_files import IGNORED_DIRS, ULCA_CACHE_DIR, file_digest
+
+# Configuration
+CACHE_SUBDIR = "command_cache"
+MAX_CACHE_ENTRIES = 200
+MAX_CACHE_BYTES = 8 * 1024 * 1024  # Entries plus the logs kept with them
+MAX_CACHED_LOG_BYTES = 1024 * 1024  # Larger logs are not kept; the entry still has the output tail
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+ENV_KEYS = ("PATH", "VIRTUAL_ENV", "CONDA_PREFIX", "PYTHONPATH", "NODE_ENV", "JAVA_HOME", "CI")
+
+PYTHON_INPUTS = ["*.py", "pytest.ini", "pyproject.toml", "setup.cfg", "tox.ini", "requirements*.txt", ".coveragerc"]
+JS_INPUTS = ["*.js", "*.jsx", "*.mjs", "*.cjs", "*.ts", "*.tsx", "*.vue", "tsconfig*.json", "package.json",
+             "package-lock.json", "yarn.lock", "pnpm-lock.yaml", ".eslintrc*", "eslint.config.*", ".prettierrc*"]
+
+# Only commands matching a rule are cached. Input patterns without a "/" match
+# file names anywhere in the project; patterns with one match relative paths.
+CACHE_RULES: List[Dict[str, Any]] = [
+    {"pattern": re.compile(r'^(python3? -m )?(pytest|py\.test|mypy|ruff|flake8|pylint|black --check)\b'),
+     "inputs": PYTHON_INPUTS},
+    {"pattern": re.compile(r'^(npx )?(tsc|eslint|prettier --check|jest|vitest run)\b'), "inputs": JS_INPUTS},
+    {"pattern": re.compile(r'^(npm|yarn|pnpm) (run )?(lint|test|typecheck|type-check)\b'), "inputs": JS_INPUTS},
+    {"pattern": re.compile(r'^cargo (check|clippy|test|fmt --check)\b'),
+     "inputs": ["*.rs", "Cargo.toml", "Cargo.lock"]},
+    {"pattern": re.compile(r'^(flutter|dart) (analyze|test)\b'),
+     "inputs": ["*.dart", "pubspec.yaml", "pubspec.lock", "analysis_options.yaml"]},
+]
+
+# Redirections, pipes and command chains can have side effects we cannot see
+UNSAFE_SHELL = re.compile(r'[<>|;&`]|\$\(')
+
+
+def normalize_command(command: str) -> Optional[str]:
+    try:
+        return " ".join(shlex.split(command))
+    except ValueError:
+        return None
+
+
+class CommandCache:
+    """On-disk cache of command results keyed by command, cwd, env and input hashes"""
+
+    def __init__(self, project_dir: Path, cache_dir: Optional[Path] = None):
+        self.project_dir = Path(project_dir).resolve()
+        self.cache_dir = Path(cache_dir) if cache_dir else self.project_dir / ULCA_CACHE_DIR / CACHE_SUBDIR
+        self.hits = 0
+        self.misses = 0
+        self._hashes: Dict[str, Tuple[float, int, str]] = {}  # rel -> (mtime, size, hash)
+
+    def rule_for(self, command: str) -> Optional[Dict[str, Any]]:
+        normalized = normalize_command(command)
+        if not normalized or UNSAFE_SHELL.search(command):
+            return None
+        for rule in CACHE_RULES:
+            if rule["pattern"].search(normalized):
+                return rule
+        return None
+
+    def env_names(self, command: str) -> List[str]:
+        """Environment variables that are part of a command's cache key"""
+        return sorted(set(ENV_KEYS) | set(re.findall(r'\$\{?(\w+)', command)))
+
+    def key_for(self, command: str, cwd: Optional[Path] = None,
+                environ: Optional[Mapping[str, str]] = None) -> Optional[str]:
+        """Cache key for a command, or None if it is not cacheable
+
+        environ is the environment the command will run in; pass the persistent
+        shell's, since exports there never reach this process's os.environ.
+        """
+        rule = self.rule_for(command)
+        if rule is None:
+            return None
+        cwd = Path(cwd or self.project_dir).resolve()
+        environ = os.environ if environ is None else environ
+        env = {k: environ.get(k, "") for k in self.env_names(command)}
+        material = json.dumps({
+            "command": normalize_command(command),
+            "cwd": str(cwd),
+            "env": env,
+            "inputs": self._inputs_hash(rule["inputs"])
+        }, sort_keys=True)
+        return hashlib.sha1(material.encode('utf-8')).hexdigest()
+
+    def _inputs_hash(self, patterns: List[str]) -> str:
+        """Combined hash of every project file matching the rule's input patterns"""
+        digest = hashlib.sha1()
+        for dirpath, dirnames, filenames in os.walk(self.project_dir):
+            dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_DIRS)
+            for name in sorted(filenames):
+                path = Path(dirpath) / name
+                rel = path.relative_to(self.project_dir).as_posix()
+                if not any(fnmatch(rel if "/" in p else name, p) for p in patterns):
+                    continue
+                try:
+                    stat = path.stat()
+                    known = self._hashes.get(rel)
+                    if known and known[:2] == (stat.st_mtime, stat.st_size):
+                        content_hash = known[2]
+                    else:
+                        content_hash = file_digest(path)
+                        self._hashes[rel] = (stat.st_mtime, stat.st_size, content_hash)
+                except OSError:
+                    continue
+                digest.update(f"{rel}:{content_hash}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a stored result and mark it recently used"""
+        entry_file = self.cache_dir / f"{key}.json"
+        try:
+            if time.time() - entry_file.stat().st_mtime > CACHE_TTL_SECONDS:
+                self._remove(entry_file)
+                raise FileNotFoundError
+            with open(entry_file, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(entry_file)  # mtime doubles as the LRU clock
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, command: str, result: Dict[str, Any]):
+        """Store a finished result; timeouts and killed commands are never cached"""
+        if result.get("timed_out") or result["returncode"] < 0:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            stdout, log_path = self._keep_log(key, result["stdout"], result.get("log_path"))
+            entry = {
+                "command": command,
+                "returncode": result["returncode"],
+                "stdout": stdout,
+                "stderr": result["stderr"],
+                "duration": result["duration"],
+                "log_path": log_path,
+                "cached_at": datetime.now().isoformat()
+            }
+            tmp_file = self.cache_dir / f"{key}.json.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_dir / f"{key}.json")
+        except IOError as e:
+            print(f"⚠️  Could not cache command result: {e}")
+            return
+        self.evict()
+
+    def _keep_log(self, key: str, stdout: str, log_path: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Copy the command's log next to the entry, since the command log directory prunes old logs"""
+        if not log_path:
+            return stdout, None
+        kept = self.cache_dir / f"{key}.log"
+        try:
+            if os.path.getsize(log_path) <= MAX_CACHED_LOG_BYTES:
+                shutil.copyfile(log_path, kept)
+                return stdout.replace(str(log_path), str(kept)), str(kept)
+        except OSError:
+            pass
+        # Not kept: the tail must not point at a log that is about to be pruned
+        return stdout.replace(f"; full log: {log_path}", ""), None
+
+    def _remove(self, entry_file: Path):
+        for path in (entry_file, entry_file.with_suffix(".log")):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for entry_file in self.cache_dir.glob("*.json"):
+            try:
+                stat = entry_file.stat()
+                size = stat.st_size
+                log_file = entry_file.with_suffix(".log")
+                if log_file.exists():
+                    size += log_file.stat().st_size
+                entries.append((stat.st_mtime, size, entry_file))
+            except OSError:
+                continue
+        return sorted(entries)
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the caps"""
+        entries = self._entries()
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for index, (mtime, size, entry_file) in enumerate(entries):
+            over = len(entries) - index > MAX_CACHE_ENTRIES or total > MAX_CACHE_BYTES
+            if not over and now - mtime <= CACHE_TTL_SECONDS:
+                continue
+            try:
+                self._remove(entry_file)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self) -> int:
+        removed = 0
+        for _, _, entry_file in self._entries():
+            try:
+                self._remove(entry_file)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        entries = self._entries() if self.cache_dir.exists() else []
+        return {"entries": len(entries), "bytes": sum(size for _, size, _ in entries),
+                "hits": self.hits, "misses": self.misses}
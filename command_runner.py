@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Streaming Command Execution for ULCA
+Runs shell commands with incremental stdout/stderr forwarding, a bounded in-memory
+tail for the LLM and the full output written to a log file.
+"""
+
+import asyncio
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from project_files import ULCA_CACHE_DIR
+
+# Configuration
+COMMAND_TIMEOUT = 1800  # Hard limit for a single command
+COMMAND_IDLE_TIMEOUT = 300  # Kill commands that print nothing for this long
+TAIL_LINES = 200  # Lines per stream kept in memory for the LLM
+MAX_COMMAND_LOGS = 50
+KILL_GRACE_SECONDS = 5
+ASYNC_LINE_LIMIT = 1024 * 1024  # Longest line arun() reads in one piece
+
+OutputCallback = Callable[[str, str], None]
+
+
+def kill_process_tree(process: subprocess.Popen, reaped_elsewhere: bool = False):
+    """Terminate a command and everything it spawned
+
+    With reaped_elsewhere another thread is already waiting on the process (a
+    background job's StreamingExecutor.run), so this one only signals and watches
+    process.returncode; exactly one side reaps the pid.
+    """
+    def exited(timeout: float) -> bool:
+        if not reaped_elsewhere:
+            try:
+                process.wait(timeout=timeout)
+                return True
+            except subprocess.TimeoutExpired:
+                return False
+        deadline = time.monotonic() + timeout
+        while process.returncode is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return process.returncode is not None
+
+    if (process.returncode if reaped_elsewhere else process.poll()) is not None:
+        return
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        if exited(KILL_GRACE_SECONDS):
+            return
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+        exited(KILL_GRACE_SECONDS)  # SIGKILL cannot be ignored; this reaps it unless another thread does
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def open_command_log(log_dir: Path, command: str):
+    """Create a log file for one command, pruning the oldest logs"""
+    log_dir.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', command)[:40].strip('-') or "command"
+    log_path = log_dir / f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}.log"
+    logs = sorted(log_dir.glob("*.log"))
+    for old in logs[:max(0, len(logs) - MAX_COMMAND_LOGS + 1)]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+    log_file = open(log_path, 'w', encoding='utf-8', errors='replace')
+    log_file.write(f"$ {command}\n")
+    return log_path, log_file
+
+
+def format_tail(tail, total_lines: int, log_path: Optional[Path]) -> str:
+    """Join a ring-buffer tail, noting how many earlier lines were dropped"""
+    text = "\n".join(tail)
+    omitted = total_lines - len(tail)
+    if omitted > 0:
+        where = f"; full log: {log_path}" if log_path else ""
+        text = f"... ({omitted} earlier lines omitted{where})\n{text}"
+    return text
+
+
+class StreamingExecutor:
+    """Runs commands in a project directory and streams their output line by line"""
+
+    def __init__(self, project_dir: Path, log_dir: Optional[Path] = None):
+        self.project_dir = Path(project_dir).resolve()
+        self.log_dir = Path(log_dir) if log_dir else self.project_dir / ULCA_CACHE_DIR / "logs"
+
+    def run(self, command: str, on_output: Optional[OutputCallback] = None, log: bool = True,
+            timeout: float = COMMAND_TIMEOUT, idle_timeout: Optional[float] = COMMAND_IDLE_TIMEOUT,
+            env: Optional[Dict[str, str]] = None, cwd: Optional[Path] = None,
+            popen_hook: Optional[Callable[[subprocess.Popen], None]] = None) -> Dict[str, Any]:
+        """Run a shell command, forwarding each output line to on_output(stream, line)"""
+        started = time.monotonic()
+        log_path, log_file = open_command_log(self.log_dir, command) if log else (None, None)
+        tails = {"stdout": deque(maxlen=TAIL_LINES), "stderr": deque(maxlen=TAIL_LINES)}
+        counts = {"stdout": 0, "stderr": 0}
+        last_output = [started]
+        log_lock = threading.Lock()
+        log_closed = [False]  # A reader can outlive the join below, e.g. when a grandchild holds the pipe
+
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            cwd=cwd or self.project_dir,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors='replace',
+            bufsize=1,
+            start_new_session=True
+        )
+        if popen_hook:
+            popen_hook(process)
+
+        def pump(stream_name: str, pipe):
+            for line in pipe:
+                line = line.rstrip('\n')
+                last_output[0] = time.monotonic()
+                tails[stream_name].append(line)
+                counts[stream_name] += 1
+                if log_file:
+                    with log_lock:
+                        if not log_closed[0]:
+                            log_file.write(line + "\n" if stream_name == "stdout" else f"[stderr] {line}\n")
+                if on_output:
+                    try:
+                        on_output(stream_name, line)
+                    except Exception:
+                        pass  # A broken listener must never break the command
+            pipe.close()
+
+        readers = [
+            threading.Thread(target=pump, args=("stdout", process.stdout), daemon=True),
+            threading.Thread(target=pump, args=("stderr", process.stderr), daemon=True)
+        ]
+        for reader in readers:
+            reader.start()
+
+        timed_out, usage, delay = None, None, 0.005
+        while True:
+            if hasattr(os, 'wait4'):
+                # Reap the shell ourselves so its rusage (which includes the
+                # children it waited for) is not lost inside Popen.wait()
+                try:
+                    pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+                except ChildProcessError:
+                    break  # Reaped outside this loop after all; Popen still knows the exit code
+                if pid:
+                    process.returncode = os.waitstatus_to_exitcode(status)
+                    usage = rusage
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+            else:
+                try:
+                    process.wait(timeout=0.25)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+            now = time.monotonic()
+            if now - started > timeout:
+                timed_out = f"Command timed out after {int(timeout)} seconds"
+            elif idle_timeout and now - last_output[0] > idle_timeout:
+                timed_out = f"Command produced no output for {int(idle_timeout)} seconds"
+            if timed_out:
+                kill_process_tree(process)
+                break
+
+        for reader in readers:
+            reader.join(timeout=KILL_GRACE_SECONDS)
+        returncode = process.wait() if timed_out is None else -1
+        duration = time.monotonic() - started
+
+        if log_file:
+            with log_lock:
+                log_file.write(f"[exit {returncode} after {duration:.1f}s]\n")
+                log_file.close()
+                log_closed[0] = True
+
+        outputs = {name: format_tail(tails[name], counts[name], log_path) for name in ("stdout", "stderr")}
+        if timed_out:
+            outputs["stderr"] = (outputs["stderr"] + "\n" + timed_out).strip()
+
+        cpu_time, max_rss_kb = None, None
+        if usage is not None:
+            cpu_time = usage.ru_utime + usage.ru_stime
+            # ru_maxrss is kilobytes on Linux but bytes on macOS
+            max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+
+        return {
+            "returncode": returncode,
+            "cpu_time": cpu_time,
+            "max_rss_kb": max_rss_kb,
+            "stdout": outputs["stdout"],
+            "stderr": outputs["stderr"],
+            "duration": duration,
+            "timed_out": timed_out is not None,
+            "log_path": str(log_path) if log_path else None,
+            "lines": counts["stdout"] + counts["stderr"]
+        }
+
+    async def arun(self, command: str, on_output: Optional[OutputCallback] = None, log: bool = True,
+                   timeout: float = COMMAND_TIMEOUT, idle_timeout: Optional[float] = COMMAND_IDLE_TIMEOUT,
+                   env: Optional[Dict[str, str]] = None, cwd: Optional[Path] = None) -> Dict[str, Any]:
+        """run() on the event loop: no reader threads, so many commands can stream from one thread
+
+        The result has the same keys; cpu_time and max_rss_kb are None because
+        asyncio reaps the process itself and its rusage is not available.
+        """
+        started = time.monotonic()
+        log_path, log_file = open_command_log(self.log_dir, command) if log else (None, None)
+        tails = {"stdout": deque(maxlen=TAIL_LINES), "stderr": deque(maxlen=TAIL_LINES)}
+        counts = {"stdout": 0, "stderr": 0}
+        last_output = [started]
+
+        process = await asyncio.create_subprocess_shell(
+            command,
+            cwd=cwd or self.project_dir,
+            env=env,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+            limit=ASYNC_LINE_LIMIT
+        )
+
+        async def pump(stream_name: str, stream: asyncio.StreamReader):
+            while True:
+                try:
+                    raw = await stream.readline()
+                except ValueError:
+                    raw = await stream.read(ASYNC_LINE_LIMIT)  # Over-long line: take it in pieces
+                if not raw:
+                    break
+                line = raw.decode('utf-8', errors='replace').rstrip('\n')
+                last_output[0] = time.monotonic()
+                tails[stream_name].append(line)
+                counts[stream_name] += 1
+                if log_file:
+                    log_file.write(line + "\n" if stream_name == "stdout" else f"[stderr] {line}\n")
+                if on_output:
+                    try:
+                        on_output(stream_name, line)
+                    except Exception:
+                        pass  # A broken listener must never break the command
+
+        readers = [asyncio.ensure_future(pump("stdout", process.stdout)),
+                   asyncio.ensure_future(pump("stderr", process.stderr))]
+        waiter = asyncio.ensure_future(process.wait())
+        timed_out = None
+        while not waiter.done():
+            await asyncio.wait({waiter}, timeout=0.25)
+            now = time.monotonic()
+            if now - started > timeout:
+                timed_out = f"Command timed out after {int(timeout)} seconds"
+            elif idle_timeout and now - last_output[0] > idle_timeout:
+                timed_out = f"Command produced no output for {int(idle_timeout)} seconds"
+            if timed_out and not waiter.done():
+                await self._akill(process, waiter)
+                break
+
+        await asyncio.wait(readers, timeout=KILL_GRACE_SECONDS)
+        for reader in readers:
+            reader.cancel()
+        returncode = process.returncode if timed_out is None else -1
+        duration = time.monotonic() - started
+
+        if log_file:
+            log_file.write(f"[exit {returncode} after {duration:.1f}s]\n")
+            log_file.close()
+
+        outputs = {name: format_tail(tails[name], counts[name], log_path) for name in ("stdout", "stderr")}
+        if timed_out:
+            outputs["stderr"] = (outputs["stderr"] + "\n" + timed_out).strip()
+        return {
+            "returncode": returncode,
+            "cpu_time": None,
+            "max_rss_kb": None,
+            "stdout": outputs["stdout"],
+            "stderr": outputs["stderr"],
+            "duration": duration,
+            "timed_out": timed_out is not None,
+            "log_path": str(log_path) if log_path else None,
+            "lines": counts["stdout"] + counts["stderr"]
+        }
+
+    @staticmethod
+    async def _akill(process: asyncio.subprocess.Process, waiter: "asyncio.Future"):
+        """kill_process_tree for an asyncio process"""
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(process.pid, sig)
+                elif sig == signal.SIGTERM:
+                    process.terminate()
+                else:
+                    process.kill()
+            except (ProcessLookupError, PermissionError):
+                return
+            done, _ = await asyncio.wait({waiter}, timeout=KILL_GRACE_SECONDS)
+            if done:
+                return
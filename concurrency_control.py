@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Adaptive Concurrency for ULCA
+Whether an Ollama host is fastest with 1, 2 or 4 requests in flight depends on
+its cores, memory and the model. ConcurrencyController finds out per endpoint:
+it measures aggregate tokens per second and request latency over windows in
+which the endpoint was kept busy at its current limit, adds one slot while that
+pays off and halves the limit when it stops paying off, times out or fails. The
+limit it settles on is saved in ~/.ulca/concurrency.json for the next session.
+"""
+
+import json
+import statistics
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Configuration
+ADAPTIVE_CONCURRENCY = True  # Learn each endpoint's limit unless it is configured with "parallel"
+ADAPTIVE_MAX_CONCURRENCY = 8
+WINDOW_REQUESTS = 4  # A measurement window ends after max(this, 2 x limit) completed requests
+MIN_SATURATION = 0.8  # Share of a window the endpoint must spend at its limit for the window to count
+MIN_GAIN = 0.05  # A slot is kept only if it raises throughput by at least 5%
+DECREASE_FACTOR = 0.5
+LATENCY_CEILING = 60.0  # Seconds; slower requests risk the client timeout, so back off
+REPROBE_WINDOWS = 20  # Stable windows before trying one more slot again, in case conditions changed
+EWMA_WEIGHT = 0.5
+CONCURRENCY_FILE = Path.home() / ".ulca" / "concurrency.json"
+
+
+class ConcurrencyController:
+    """AIMD search for the in-flight limit that maximizes one endpoint's token throughput"""
+
+    def __init__(self, limit: int = 1, max_limit: int = ADAPTIVE_MAX_CONCURRENCY,
+                 learned: Optional[Dict[str, Any]] = None):
+        self.max_limit = max(1, max_limit)
+        self.throughput: Dict[int, float] = {}  # Smoothed tokens/s per limit
+        self.latency: Dict[int, float] = {}  # Smoothed mean request seconds per limit
+        if learned:
+            limit = learned.get("limit", limit)
+            self.throughput = {int(level): rate for level, rate in learned.get("throughput", {}).items()}
+            self.latency = {int(level): seconds for level, seconds in learned.get("latency", {}).items()}
+        self.limit = min(max(1, int(limit)), self.max_limit)
+        self.windows = 0
+        self._stable_windows = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        now = time.monotonic()
+        self._window_start = now
+        self._last_change = now
+        self._saturated = 0.0
+        self._tokens = 0
+        self._latencies: List[float] = []
+
+    def _advance(self, outstanding: int):
+        # Time counts as saturated while the endpoint had as many requests as the limit allows
+        now = time.monotonic()
+        if outstanding >= self.limit:
+            self._saturated += now - self._last_change
+        self._last_change = now
+
+    def on_start(self, outstanding: int):
+        """A request was sent; outstanding includes it"""
+        with self._lock:
+            self._advance(outstanding - 1)
+
+    def on_finish(self, outstanding: int, tokens: Optional[int], seconds: Optional[float],
+                  failed: bool = False) -> Optional[int]:
+        """A request ended (outstanding still includes it); returns the new limit when it changes"""
+        with self._lock:
+            self._advance(outstanding)
+            if failed:
+                return self._set_limit(max(1, int(self.limit * DECREASE_FACTOR)))
+            if seconds is None:
+                return None  # Preempted: neither its tokens nor its duration mean anything
+            self._latencies.append(seconds)
+            self._tokens += tokens or 0
+            if len(self._latencies) < max(WINDOW_REQUESTS, 2 * self.limit):
+                return None
+            return self._end_window()
+
+    def _smooth(self, table: Dict[int, float], value: float):
+        old = table.get(self.limit)
+        table[self.limit] = value if old is None else EWMA_WEIGHT * value + (1 - EWMA_WEIGHT) * old
+
+    def _end_window(self) -> Optional[int]:
+        elapsed = time.monotonic() - self._window_start
+        rate = self._tokens / elapsed if elapsed > 0 else 0.0
+        latency = statistics.mean(self._latencies)
+        saturation = self._saturated / elapsed if elapsed > 0 else 0.0
+        self._reset()
+        if saturation < MIN_SATURATION:
+            return None  # Demand stayed below the limit, so the window says nothing about it
+        self.windows += 1
+        self._smooth(self.throughput, rate)
+        self._smooth(self.latency, latency)
+        current = self.throughput[self.limit]
+        lower = self.throughput.get(self.limit - 1)
+        higher = self.throughput.get(self.limit + 1)
+        if latency > LATENCY_CEILING or (lower is not None and current < lower * (1 + MIN_GAIN)):
+            return self._set_limit(max(1, int(self.limit * DECREASE_FACTOR)))
+        if self.limit < self.max_limit and (higher is None or higher > current * (1 + MIN_GAIN)
+                                            or self._stable_windows >= REPROBE_WINDOWS):
+            return self._set_limit(self.limit + 1)
+        self._stable_windows += 1
+        return None
+
+    def _set_limit(self, limit: int) -> Optional[int]:
+        self._reset()
+        if limit == self.limit:
+            return None
+        self.limit = limit
+        self._stable_windows = 0
+        return limit
+
+    def learned(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "throughput": {str(level): round(rate, 2) for level, rate in sorted(self.throughput.items())},
+                "latency": {str(level): round(seconds, 3) for level, seconds in sorted(self.latency.items())},
+                "windows": self.windows,
+                "updated_at": datetime.now().isoformat()
+            }
+
+
+class ConcurrencyStore:
+    """Learned limits per endpoint URL, shared by every project on this machine"""
+
+    def __init__(self, path: Path = CONCURRENCY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.learned: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.learned = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            pass
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        return self.learned.get(url)
+
+    def save(self, url: str, learned: Dict[str, Any]):
+        with self._lock:
+            self.learned[url] = learned
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                temp_file = self.path.with_suffix(".tmp")
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.learned, f, indent=2)
+                temp_file.replace(self.path)
+            except IOError as e:
+                print(f"⚠️  Could not save learned concurrency: {e}")
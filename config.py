@@ -3,8 +3,13 @@
 
 # LLM API Configuration
 OLLAMA_API_BASE = "http://localhost:11434/api/generate"
+OLLAMA_ENDPOINTS = []  # Extra Ollama hosts, e.g. ["http://cpu-2:11434"] (ULCA_OLLAMA_ENDPOINTS; shared by every project)
 MODEL_NAME = "claude-3.5-sonnet"
 
+# Semantic Code Search
+EMBEDDING_MODEL = "nomic-embed-text"  # Use "local" for the offline hashing embedder
+SEMANTIC_TOP_K = 4
+
 # API Request Settings
 MAX_RETRIES = 3
 REQUEST_TIMEOUT = 30
@@ -19,7 +24,25 @@ PROJECT_CONTEXT_FILE = "project_context.json"
 MAX_FILE_SIZE_MB = 100  # Maximum file size to process
 
 # Terminal Settings
-COMMAND_TIMEOUT = 300  # 5 minutes
+COMMAND_TIMEOUT = 1800  # Hard limit per command (30 minutes)
+COMMAND_IDLE_TIMEOUT = 300  # Kill commands silent for 5 minutes
+COMMAND_TAIL_LINES = 200  # Output lines per stream kept for the LLM; full logs go to .ulca/logs
+PYTEST_COMMAND = "python -m pytest -q"  # Used by `affected` for each test shard; python3 or this interpreter when PATH has no python
+FIX_MAX_ITERATIONS = 5  # Patch attempts per `fix <command>` run
+FIX_NO_PROGRESS_LIMIT = 2  # Stop after this many attempts that leave the errors unchanged
+FAILURE_CONTEXT_TOKENS = 1500  # Budget for the distilled log of the last failed command
+COMMAND_CACHE_ENABLED = False  # Reuse test/lint results when inputs are unchanged (`cache on`)
+COMMAND_CACHE_MAX_ENTRIES = 200
+COMMAND_CACHE_MAX_MB = 8
+USE_PERSISTENT_SHELL = False  # Share one pty shell across commands (toggle with `shell on|off`)
+STRUCTURED_OUTPUT = False  # JSON-schema constrained replies (toggle with `structured on|off`)
+TODO_PARALLELISM = "auto"  # TODO items `todo run` works on at once; "auto" follows the learned concurrency (llm_config.todo_parallelism)
+MAP_PARALLELISM = "auto"  # Concurrent per-file model passes in `map` runs, or "auto" (llm_config.map_parallelism)
+LLM_MAX_IN_FLIGHT = 1  # Starting requests in flight per endpoint; read from OLLAMA_NUM_PARALLEL when it is set
+ADAPTIVE_CONCURRENCY = True  # Learn each endpoint's best requests in flight; an endpoint's "parallel" fixes it
+ADAPTIVE_MAX_CONCURRENCY = 8  # Learned limits are kept in ~/.ulca/concurrency.json
+SERVE_PORT = 8765  # Local JSON/SSE API of `python universal_claude_agent.py serve` (loopback only)
+SERVE_KEEP_ALIVE = "30m"  # How long Ollama keeps the model loaded for projects the daemon serves
 SAFE_COMMANDS = [
     "ls", "cat", "head", "tail", "grep", "find", "pwd", "whoami",
     "git", "npm", "yarn", "pip", "python", "node", "java", "javac",
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Per-file Digest Cache for ULCA
+Keeps a short LLM-written summary of each project file, keyed by content hash so
+unchanged files are never summarised twice. Summaries are generated by a single
+background worker that only runs while the agent is idle; a failed summary is
+retried with backoff a few times, then left until the file changes.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+from project_files import ULCA_CACHE_DIR, FileManifest, file_digest, read_text
+
+# Configuration
+DIGEST_FILE = "digests.json"
+DIGEST_QUEUE_SIZE = 64
+MAX_DIGEST_INPUT_CHARS = 6000
+MAX_DIGEST_CHARS = 240
+MAX_STORED_DIGESTS = 5000
+PROJECT_MAP_CHARS = 3000
+MAX_DIGEST_ATTEMPTS = 3  # A file whose summary failed this often is left alone until its content changes
+DIGEST_RETRY_SECONDS = 60  # Wait before retrying a failed summary; doubles with each failure
+
+DIGEST_PROMPT = """Summarize the file below for a developer who has not seen it.
+Reply with ONE line of at most 30 words: its purpose, then its key classes/functions.
+Do not use markdown.
+
+FILE: {path}
+{content}
+"""
+
+Summarizer = Callable[[str], str]
+
+
+class FileDigestCache:
+    """Content-hash keyed file summaries with an idle-time generation queue"""
+
+    def __init__(self, project_dir: Path, summarizer: Summarizer, cache_dir: Optional[Path] = None):
+        self.project_dir = Path(project_dir).resolve()
+        self.summarizer = summarizer
+        self.cache_dir = Path(cache_dir) if cache_dir else self.project_dir / ULCA_CACHE_DIR
+        self.digest_file = self.cache_dir / DIGEST_FILE
+        self.digests: Dict[str, Dict[str, str]] = self._load()
+        self.queue: "queue.Queue[tuple]" = queue.Queue(maxsize=DIGEST_QUEUE_SIZE)
+        self._pauses = 0  # Outstanding pause() calls; the worker only generates at zero
+        self._idle = threading.Condition()
+        self._pending: Set[str] = set()
+        self._failures: Dict[str, Dict[str, Any]] = {}  # content hash -> attempts and retry time
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        if self.digest_file.exists():
+            try:
+                with open(self.digest_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                pass
+        return {}
+
+    def _save(self):
+        with self._lock:
+            data = dict(self.digests)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.digest_file.with_suffix(".json.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_file, self.digest_file)
+        except IOError as e:
+            print(f"⚠️  Could not save file digests: {e}")
+
+    def get(self, content_hash: str) -> Optional[str]:
+        entry = self.digests.get(content_hash)
+        return entry["summary"] if entry else None
+
+    def pause(self):
+        """Hold background generation while an interactive turn runs; every pause() needs a resume()"""
+        with self._idle:
+            self._pauses += 1
+
+    def resume(self):
+        with self._idle:
+            self._pauses = max(0, self._pauses - 1)
+            self._idle.notify_all()
+
+    @property
+    def paused(self) -> bool:
+        """True while any turn holds a pause; the summarizer polls this to drop a running request"""
+        return self._pauses > 0
+
+    def _record_failure(self, content_hash: str):
+        with self._lock:
+            attempts = self._failures.get(content_hash, {}).get("attempts", 0) + 1
+            self._failures[content_hash] = {
+                "attempts": attempts,
+                "retry_at": time.monotonic() + DIGEST_RETRY_SECONDS * 2 ** (attempts - 1)
+            }
+
+    def _should_retry(self, content_hash: str) -> bool:
+        failure = self._failures.get(content_hash)
+        return (failure is None or (failure["attempts"] < MAX_DIGEST_ATTEMPTS
+                                    and time.monotonic() >= failure["retry_at"]))
+
+    def enqueue_missing(self, manifest: FileManifest) -> int:
+        """Queue files whose current content has no digest yet; returns how many were queued"""
+        queued = 0
+        for rel, entry in manifest.entries.items():
+            content_hash = entry["hash"]
+            if (entry["size"] == 0 or content_hash in self.digests or content_hash in self._pending
+                    or not self._should_retry(content_hash)):
+                continue
+            try:
+                self.queue.put_nowait((rel, content_hash))
+            except queue.Full:
+                break  # Remaining files are picked up on a later turn
+            self._pending.add(content_hash)
+            queued += 1
+        if queued:
+            self._ensure_worker()
+        return queued
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="ulca-digests", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            rel, content_hash = self.queue.get()
+            try:
+                while True:
+                    with self._idle:
+                        self._idle.wait_for(lambda: self._pauses == 0)
+                    summary = self.summarize_file(rel, content_hash)
+                    if summary is not None or not self.paused:
+                        break  # Otherwise a pause cut the request short: go again once idle
+            except Exception as e:
+                self._record_failure(content_hash)
+                print(f"⚠️  Could not summarize {rel}: {e}")
+            finally:
+                self._pending.discard(content_hash)
+                self.queue.task_done()
+
+    def summarize_file(self, rel: str, content_hash: str) -> Optional[str]:
+        """Generate and store the digest for one file (skipped if it changed meanwhile)"""
+        if content_hash in self.digests:
+            return self.get(content_hash)
+        path = self.project_dir / rel
+        try:
+            if file_digest(path) != content_hash:
+                return None  # Edited since it was queued; the new content is queued on a later turn
+        except OSError:
+            return None
+        content = read_text(path)
+        if content is None:
+            return None
+        summary = self.summarizer(DIGEST_PROMPT.format(path=rel, content=content[:MAX_DIGEST_INPUT_CHARS]))
+        if not summary or summary.startswith("Error:"):
+            if not self.paused:  # A pause cancels the request; that says nothing about the file
+                self._record_failure(content_hash)
+            return None
+        summary = " ".join(summary.split())[:MAX_DIGEST_CHARS]
+        with self._lock:
+            self._failures.pop(content_hash, None)
+            self.digests[content_hash] = {
+                "path": rel,
+                "summary": summary,
+                "generated_at": datetime.now().isoformat()
+            }
+        self._save()
+        return summary
+
+    def prune(self, manifest: FileManifest):
+        """Drop digests of content that no longer exists once the store grows too large"""
+        if len(self.digests) <= MAX_STORED_DIGESTS:
+            return
+        live = {entry["hash"] for entry in manifest.entries.values()}
+        with self._lock:
+            self.digests = {h: d for h, d in self.digests.items() if h in live}
+        self._save()
+
+    def project_map(self, manifest: FileManifest, max_chars: int = PROJECT_MAP_CHARS) -> str:
+        """One line per file: path plus its digest when one exists"""
+        lines, used, omitted = [], 0, 0
+        for rel in sorted(manifest.entries):
+            summary = self.get(manifest.entries[rel]["hash"])
+            line = f"- {rel}: {summary}" if summary else f"- {rel}"
+            if used + len(line) > max_chars:
+                omitted += 1
+                continue
+            lines.append(line)
+            used += len(line) + 1
+        if omitted:
+            lines.append(f"... and {omitted} more files")
+        return "\n".join(lines)
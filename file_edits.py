@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Incremental File Edits for ULCA
+Applies model-written search/replace blocks and unified diffs with fuzzy context
+matching, so an edit costs output tokens in proportion to the change rather than
+the file. Edits that do not apply cleanly are rejected, never half-applied.
+"""
+
+import ast
+import json
+import re
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Configuration
+MAX_CONTEXT_FUZZ = 2  # Context lines that may be dropped from each end of a diff hunk
+MIN_FUZZY_RATIO = 0.92  # Similarity needed for a near-miss SEARCH block to match
+MAX_FUZZY_SEARCH_LINES = 80  # Similarity search is quadratic; only for short blocks
+
+SEARCH_REPLACE_BLOCK = re.compile(
+    r'^<{5,9} ?SEARCH[^\n]*\n(?P<search>.*?)^={5,9}[ \t]*\n(?P<replace>.*?)^>{5,9} ?REPLACE[^\n]*$',
+    re.MULTILINE | re.DOTALL
+)
+HUNK_HEADER = re.compile(r'^@@ -(?P<old>\d+)(?:,\d+)? \+(?P<new>\d+)(?:,\d+)? @@|^@@.*@@')
+DIFF_FILE_HEADER = re.compile(r'^(---|\+\+\+) (?:[ab]/)?(?P<path>\S+)')
+
+
+class EditConflict(Exception):
+    """Raised when an edit's context cannot be located unambiguously or breaks the file"""
+
+
+def looks_like_edit(text: str) -> bool:
+    """True if text is a search/replace or unified diff edit rather than full file content"""
+    if SEARCH_REPLACE_BLOCK.search(text):
+        return True
+    lines = text.lstrip().splitlines()[:4]
+    return bool(lines) and (lines[0].startswith(('--- ', 'diff --git')) or lines[0].startswith('@@'))
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _reindent(lines: List[str], model_first: List[str], file_first: List[str]) -> List[str]:
+    """Shift replacement lines by the indentation difference between the model's and the file's text"""
+    model_line = next((l for l in model_first if l.strip()), None)
+    file_line = next((l for l in file_first if l.strip()), None)
+    if model_line is None or file_line is None:
+        return lines
+    have, want = _indent(model_line), _indent(file_line)
+    if have == want:
+        return lines
+    if want.startswith(have):
+        extra = want[len(have):]
+        return [extra + l if l.strip() else l for l in lines]
+    if have.startswith(want):
+        surplus = len(have) - len(want)
+        return [l[surplus:] if l[:surplus].strip() == "" else l.lstrip() for l in lines]
+    return lines
+
+
+def _find_block(lines: List[str], block: List[str], start: int = 0, hint: Optional[int] = None) -> Tuple[int, str]:
+    """Locate block in lines; returns (index, strategy) or raises EditConflict"""
+    if not block:
+        raise EditConflict("empty context")
+    size = len(block)
+    for strategy, normalize in (("exact", lambda l: l.rstrip()), ("whitespace", lambda l: " ".join(l.split()))):
+        wanted = [normalize(l) for l in block]
+        matches = [i for i in range(start, len(lines) - size + 1)
+                   if [normalize(l) for l in lines[i:i + size]] == wanted]
+        if len(matches) == 1 or (matches and hint is not None):
+            return min(matches, key=lambda i: abs(i - hint)) if hint is not None else matches[0], strategy
+        if matches:
+            raise EditConflict(f"context matches {len(matches)} places; include more surrounding lines")
+
+    if size <= MAX_FUZZY_SEARCH_LINES:
+        target = "\n".join(l.strip() for l in block)
+        best, best_ratio, runner_up = None, 0.0, 0.0
+        for i in range(start, len(lines) - size + 1):
+            matcher = SequenceMatcher(None, target, "\n".join(l.strip() for l in lines[i:i + size]))
+            if matcher.real_quick_ratio() < MIN_FUZZY_RATIO or matcher.quick_ratio() < MIN_FUZZY_RATIO:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio, runner_up = i, ratio, best_ratio
+            elif ratio > runner_up:
+                runner_up = ratio
+        if best is not None and best_ratio >= MIN_FUZZY_RATIO:
+            if best_ratio - runner_up < 0.02:
+                raise EditConflict("context is similar to several places; include more surrounding lines")
+            return best, f"fuzzy {best_ratio:.0%}"
+    raise EditConflict("context not found in the current file")
+
+
+def apply_search_replace(content: str, edit_text: str) -> Tuple[str, List[str]]:
+    """Apply every SEARCH/REPLACE block in order; returns (new content, notes)"""
+    blocks = list(SEARCH_REPLACE_BLOCK.finditer(edit_text))
+    if not blocks:
+        raise EditConflict("no SEARCH/REPLACE blocks found")
+    lines, notes = content.splitlines(), []
+    for number, block in enumerate(blocks, 1):
+        search = block.group("search").splitlines()
+        replace = block.group("replace").splitlines()
+        if not any(l.strip() for l in search):
+            lines.extend(replace)  # Empty SEARCH appends
+            notes.append(f"block {number}: appended")
+            continue
+        try:
+            index, strategy = _find_block(lines, search)
+        except EditConflict as e:
+            raise EditConflict(f"SEARCH block {number}: {e}")
+        if strategy != "exact":
+            replace = _reindent(replace, search, lines[index:index + len(search)])
+        lines[index:index + len(search)] = replace
+        notes.append(f"block {number}: {strategy} match at line {index + 1}")
+    return _join(lines, content), notes
+
+
+def parse_unified_diff(diff_text: str) -> List[Tuple[Optional[str], List[Tuple[Optional[int], List[str]]]]]:
+    """Split a unified diff into [(path, [(old start line, hunk lines)])]
+
+    Hunk line counts are ignored: model-written diffs often get them wrong.
+    """
+    files: List = []
+    path, hunks, hunk = None, [], None
+    lines = diff_text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith('--- ') and i + 1 < len(lines) and lines[i + 1].startswith('+++ '):
+            if hunks:
+                files.append((path, hunks))
+            old_path, new_path = (DIFF_FILE_HEADER.match(l) for l in lines[i:i + 2])
+            chosen = new_path if new_path and new_path.group("path") != "/dev/null" else old_path
+            path, hunks, hunk = chosen.group("path") if chosen else None, [], None
+            i += 2
+            continue
+        i += 1
+        match = HUNK_HEADER.match(line)
+        if match:
+            hunk = (int(match.group("old")) if match.group("old") else None, [])
+            hunks.append(hunk)
+        elif hunk is None:
+            continue  # "diff --git", "index ..." and other preamble
+        elif line[:1] in (' ', '-', '+'):
+            hunk[1].append(line)
+        elif line == '':
+            hunk[1].append(' ')  # Editors and models drop the space on blank context lines
+    if hunks:
+        files.append((path, hunks))
+    for _, file_hunks in files:
+        for _, body in file_hunks:
+            while body and body[-1] == ' ':
+                body.pop()
+    return files
+
+
+def apply_unified_diff(content: str, diff_text: str) -> Tuple[str, List[str]]:
+    """Apply the hunks of a single-file unified diff with fuzzy context matching"""
+    parsed = parse_unified_diff(diff_text)
+    if not parsed:
+        raise EditConflict("no diff hunks found")
+    if len(parsed) > 1:
+        raise EditConflict("diff touches several files; send one diff per file")
+    lines, notes, offset, floor = content.splitlines(), [], 0, 0
+    for number, (old_start, body) in enumerate(parsed[0][1], 1):
+        old = [l[1:] for l in body if l[:1] in (' ', '-')]
+        new = [l[1:] for l in body if l[:1] in (' ', '+')]
+        hint = old_start - 1 + offset if old_start else None
+        if not old:
+            # A pure insertion's old start is the line it goes after; "-0,0" means the top of the file
+            position = old_start + offset if old_start is not None else len(lines)
+            position = min(max(position, 0), len(lines))
+            lines[position:position] = new
+            offset += len(new)
+            notes.append(f"hunk {number}: inserted at line {position + 1}")
+            continue
+
+        # Like patch(1): retry with fewer context lines before giving up
+        leading = _context_run(body)
+        trailing = _context_run(list(reversed(body)))
+        error = None
+        for fuzz in range(MAX_CONTEXT_FUZZ + 1):
+            cut_front, cut_back = min(fuzz, leading), min(fuzz, trailing)
+            if fuzz and not (cut_front or cut_back):
+                break
+            old_try = old[cut_front:len(old) - cut_back]
+            new_try = new[cut_front:len(new) - cut_back]
+            if not old_try:
+                break
+            try:
+                index, strategy = _find_block(lines, old_try, floor, hint + cut_front if hint is not None else None)
+            except EditConflict as e:
+                error = e
+                continue
+            if strategy != "exact":
+                new_try = _reindent(new_try, old_try, lines[index:index + len(old_try)])
+            lines[index:index + len(old_try)] = new_try
+            floor = index + len(new_try)
+            if hint is not None:
+                offset += (index - (hint + cut_front))
+            offset += len(new_try) - len(old_try)
+            notes.append(f"hunk {number}: {strategy} match at line {index + 1}" + (f", fuzz {fuzz}" if fuzz else ""))
+            break
+        if not notes or not notes[-1].startswith(f"hunk {number}:"):
+            raise EditConflict(f"hunk {number}: {error or 'context not found'}")
+    return _join(lines, content), notes
+
+
+def _context_run(body: List[str]) -> int:
+    count = 0
+    for line in body:
+        if not line.startswith(' '):
+            break
+        count += 1
+    return count
+
+
+def _join(lines: List[str], original: str) -> str:
+    text = "\n".join(lines)
+    return text + "\n" if original.endswith("\n") or not original else text
+
+
+def validate(path: str, before: str, after: str):
+    """Reject edits that break a file which parsed before"""
+    suffix = Path(path).suffix.lower()
+    checks = {".py": ast.parse, ".json": json.loads}
+    check = checks.get(suffix)
+    if check is None:
+        return
+    try:
+        check(before)
+    except (SyntaxError, ValueError):
+        return  # Already broken; the edit may be the fix
+    try:
+        check(after)
+    except (SyntaxError, ValueError) as e:
+        raise EditConflict(f"edited {path} no longer parses: {e}")
+
+
+def apply_edit(path: str, content: str, edit_text: str) -> Tuple[str, List[str]]:
+    """Apply a search/replace or unified diff edit to content and validate the result"""
+    if SEARCH_REPLACE_BLOCK.search(edit_text):
+        updated, notes = apply_search_replace(content, edit_text)
+    else:
+        updated, notes = apply_unified_diff(content, edit_text)
+    if updated == content:
+        raise EditConflict("edit makes no change")
+    validate(path, content, updated)
+    return updated, notes
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Map Mode for ULCA
+Applies one instruction to many files: every selected file gets its own model
+pass through a bounded worker pool, the resulting diffs reach a review queue as
+they arrive, and the approved ones are written as one batch. Progress is saved
+to .ulca/map/ after every file, so an interrupted run resumes where it stopped.
+"""
+
+import difflib
+import hashlib
+import json
+import queue
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from action_plan import ActionPlan, PlanRecorder, extract_actions, iter_fences
+from file_edits import EditConflict, apply_edit, looks_like_edit
+from project_files import ULCA_CACHE_DIR, file_digest, iter_project_files, relative_path
+
+# Configuration
+MAP_PARALLELISM = 2  # Concurrent model passes; match it to the number of Ollama replicas
+MAX_MAP_FILES = 200
+MAX_MAP_FILE_CHARS = 24000  # The model must see the whole file in one pass; larger files are skipped
+MAP_NUM_PREDICT = 4096
+MAP_STATE_DIR = "map"
+
+MAP_PROMPT = """You are applying one change to a single file of the project at {project_dir}.
+
+INSTRUCTION: {instruction}
+
+FILE: {path}
+```
+{content}
+```
+
+If this file needs no change for the instruction, reply with exactly: NO CHANGE
+Otherwise reply with a line "FILE: {path}" followed by one fenced block holding SEARCH/REPLACE blocks
+(or the complete new file). Change only this file and leave unrelated code as it is.
+"""
+
+# pending -> running -> proposed -> approved -> applied; or unchanged / failed / rejected / stale
+OPEN_STATUSES = ("pending", "running", "proposed", "approved")
+
+AskModel = Callable[[str], str]
+
+
+def _matches(rel: str, pattern: str) -> bool:
+    """Glob match where "*.py" also matches in subdirectories and "src/" means everything below src"""
+    if pattern.endswith("/"):
+        return rel.startswith(pattern)
+    if "/" not in pattern:
+        return fnmatch(PurePosixPath(rel).name, pattern)
+    return fnmatch(rel, pattern) or (pattern.startswith("**/") and fnmatch(rel, pattern[3:]))
+
+
+def select_files(project_dir: Path, patterns: List[str]) -> List[str]:
+    """Project files matching any include glob and no "!"-prefixed exclude glob
+
+    Candidates come from iter_project_files, so build output, VCS metadata,
+    hidden files and agent state are never selected.
+    """
+    includes = [pattern for pattern in patterns if not pattern.startswith("!")] or ["*"]
+    excludes = [pattern[1:] for pattern in patterns if pattern.startswith("!")]
+    selected = []
+    for path in iter_project_files(project_dir):
+        rel = relative_path(project_dir, path)
+        if any(_matches(rel, pattern) for pattern in includes) and not any(_matches(rel, p) for p in excludes):
+            selected.append(rel)
+    return selected[:MAX_MAP_FILES]
+
+
+def proposed_content(rel: str, current: str, reply: str) -> Tuple[Optional[str], str]:
+    """New content for one file from a map reply; returns (content, "") or (None, reason)"""
+    if reply.strip().upper().startswith("NO CHANGE"):
+        return current, ""
+    actions = [action for action in extract_actions(reply) if action["type"] in ("write", "edit")]
+    mine = [action for action in actions if PurePosixPath(action["path"]) == PurePosixPath(rel)]
+    if not mine:
+        fences = iter_fences(reply)
+        if len(actions) > 1 or len(fences) != 1:
+            return None, "the reply holds no edit for this file"
+        # A single unlabeled block can only be meant for the file we asked about
+        body = fences[0]["body"] + "\n"
+        mine = [{"type": "edit" if looks_like_edit(body) else "write", "content": body}]
+    content = current
+    for action in mine:
+        if action["type"] == "write":
+            content = action["content"]
+            continue
+        try:
+            content, _ = apply_edit(rel, content, action["content"])
+        except EditConflict as e:
+            return None, str(e)
+    return content, ""
+
+
+def read_snapshot(path: Path) -> Tuple[Optional[str], Optional[str]]:
+    """A file's text as read_text returns it, with the file_digest of exactly the bytes it came from"""
+    try:
+        raw = path.read_bytes()
+        text = raw.decode('utf-8')
+    except (UnicodeDecodeError, OSError):
+        return None, None
+    return text.replace("\r\n", "\n").replace("\r", "\n"), hashlib.sha1(raw).hexdigest()
+
+
+class MapRun:
+    """One instruction mapped over a set of files, persisted so it can be resumed"""
+
+    def __init__(self, project_dir: Path, state: Dict[str, Any]):
+        self.project_dir = Path(project_dir).resolve()
+        self.state = state
+        self.state_file = self.project_dir / ULCA_CACHE_DIR / MAP_STATE_DIR / f"{state['id']}.json"
+        self.results: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._remaining = 0
+        self._started: Optional[float] = None
+        self._stopping = threading.Event()
+
+    @classmethod
+    def create(cls, project_dir: Path, instruction: str, patterns: List[str], files: List[str]) -> "MapRun":
+        state = {
+            "id": datetime.now().strftime("%Y%m%d-%H%M%S-%f"),  # Sorts by start time; unique within a second
+            "instruction": instruction,
+            "patterns": patterns,
+            "created_at": datetime.now().isoformat(),
+            "files": {rel: {"status": "pending"} for rel in files}
+        }
+        run = cls(project_dir, state)
+        run.save()
+        return run
+
+    @classmethod
+    def latest(cls, project_dir: Path, unfinished_only: bool = True) -> Optional["MapRun"]:
+        """The most recent saved run, skipping finished ones unless asked for"""
+        state_dir = Path(project_dir).resolve() / ULCA_CACHE_DIR / MAP_STATE_DIR
+        for state_file in sorted(state_dir.glob("*.json"), reverse=True):
+            try:
+                with open(state_file, 'r', encoding='utf-8') as f:
+                    run = cls(project_dir, json.load(f))
+            except (json.JSONDecodeError, IOError, KeyError):
+                continue
+            if not unfinished_only or not run.finished:
+                return run
+        return None
+
+    def save(self):
+        with self._lock:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.state_file.with_suffix(".tmp")
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, indent=2, ensure_ascii=False)
+            temp_file.replace(self.state_file)
+
+    @property
+    def files(self) -> Dict[str, Dict[str, Any]]:
+        return self.state["files"]
+
+    @property
+    def finished(self) -> bool:
+        return not any(entry["status"] in OPEN_STATUSES for entry in self.files.values())
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for entry in self.files.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+    def start(self, ask_model: AskModel, parallelism: int = MAP_PARALLELISM):
+        """Queue every file without a result on a bounded pool; proposals left from an earlier session come first"""
+        for rel, entry in self.files.items():
+            if entry["status"] == "running":
+                entry["status"] = "pending"  # Interrupted mid-generation last time
+            if entry["status"] == "proposed":
+                self.results.put(rel)
+        pending = [rel for rel, entry in self.files.items() if entry["status"] == "pending"]
+        self._remaining = len(pending)
+        if not pending:
+            self.results.put(None)
+            return
+        self._started = time.monotonic()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="ulca-map")
+        for rel in pending:
+            self._pool.submit(self._generate, rel, ask_model)
+
+    def _set(self, rel: str, **fields):
+        # Entries change on worker threads while save() serializes the whole state
+        with self._lock:
+            self.files[rel].update(fields)
+
+    def _generate(self, rel: str, ask_model: AskModel):
+        """Worker body: every file ends in _finish, or the review loop would wait for it forever"""
+        try:
+            reported = self._propose(rel, ask_model)
+        except Exception as e:
+            self._set(rel, status="failed", detail=f"unexpected error: {e}")
+            reported = rel
+        self._finish(reported)
+
+    def _propose(self, rel: str, ask_model: AskModel) -> Optional[str]:
+        """Generate one file's proposal; returns rel when the file has a result to review"""
+        if self._stopping.is_set():
+            return None
+        path = self.project_dir / rel
+        current, before_hash = read_snapshot(path)
+        if current is None or len(current) > MAX_MAP_FILE_CHARS:
+            self._set(rel, status="failed", detail="unreadable" if current is None else "file too large for one pass")
+            return rel
+
+        self._set(rel, status="running", started_at=datetime.now().isoformat())
+        started = time.monotonic()
+        reply = ask_model(MAP_PROMPT.format(project_dir=self.project_dir, instruction=self.state["instruction"],
+                                            path=rel, content=current))
+        duration = round(time.monotonic() - started, 3)
+        if self._stopping.is_set():
+            self._set(rel, status="pending")  # Stopped while the model was answering; redo on resume
+            return None
+        if reply.startswith("Error:"):
+            self._set(rel, status="failed", detail=reply, duration=duration)
+            return rel
+        content, reason = proposed_content(rel, current, reply)
+        if content is None:
+            self._set(rel, status="failed", detail=reason, duration=duration)
+        elif content == current:
+            self._set(rel, status="unchanged", duration=duration)
+        else:
+            diff = difflib.unified_diff(current.splitlines(), content.splitlines(), f"a/{rel}", f"b/{rel}", lineterm="")
+            # The hash of what the model saw, so an edit made during generation makes the proposal stale
+            self._set(rel, status="proposed", before_hash=before_hash, after=content, diff="\n".join(diff),
+                      duration=duration)
+        return rel
+
+    def _finish(self, rel: Optional[str]):
+        try:
+            self.save()
+        except OSError as e:
+            print(f"⚠️  Could not save map progress: {e}")  # The queue below must still be fed
+        if rel is not None:
+            self.results.put(rel)
+        with self._lock:
+            self._remaining -= 1
+            done = self._remaining == 0
+        if done:
+            self._record_wall_time()
+            self.results.put(None)  # Everything generated: the review queue can end
+
+    def _record_wall_time(self):
+        with self._lock:
+            if self._started is not None:
+                self.state["wall_time"] = round(self.state.get("wall_time", 0.0) + time.monotonic() - self._started, 3)
+                self._started = None
+
+    def proposals(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield each file as its result arrives, until generation is finished or stopped"""
+        while True:
+            rel = self.results.get()
+            if rel is None:
+                return
+            yield rel, self.files[rel]
+
+    def decide(self, rel: str, approved: bool):
+        self._set(rel, status="approved" if approved else "rejected")
+        self.save()
+
+    def stop(self):
+        """Drop queued files and wait for the ones in flight; both stay pending for a resume"""
+        self._stopping.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        self._record_wall_time()
+        self.save()
+
+    def apply_approved(self, record: Optional[PlanRecorder] = None) -> List[Dict[str, Any]]:
+        """Write all approved files as one plan; files edited since their proposal are marked stale"""
+        actions = []
+        for rel, entry in self.files.items():
+            if entry["status"] != "approved":
+                continue
+            path = self.project_dir / rel
+            if not path.is_file() or file_digest(path) != entry["before_hash"]:
+                entry.update(status="stale", detail="file changed after the proposal was made")
+                continue
+            actions.append({"type": "write", "path": rel, "content": entry["after"], "line": len(actions)})
+        results = []
+        if actions:
+            plan = ActionPlan(self.project_dir, actions)
+            plan.prepare()
+            results = plan.apply(lambda command: ({"returncode": 0}, None), record)
+            for action, result in zip(plan.actions, results):
+                entry = self.files[action["path"]]
+                if result["status"] == "applied":
+                    entry["status"] = "applied"
+                    entry.pop("after", None)  # The file itself now holds it
+                elif result["status"] != "skipped":
+                    entry.update(status="failed", detail=result.get("detail", ""))
+        self.save()
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-file generation timings"""
+        timed = sorted(((entry["duration"], rel) for rel, entry in self.files.items() if "duration" in entry),
+                       reverse=True)
+        durations = [duration for duration, _ in timed]
+        return {
+            "counts": self.counts(),
+            "files": len(self.files),
+            "wall_time": self.state.get("wall_time", 0.0),
+            "timed": len(durations),
+            "total": round(sum(durations), 3),
+            "mean": round(statistics.mean(durations), 3) if durations else 0.0,
+            "median": round(statistics.median(durations), 3) if durations else 0.0,
+            "max": durations[0] if durations else 0.0,
+            "slowest": [{"path": rel, "duration": duration} for duration, rel in timed[:3]]
+        }
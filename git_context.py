@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Change Context for ULCA
+Snapshots the project at each turn and describes what changed since the previous
+one: git diffs with rename detection, or a file-manifest diff outside git.
+"""
+
+import difflib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from project_files import FileManifest, read_text
+
+# Configuration
+MAX_CHANGE_CONTEXT_CHARS = 3000
+MAX_LOG_ENTRIES = 10
+MAX_CACHED_FILE_BYTES = 64 * 1024  # Non-git fallback keeps small files to diff against
+MAX_CACHED_TOTAL_BYTES = 8 * 1024 * 1024
+EMPTY_TREE_SHA = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+# Agent-owned paths that are never reported as project changes
+AGENT_OWNED_PATHS = ["project_context.json", ".ulca"]
+EXCLUDED_PATHSPECS = [f"':(exclude){path}'" for path in AGENT_OWNED_PATHS]
+
+CommandRunner = Callable[..., Tuple[int, str, str]]
+
+
+def cap_text(text: str, max_chars: int) -> str:
+    """Truncate text to max_chars with a note about what was dropped"""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"\n... (truncated, {len(text) - max_chars} more chars)"
+
+
+class ChangeTracker:
+    """Tracks project state between agent turns"""
+
+    def __init__(self, project_dir: Path, run_command: CommandRunner):
+        self.project_dir = Path(project_dir).resolve()
+        self.run_command = run_command
+        self.previous: Optional[Dict[str, Any]] = None
+        self._is_git: Optional[bool] = None
+        self._content_cache: Dict[str, str] = {}
+        self._session_manifest: Optional[FileManifest] = None
+
+    def _git(self, args: str) -> Tuple[int, str]:
+        code, stdout, _ = self.run_command(f"git {args}", quiet=True)
+        return code, stdout
+
+    def is_git_repo(self) -> bool:
+        if self._is_git is None:
+            code, stdout = self._git("rev-parse --is-inside-work-tree")
+            self._is_git = code == 0 and stdout.strip() == "true"
+        return self._is_git
+
+    def _parse_porcelain(self, output: str) -> Dict[str, str]:
+        """Parse `git status --porcelain -z` into path -> status code"""
+        status, fields, i = {}, output.split('\0'), 0
+        while i < len(fields):
+            entry = fields[i]
+            i += 1
+            if len(entry) < 4:
+                continue
+            code, path = entry[:2], entry[3:]
+            if code[0] in 'RC':
+                code = f"{code} (from {fields[i]})"
+                i += 1
+            if any(path == owned or path.startswith(owned + '/') for owned in AGENT_OWNED_PATHS):
+                continue
+            status[path] = code
+        return status
+
+    def _git_snapshot(self) -> Dict[str, Any]:
+        code, head = self._git("rev-parse --verify -q HEAD")
+        head = head.strip() if code == 0 else None
+        _, porcelain = self._git("status --porcelain=v1 -z --untracked-files=all")
+        status = self._parse_porcelain(porcelain)
+        # `git stash create` records index + worktree as a dangling commit without touching refs
+        ref = head
+        if head and any(not c.startswith('??') for c in status.values()):
+            code, stash = self._git("stash create")
+            if code == 0 and stash.strip():
+                ref = stash.strip()
+        return {"kind": "git", "head": head, "ref": ref, "status": status}
+
+    def _manifest_snapshot(self) -> Dict[str, Any]:
+        previous = self.previous["manifest"] if self.previous and self.previous.get("kind") == "manifest" else None
+        manifest = FileManifest.scan(self.project_dir, previous)
+        if self._session_manifest is None:
+            self._session_manifest = manifest
+        return {"kind": "manifest", "manifest": manifest}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Capture HEAD/index/worktree state (or the file manifest outside git)"""
+        return self._git_snapshot() if self.is_git_repo() else self._manifest_snapshot()
+
+    def changed_paths(self) -> List[str]:
+        """Files differing from HEAD (or, outside git, from the start of the session)"""
+        if self.is_git_repo():
+            _, porcelain = self._git("status --porcelain=v1 -z --untracked-files=all")
+            return sorted(self._parse_porcelain(porcelain))
+        current = FileManifest.scan(self.project_dir, self._session_manifest)
+        if self._session_manifest is None:
+            self._session_manifest = current
+            return []
+        delta = self._session_manifest.diff(current)
+        return sorted(delta["added"] + delta["modified"] + delta["removed"])
+
+    def changes_since_last_turn(self, max_chars: int = MAX_CHANGE_CONTEXT_CHARS) -> str:
+        """Describe changes since the previous call and make the current state the new baseline"""
+        current = self.snapshot()
+        previous, self.previous = self.previous, current
+        if current["kind"] == "git":
+            summary = self._describe_git(previous, current, max_chars)
+        else:
+            summary = self._describe_manifest(previous, current, max_chars)
+        return cap_text(summary, max_chars)
+
+    def _describe_git(self, previous: Optional[Dict[str, Any]], current: Dict[str, Any], max_chars: int) -> str:
+        pathspec = "-- . " + " ".join(EXCLUDED_PATHSPECS)
+        lines: List[str] = []
+
+        if previous is None or previous.get("kind") != "git":
+            # First turn: report outstanding uncommitted work against HEAD
+            if not current["status"]:
+                return ""
+            base = current["head"] or EMPTY_TREE_SHA
+            lines.append("Uncommitted changes (git status):")
+            lines.extend(f"  {code} {path}" for path, code in sorted(current["status"].items()))
+        else:
+            base = previous["ref"] or EMPTY_TREE_SHA
+            if previous["head"] != current["head"] and current["head"]:
+                lines.append(f"HEAD moved {str(previous['head'])[:8]} -> {current['head'][:8]}")
+                if previous["head"]:
+                    _, log = self._git(f"log --oneline -n {MAX_LOG_ENTRIES} {previous['head']}..{current['head']}")
+                    lines.extend(f"  {entry}" for entry in log.strip().splitlines())
+            new_untracked = sorted(p for p, c in current["status"].items()
+                                   if c == '??' and previous["status"].get(p) != '??')
+            if new_untracked:
+                lines.append("New untracked files: " + ", ".join(new_untracked))
+
+        _, stat = self._git(f"diff -M --stat=100 {base} {pathspec}")
+        _, diff = self._git(f"diff -M --no-color -U2 {base} {pathspec}")
+        if not stat.strip() and not lines:
+            return "No file changes since the previous turn."
+        if stat.strip():
+            lines.append("Diff stat:")
+            lines.append(stat.rstrip())
+        remaining = max_chars - len("\n".join(lines)) - 20
+        if diff.strip() and remaining > 200:
+            lines.append("Diff:")
+            lines.append(cap_text(diff.rstrip(), remaining))
+        return "\n".join(lines)
+
+    def _describe_manifest(self, previous: Optional[Dict[str, Any]], current: Dict[str, Any], max_chars: int) -> str:
+        manifest = current["manifest"]
+        if previous is None or previous.get("kind") != "manifest":
+            self._refresh_cache(manifest.entries)
+            return ""
+
+        delta = previous["manifest"].diff(manifest)
+        if not any(delta.values()):
+            return "No file changes since the previous turn."
+
+        lines = []
+        for label in ("added", "removed", "modified"):
+            if delta[label]:
+                lines.append(f"{label.capitalize()}: {', '.join(delta[label])}")
+        diffs = []
+        for rel in delta["modified"]:
+            old = self._content_cache.get(rel)
+            new = read_text(self.project_dir / rel)
+            if old is None or new is None:
+                continue
+            diffs.extend(difflib.unified_diff(old.splitlines(), new.splitlines(),
+                                              f"a/{rel}", f"b/{rel}", n=2, lineterm=""))
+        self._refresh_cache(delta["added"] + delta["modified"], dropped=delta["removed"])
+
+        remaining = max_chars - len("\n".join(lines)) - 20
+        if diffs and remaining > 200:
+            lines.append("Diff:")
+            lines.append(cap_text("\n".join(diffs), remaining))
+        return "\n".join(lines)
+
+    def _refresh_cache(self, paths, dropped: Optional[List[str]] = None):
+        """Keep small text files in memory so the next turn can diff against them"""
+        for rel in dropped or []:
+            self._content_cache.pop(rel, None)
+        used = sum(len(text) for text in self._content_cache.values())
+        for rel in paths:
+            path = self.project_dir / rel
+            try:
+                if path.stat().st_size > MAX_CACHED_FILE_BYTES:
+                    self._content_cache.pop(rel, None)
+                    continue
+            except OSError:
+                continue
+            text = read_text(path)
+            if text is None:
+                continue
+            used += len(text) - len(self._content_cache.get(rel, ""))
+            if used > MAX_CACHED_TOTAL_BYTES:
+                break
+            self._content_cache[rel] = text
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Warm-start Index Cache for ULCA
+Persists the file manifest and symbol table under .ulca/ so a new session starts
+from the last snapshot and re-indexes only files that changed, in the background.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from project_files import ULCA_CACHE_DIR, FileManifest
+from symbol_index import SymbolIndex
+
+# Configuration
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = "index_snapshot.json"
+
+
+class ProjectIndexCache:
+    """Loads, refreshes and saves the on-disk snapshot of project indexes"""
+
+    def __init__(self, project_dir: Path, symbol_index: SymbolIndex, cache_dir: Optional[Path] = None):
+        self.project_dir = Path(project_dir).resolve()
+        self.symbol_index = symbol_index
+        self.cache_dir = Path(cache_dir) if cache_dir else self.project_dir / ULCA_CACHE_DIR
+        self.snapshot_file = self.cache_dir / SNAPSHOT_FILE
+        self.manifest: Optional[FileManifest] = None
+        self.ready = threading.Event()
+        self.last_refresh: Dict[str, Any] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self) -> bool:
+        """Restore the last snapshot; False if missing, stale or from another version"""
+        if not self.snapshot_file.exists():
+            return False
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"⚠️  Ignoring unreadable index snapshot: {e}")
+            return False
+        if (snapshot.get("version") != SNAPSHOT_VERSION
+                or snapshot.get("project_directory") != str(self.project_dir)):
+            return False
+        self.manifest = FileManifest(self.project_dir, snapshot.get("manifest", {}))
+        self.symbol_index.load_state(snapshot.get("symbols", {}))
+        return True
+
+    def save(self):
+        """Write the current manifest and symbol table atomically"""
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "project_directory": str(self.project_dir),
+            "saved_at": datetime.now().isoformat(),
+            "manifest": self.manifest.entries if self.manifest else {},
+            "symbols": self.symbol_index.state()
+        }
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.snapshot_file.with_suffix(".json.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(tmp_file, self.snapshot_file)
+        except IOError as e:
+            print(f"⚠️  Could not save index snapshot: {e}")
+
+    def start(self):
+        """Load the snapshot now and validate/refresh it on a background thread"""
+        started = time.perf_counter()
+        warm = self.load()
+        self.last_refresh = {"warm_start": warm, "load_seconds": time.perf_counter() - started}
+        self._thread = threading.Thread(target=self._background_refresh, name="ulca-index-refresh", daemon=True)
+        self._thread.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"⚠️  Background index refresh failed: {e}")
+        finally:
+            self.ready.set()
+
+    def refresh(self) -> Dict[str, Any]:
+        """Validate against a fresh manifest scan and re-index only what changed"""
+        started = time.perf_counter()
+        previous = self.manifest
+        current = FileManifest.scan(self.project_dir, previous)
+        if previous is None:
+            stats = self.symbol_index.update()
+            changed = len(current)
+        else:
+            delta = previous.diff(current)
+            paths = delta["added"] + delta["modified"] + delta["removed"]
+            changed = len(paths)
+            stats = self.symbol_index.update(paths) if paths else {"parsed": 0, "removed": 0}
+        self.manifest = current
+        if changed or previous is None:
+            self.save()
+        self.last_refresh.update({
+            "changed_files": changed,
+            "parsed": stats["parsed"],
+            "refresh_seconds": time.perf_counter() - started
+        })
+        return self.last_refresh
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the background refresh has finished"""
+        if self._thread is None:
+            return True
+        return self.ready.wait(timeout)
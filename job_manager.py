@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Background Job Manager for ULCA
+Runs commands concurrently in a bounded pool with job IDs, cancellation and
+per-job wall time, CPU time and peak memory accounting.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from command_runner import OutputCallback, StreamingExecutor, kill_process_tree
+
+# Configuration
+MAX_CONCURRENT_JOBS = max(2, min(4, os.cpu_count() or 2))
+MAX_FINISHED_JOBS = 50  # Finished jobs kept for `jobs`/`wait`
+
+AttemptRecorder = Callable[[Dict[str, Any]], None]
+
+
+class JobManager:
+    """Runs shell commands as numbered background jobs"""
+
+    def __init__(self, executor: StreamingExecutor, on_output: Optional[OutputCallback] = None,
+                 record_attempt: Optional[AttemptRecorder] = None, max_workers: int = MAX_CONCURRENT_JOBS):
+        self.executor = executor
+        self.on_output = on_output
+        self.record_attempt = record_attempt
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ulca-job")
+        self.jobs: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def submit(self, command: str, **run_options) -> int:
+        """Queue a command and return its job ID"""
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            job = {
+                "id": job_id,
+                "command": command,
+                "status": "queued",
+                "submitted_at": datetime.now().isoformat(),
+                "started_at": None,
+                "process": None,
+                "result": None
+            }
+            # Submitted under the lock, so kill() never sees a job without its future
+            job["future"] = self.pool.submit(self._run_job, job, run_options)
+            self.jobs[job_id] = job
+            self._prune_finished()
+        return job_id
+
+    def _prune_finished(self):
+        finished = [j for j in self.jobs.values() if j["status"] not in ("queued", "running")]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self.jobs.pop(job["id"], None)
+
+    def _run_job(self, job: Dict[str, Any], run_options: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            if job["status"] == "killed":
+                return {}
+            job["status"] = "running"
+            job["started_at"] = datetime.now().isoformat()
+        prefix = f"[{job['id']}] "
+
+        def forward(stream: str, line: str):
+            if self.on_output:
+                self.on_output(stream, prefix + line)
+
+        def remember_process(process):
+            job["process"] = process
+
+        try:
+            result = self.executor.run(job["command"], on_output=forward,
+                                       popen_hook=remember_process, **run_options)
+        except Exception as e:
+            result = {"returncode": -1, "stdout": "", "stderr": f"Error executing command: {e}",
+                      "duration": 0.0, "cpu_time": None, "max_rss_kb": None, "log_path": None,
+                      "timed_out": False}
+
+        job["result"] = result
+        if job["status"] != "killed":
+            job["status"] = "done" if result["returncode"] == 0 else "failed"
+        job["process"] = None
+        forward("status", f"{job['status']} (exit {result['returncode']}, {result['duration']:.1f}s)")
+
+        if self.record_attempt:
+            self.record_attempt(self.attempt_record(job))
+        return result
+
+    @staticmethod
+    def attempt_record(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the build_attempts entry for a finished job"""
+        result = job["result"] or {}
+        return {
+            "job_id": job["id"],
+            "command": job["command"],
+            "status": job["status"],
+            "started_at": job["started_at"],
+            "returncode": result.get("returncode"),
+            "wall_time": round(result.get("duration", 0.0), 3),
+            "cpu_time": round(result["cpu_time"], 3) if result.get("cpu_time") is not None else None,
+            "max_rss_kb": result.get("max_rss_kb"),
+            "log_path": result.get("log_path")
+        }
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return sorted(self.jobs.values(), key=lambda job: job["id"])
+
+    def kill(self, job_id: int) -> bool:
+        """Cancel a queued job or terminate a running one"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] not in ("queued", "running"):
+                return False
+            previous = job["status"]
+            job["status"] = "killed"
+        if previous == "queued":
+            job["future"].cancel()
+            return True  # Cancelled, or _run_job sees "killed" and returns without starting
+        # The job may still be starting its process; give it a moment
+        deadline = time.monotonic() + 2
+        while job["process"] is None and job["result"] is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if job["process"] is not None:
+            kill_process_tree(job["process"], reaped_elsewhere=True)  # The job's run() loop reaps it
+        return True
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until a job finishes and return its result"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        future: Future = job["future"]
+        if future.cancelled():
+            return None
+        return future.result(timeout=timeout)
+
+    def running_count(self) -> int:
+        return sum(1 for job in self.jobs.values() if job["status"] in ("queued", "running"))
+
+    def shutdown(self):
+        """Kill outstanding jobs and stop the pool"""
+        for job in list(self.jobs.values()):
+            if job["status"] in ("queued", "running"):
+                self.kill(job["id"])
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Language tables shared by the GUI highlighter and the symbol indexer
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# File extension -> language name
+EXTENSION_LANGUAGES = {
+    '.py': 'python', '.pyw': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'javascript', '.tsx': 'javascript',
+    '.kt': 'kotlin', '.kts': 'kotlin',
+    '.java': 'java',
+    '.swift': 'swift'
+}
+
+# Keyword tables (also used by CodeEditor for highlighting)
+LANGUAGE_KEYWORDS: Dict[str, List[str]] = {
+    'python': ['def', 'class', 'import', 'from', 'as', 'if', 'else', 'elif',
+               'for', 'while', 'try', 'except', 'finally', 'with', 'return',
+               'True', 'False', 'None', 'self', 'lambda', 'yield', 'async', 'await'],
+    'javascript': ['function', 'const', 'let', 'var', 'if', 'else', 'for', 'while',
+                   'try', 'catch', 'finally', 'return', 'class', 'extends', 'import',
+                   'export', 'default', 'async', 'await', 'new', 'this', 'super'],
+    'java_kotlin': ['public', 'private', 'protected', 'class', 'interface', 'enum',
+                    'if', 'else', 'for', 'while', 'try', 'catch', 'finally', 'return',
+                    'new', 'this', 'super', 'static', 'final', 'abstract', 'extends',
+                    'implements', 'import', 'package', 'fun', 'val', 'var', 'when'],
+    'swift': ['func', 'class', 'struct', 'enum', 'protocol', 'extension',
+              'if', 'else', 'for', 'while', 'guard', 'defer', 'return',
+              'var', 'let', 'init', 'self', 'super', 'import', 'public',
+              'private', 'internal', 'final', 'override', 'convenience']
+}
+
+# Keyword table used for each language
+KEYWORD_TABLES = {
+    'python': 'python',
+    'javascript': 'javascript',
+    'kotlin': 'java_kotlin',
+    'java': 'java_kotlin',
+    'swift': 'swift'
+}
+
+# Control-flow words that look like calls/definitions to the regexes below
+_CONTROL_WORDS = {'if', 'for', 'while', 'switch', 'catch', 'return', 'when', 'guard', 'else', 'do', 'try'}
+
+_JAVA_MODIFIERS = r'(?:(?:public|private|protected|static|final|abstract|synchronized|native|default)\s+)'
+
+# Definition patterns per language: (kind, regex with one named group "name")
+DEFINITION_PATTERNS = {
+    'javascript': [
+        ('class', re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+(?P<name>[A-Za-z_$][\w$]*)')),
+        ('interface', re.compile(r'^\s*(?:export\s+)?(?:interface|type|enum)\s+(?P<name>[A-Za-z_$][\w$]*)')),
+        ('function', re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(?P<name>[A-Za-z_$][\w$]*)')),
+        ('function', re.compile(r'^\s*(?:export\s+)?(?:const|let|var)\s+(?P<name>[A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)')),
+        ('method', re.compile(r'^\s+(?:(?:public|private|protected|static|async|get|set|readonly)\s+)*(?P<name>[A-Za-z_$][\w$]*)\s*\([^)]*\)\s*(?::\s*[^{]+)?\{')),
+    ],
+    'java': [
+        ('class', re.compile(r'^\s*' + _JAVA_MODIFIERS + r'*(?:class|interface|enum|record)\s+(?P<name>[A-Za-z_]\w*)')),
+        ('method', re.compile(r'^\s*' + _JAVA_MODIFIERS + r'*(?:<[^>]+>\s+)?[\w<>\[\],.?\s]+?\s+(?P<name>[A-Za-z_]\w*)\s*\([^;]*$')),
+    ],
+    'kotlin': [
+        ('class', re.compile(r'^\s*(?:(?:public|private|internal|protected|open|abstract|sealed|data|enum|inner|annotation)\s+)*(?:class|interface|object)\s+(?P<name>[A-Za-z_]\w*)')),
+        ('function', re.compile(r'^\s*(?:(?:public|private|internal|protected|open|override|suspend|inline|operator|infix|tailrec)\s+)*fun\s+(?:<[^>]+>\s*)?(?:[\w.]+\.)?(?P<name>[A-Za-z_]\w*)')),
+    ],
+    'swift': [
+        ('class', re.compile(r'^\s*(?:(?:public|private|internal|fileprivate|open|final)\s+)*(?:class|struct|enum|protocol|extension|actor)\s+(?P<name>[A-Za-z_]\w*)')),
+        ('function', re.compile(r'^\s*(?:(?:public|private|internal|fileprivate|open|final|override|static|class|mutating|convenience|@\w+)\s+)*func\s+(?P<name>[A-Za-z_]\w*)')),
+    ],
+}
+
+# Import patterns per language: regex with one named group "module"
+IMPORT_PATTERNS = {
+    'javascript': [
+        re.compile(r'^\s*import\s+(?:[^\'"]+\s+from\s+)?[\'"](?P<module>[^\'"]+)[\'"]'),
+        re.compile(r'require\(\s*[\'"](?P<module>[^\'"]+)[\'"]\s*\)'),
+        re.compile(r'^\s*export\s+[^\'"]*\s+from\s+[\'"](?P<module>[^\'"]+)[\'"]'),
+    ],
+    'java': [re.compile(r'^\s*import\s+(?:static\s+)?(?P<module>[\w.]+(?:\.\*)?)\s*;')],
+    'kotlin': [re.compile(r'^\s*import\s+(?P<module>[\w.]+(?:\.\*)?)')],
+    'swift': [re.compile(r'^\s*(?:@testable\s+)?import\s+(?:(?:class|struct|func|enum|protocol)\s+)?(?P<module>[\w.]+)')],
+}
+
+
+def language_for_path(path: str) -> Optional[str]:
+    """Return the language name for a file path, or None if unsupported"""
+    return EXTENSION_LANGUAGES.get(Path(path).suffix.lower())
+
+
+def keywords_for_language(language: str) -> List[str]:
+    """Return the keyword table for a language"""
+    return LANGUAGE_KEYWORDS.get(KEYWORD_TABLES.get(language, ''), [])
+
+
+def is_control_word(word: str) -> bool:
+    """True for words the definition regexes must never treat as names"""
+    return word in _CONTROL_WORDS
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Ollama Endpoint Pool for ULCA
+Spreads model requests over several Ollama hosts. Each request goes to the
+healthy host with the fewest outstanding requests that has the model, except
+that a conversation stays on the host it used last while that host has a free
+slot, so Ollama can reuse its KV cache. A host that fails a request is taken out
+of rotation until a periodic /api/tags probe, or a request sent because no host
+is up, finds it answering again; the probe also tells which models each host has. Hosts configured without an explicit
+"parallel" get a ConcurrencyController that learns how many requests they serve
+best at once.
+"""
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+import requests
+
+from concurrency_control import ADAPTIVE_CONCURRENCY, ADAPTIVE_MAX_CONCURRENCY, ConcurrencyController, ConcurrencyStore
+from llm_scheduler import LLM_MAX_IN_FLIGHT, LLMPreempted, shared_scheduler
+
+# Configuration
+OLLAMA_ENDPOINTS = os.environ.get("ULCA_OLLAMA_ENDPOINTS", "")  # Comma-separated base URLs added to OLLAMA_API_BASE; "url=2" fixes parallel
+PROBE_INTERVAL = 30  # Seconds between /api/tags probes when there is more than one endpoint
+PROBE_TIMEOUT = 5
+LATENCY_SAMPLES = 200  # Recent request durations kept per endpoint
+GENERATE_PATH = "/api/generate"
+TAGS_PATH = "/api/tags"
+
+EndpointSpec = Union[str, Dict[str, Any]]  # "http://host:11434" or {"url": ..., "parallel": 2}
+Usage = Dict[str, Any]  # Filled by the caller with Ollama's eval_count once the response is read
+
+
+def base_url(url: str) -> str:
+    """http://host:11434 from any URL of an Ollama server, including .../api/generate"""
+    url = url.strip().rstrip("/")
+    index = url.find("/api/")
+    if index != -1:
+        return url[:index]
+    return url[:-4] if url.endswith("/api") else url
+
+
+class Endpoint:
+    """One Ollama host: its health, models, load and request timings"""
+
+    def __init__(self, url: str, parallel: int = LLM_MAX_IN_FLIGHT,
+                 controller: Optional[ConcurrencyController] = None):
+        self.url = base_url(url)
+        self.controller = controller  # None when "parallel" was configured
+        # Requests it serves at once: configured, or the limit the controller has learned
+        self.parallel = controller.limit if controller else max(1, parallel)
+        self.healthy = True  # Until a request or a probe fails
+        self.models: Optional[Set[str]] = None  # Unknown until the first successful probe
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = ""
+        self.probed_at: Optional[str] = None
+        self.probe_latency: Optional[float] = None
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    @property
+    def generate_url(self) -> str:
+        return self.url + GENERATE_PATH
+
+    def has_model(self, model: str) -> bool:
+        return self.models is None or model in self.models or f"{model}:latest" in self.models
+
+    def mean_latency(self) -> float:
+        return statistics.mean(self.latencies) if self.latencies else 0.0
+
+    @property
+    def max_parallel(self) -> int:
+        return self.controller.max_limit if self.controller else self.parallel
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "models": sorted(self.models) if self.models is not None else None,
+            "parallel": self.parallel,
+            "adaptive": self.controller.learned() if self.controller else None,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_mean": round(self.mean_latency(), 3),
+            "latency_p50": round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+            "latency_p95": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else 0.0,
+            "probe_latency": self.probe_latency,
+            "probed_at": self.probed_at,
+            "last_error": self.last_error
+        }
+
+
+class EndpointPool:
+    """Routes requests across endpoints and keeps their health current"""
+
+    def __init__(self, specs: Iterable[EndpointSpec], on_capacity: Optional[Callable[[int], None]] = None,
+                 store: Optional[ConcurrencyStore] = None):
+        self.endpoints: List[Endpoint] = []
+        self.on_capacity = on_capacity
+        self.store = store  # Learned limits are only persisted when a store is given
+        self._lock = threading.Lock()
+        self._sticky: Dict[str, str] = {}  # conversation -> endpoint URL
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+        for spec in specs:
+            self.add(spec)
+
+    def add(self, spec: EndpointSpec) -> Endpoint:
+        """Add an endpoint unless its URL is already in the pool"""
+        url, parallel = (spec, None) if isinstance(spec, str) else (spec["url"], spec.get("parallel"))
+        with self._lock:
+            for endpoint in self.endpoints:
+                if endpoint.url == base_url(url):
+                    return endpoint
+            controller = None
+            if parallel is None and ADAPTIVE_CONCURRENCY:
+                learned = self.store.get(base_url(url)) if self.store else None
+                controller = ConcurrencyController(LLM_MAX_IN_FLIGHT, ADAPTIVE_MAX_CONCURRENCY, learned)
+            endpoint = Endpoint(url, parallel or LLM_MAX_IN_FLIGHT, controller)
+            self.endpoints.append(endpoint)
+            start_prober = len(self.endpoints) > 1 and self._prober is None
+        self._capacity_changed()
+        if start_prober:
+            self.start()
+        return endpoint
+
+    def _serving(self) -> List[Endpoint]:
+        # With every endpoint down, requests still go out (see _choose), so they all count
+        return [endpoint for endpoint in self.endpoints if endpoint.healthy] or self.endpoints
+
+    @property
+    def capacity(self) -> int:
+        """Requests the healthy endpoints serve at once"""
+        return max(1, sum(endpoint.parallel for endpoint in self._serving()))
+
+    def max_concurrency(self) -> int:
+        """The most requests the healthy endpoints could be asked to serve at once"""
+        return max(1, sum(endpoint.max_parallel for endpoint in self._serving()))
+
+    def batch_concurrency(self) -> int:
+        """Workers for a batch run: the current capacity plus one, so an adaptive endpoint can try another slot"""
+        with self._lock:
+            adaptive = any(endpoint.controller for endpoint in self._serving())
+            return min(self.capacity + 1, self.max_concurrency()) if adaptive else self.capacity
+
+    def _capacity_changed(self):
+        if self.on_capacity:
+            self.on_capacity(self.capacity)
+
+    def _choose(self, model: str, conversation: Optional[str], tried: Iterable[str]) -> Endpoint:
+        untried = [endpoint for endpoint in self.endpoints if endpoint.url not in tried] or self.endpoints
+        with_model = [endpoint for endpoint in untried if endpoint.has_model(model)] or untried
+        # With every host marked down, try anyway: a probe may simply not have run since it came back
+        candidates = [endpoint for endpoint in with_model if endpoint.healthy] or with_model
+        sticky = self._sticky.get(conversation or "")
+        for endpoint in candidates:
+            if endpoint.url == sticky and endpoint.outstanding < endpoint.parallel:
+                return endpoint
+        chosen = min(candidates, key=lambda endpoint: (endpoint.outstanding / endpoint.parallel,
+                                                       endpoint.mean_latency()))
+        if conversation:
+            self._sticky[conversation] = chosen.url
+        return chosen
+
+    def has_untried(self, tried: Iterable[str]) -> bool:
+        """Whether a healthy endpoint not yet tried for this request remains"""
+        return any(endpoint.healthy and endpoint.url not in tried for endpoint in self.endpoints)
+
+    @contextmanager
+    def request(self, model: str, conversation: Optional[str] = None,
+                tried: Optional[Set[str]] = None, usage: Optional[Usage] = None) -> Iterator[Endpoint]:
+        """Route one request and account for it; any error except preemption counts against the endpoint"""
+        with self._lock:
+            endpoint = self._choose(model, conversation, tried or ())
+            endpoint.outstanding += 1
+            if endpoint.controller:
+                endpoint.controller.on_start(endpoint.outstanding)
+        if tried is not None:
+            tried.add(endpoint.url)
+        started = time.monotonic()
+        seconds: Optional[float] = None
+        error: Optional[Exception] = None
+        try:
+            yield endpoint
+            seconds = time.monotonic() - started
+        except LLMPreempted:
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(endpoint, seconds, error, (usage or {}).get("eval_count"))
+
+    def _finish(self, endpoint: Endpoint, seconds: Optional[float], error: Optional[Exception],
+                tokens: Optional[int] = None):
+        limit = None
+        windows = 0
+        with self._lock:
+            if endpoint.controller:
+                windows = endpoint.controller.windows
+                limit = endpoint.controller.on_finish(endpoint.outstanding, tokens, seconds, error is not None)
+                if limit is not None:
+                    endpoint.parallel = limit
+            endpoint.outstanding -= 1
+            endpoint.requests += 1
+            was_healthy = endpoint.healthy
+            if seconds is not None:
+                endpoint.latencies.append(seconds)
+            if error is not None:
+                endpoint.failures += 1
+                endpoint.last_error = str(error)[:200]
+                endpoint.healthy = False
+            elif seconds is not None:
+                endpoint.healthy = True  # It answered; without a prober this is the only way back
+        if limit is not None:
+            print(f"🎚️  Ollama endpoint {endpoint.url} now takes {limit} request(s) at a time")
+        if self.store and endpoint.controller and (limit is not None or endpoint.controller.windows != windows):
+            self.store.save(endpoint.url, endpoint.controller.learned())
+        if error is not None and was_healthy:
+            print(f"🔌 Ollama endpoint {endpoint.url} failed; routing around it until it answers again")
+            self._capacity_changed()
+        elif limit is not None or endpoint.healthy != was_healthy:
+            self._capacity_changed()
+
+    def probe(self, endpoint: Endpoint):
+        """Ask an endpoint for its models; success marks it healthy again"""
+        started = time.monotonic()
+        try:
+            response = requests.get(endpoint.url + TAGS_PATH, timeout=PROBE_TIMEOUT)
+            response.raise_for_status()
+            models = {model["name"] for model in response.json().get("models", [])}
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            healthy, models, error = False, endpoint.models, f"probe: {e}"
+        else:
+            healthy, error = True, endpoint.last_error
+        with self._lock:
+            changed = endpoint.healthy != healthy
+            endpoint.healthy = healthy
+            endpoint.models = models
+            endpoint.last_error = error[:200]
+            endpoint.probed_at = datetime.now().isoformat()
+            endpoint.probe_latency = round(time.monotonic() - started, 3) if healthy else None
+        if changed:
+            self._capacity_changed()
+
+    def probe_all(self):
+        for endpoint in list(self.endpoints):
+            self.probe(endpoint)
+
+    def start(self):
+        """Probe every endpoint now and then every PROBE_INTERVAL seconds on a daemon thread"""
+        def run():
+            while not self._stop.is_set():
+                self.probe_all()
+                self._stop.wait(PROBE_INTERVAL)
+
+        self._prober = threading.Thread(target=run, name="ulca-endpoint-probe", daemon=True)
+        self._prober.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+
+_shared: Optional[EndpointPool] = None
+_shared_lock = threading.Lock()
+
+
+def parse_endpoints(setting: str) -> List[EndpointSpec]:
+    """Specs from a comma-separated list where "http://host:11434=2" sets parallel to 2"""
+    specs: List[EndpointSpec] = []
+    for item in setting.split(","):
+        url, _, parallel = item.strip().partition("=")
+        if url:
+            specs.append({"url": url, "parallel": int(parallel)} if parallel else url)
+    return specs
+
+
+def shared_pool(default_url: str) -> EndpointPool:
+    """The process-wide pool: default_url plus ULCA_OLLAMA_ENDPOINTS; it sizes the shared scheduler and saves learned limits
+
+    Hosts come only from this global setting, never from a project's context, because every
+    project in the daemon shares the pool.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            specs = [default_url] + parse_endpoints(OLLAMA_ENDPOINTS)
+            _shared = EndpointPool(specs, on_capacity=shared_scheduler().set_capacity, store=ConcurrencyStore())
+        return _shared
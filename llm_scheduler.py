@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+LLM Request Scheduling for ULCA
+Every model request takes a slot from one process-wide scheduler before it is
+sent, so agents, map runs, TODO runs and background digests share Ollama instead
+of racing for it. Slots are capped at what Ollama serves in parallel. Waiting
+requests are granted by priority class, round-robin across projects within a
+class, and a request with a user waiting on it preempts batch or background
+work when every slot is busy: the preempted generation is cancelled and queued again.
+"""
+
+import asyncio
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional
+
+# Configuration
+LLM_MAX_IN_FLIGHT = int(os.environ.get("OLLAMA_NUM_PARALLEL") or 1)  # Ollama queues anything beyond its own limit
+WAIT_SAMPLES = 500  # Recent wait times kept per class
+
+INTERACTIVE = "interactive"
+CONFIRMATION = "confirmation"  # Follow-up generation after the user approved something
+BATCH = "batch"  # map, todo run, fix
+BACKGROUND = "background"  # File digests, model preloading
+PRIORITIES = (INTERACTIVE, CONFIRMATION, BATCH, BACKGROUND)  # Highest first
+PREEMPTING = (INTERACTIVE, CONFIRMATION)  # A user is waiting for these
+PREEMPTIBLE = (BATCH, BACKGROUND)
+
+
+class LLMPreempted(Exception):
+    """A batch or background request gave its slot to an interactive one and has to be queued again"""
+
+
+class LLMTicket:
+    """One request's place in the scheduler, from queueing until its slot is released"""
+
+    def __init__(self, project: str, priority: str):
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown LLM priority {priority!r}")
+        self.project = project
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.preempted = False  # Set by the scheduler; the holder stops at its next streamed chunk
+        self._wake: Callable[[], None] = lambda: None
+
+    @property
+    def preemptible(self) -> bool:
+        return self.priority in PREEMPTIBLE
+
+
+class LLMScheduler:
+    """Priority classes with per-project round-robin in front of a fixed number of Ollama slots"""
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT):
+        self.max_in_flight = max(1, max_in_flight)
+        self._lock = threading.Lock()
+        # class -> project -> waiting tickets; dict order is the round-robin order of projects
+        self._queues: Dict[str, Dict[str, Deque[LLMTicket]]] = {priority: {} for priority in PRIORITIES}
+        self._running: List[LLMTicket] = []
+        self._waits: Dict[str, Deque[float]] = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+        self._granted = {priority: 0 for priority in PRIORITIES}
+        self.preemptions = 0
+        self.peak_queued = 0
+
+    def set_capacity(self, max_in_flight: int):
+        """Change the number of slots, e.g. when an Ollama endpoint goes down or comes back"""
+        with self._lock:
+            self.max_in_flight = max(1, max_in_flight)
+            self._dispatch()
+
+    def _queued(self, priorities=PRIORITIES) -> int:
+        return sum(len(waiting) for priority in priorities for waiting in self._queues[priority].values())
+
+    def _enqueue(self, ticket: LLMTicket):
+        with self._lock:
+            self._queues[ticket.priority].setdefault(ticket.project, deque()).append(ticket)
+            self.peak_queued = max(self.peak_queued, self._queued())
+            self._preempt_for(ticket)
+            self._dispatch()
+
+    def _preempt_for(self, ticket: LLMTicket):
+        if ticket.priority not in PREEMPTING or len(self._running) < self.max_in_flight:
+            return
+        # One victim per waiting user request, counting victims that have not stopped yet
+        if sum(1 for running in self._running if running.preempted) >= self._queued(PREEMPTING):
+            return
+        victims = [running for running in self._running if running.preemptible and not running.preempted]
+        if victims:
+            # Background before batch, and the most recent start loses the least work
+            victim = max(victims, key=lambda running: (PRIORITIES.index(running.priority), running.granted_at))
+            victim.preempted = True
+            self.preemptions += 1
+
+    def _next(self) -> Optional[LLMTicket]:
+        for priority in PRIORITIES:
+            projects = self._queues[priority]
+            for project, waiting in projects.items():
+                ticket = waiting.popleft()
+                del projects[project]
+                if waiting:
+                    projects[project] = waiting  # Back of the rotation
+                return ticket
+        return None
+
+    def _dispatch(self):
+        while len(self._running) < self.max_in_flight:
+            ticket = self._next()
+            if ticket is None:
+                return
+            ticket.granted_at = time.monotonic()
+            self._running.append(ticket)
+            self._waits[ticket.priority].append(ticket.granted_at - ticket.enqueued_at)
+            self._granted[ticket.priority] += 1
+            ticket._wake()
+
+    def acquire(self, project: str, priority: str = INTERACTIVE) -> LLMTicket:
+        """Block until a slot is granted"""
+        ticket = LLMTicket(project, priority)
+        granted = threading.Event()
+        ticket._wake = granted.set
+        self._enqueue(ticket)
+        try:
+            granted.wait()
+        except BaseException:
+            self.release(ticket)  # Interrupted while queued
+            raise
+        return ticket
+
+    async def aacquire(self, project: str, priority: str = INTERACTIVE) -> LLMTicket:
+        """acquire for coroutines; threads and event loops share the same slots"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        ticket = LLMTicket(project, priority)
+        ticket._wake = lambda: loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+        self._enqueue(ticket)
+        try:
+            await granted
+        except BaseException:
+            self.release(ticket)  # Cancelled while queued, or just after the grant
+            raise
+        return ticket
+
+    def release(self, ticket: LLMTicket):
+        """Give back a slot, or leave the queue if it was never granted"""
+        with self._lock:
+            if ticket in self._running:
+                self._running.remove(ticket)
+            else:
+                waiting = self._queues[ticket.priority].get(ticket.project)
+                if waiting and ticket in waiting:
+                    waiting.remove(ticket)
+                    if not waiting:
+                        del self._queues[ticket.priority][ticket.project]
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, project: str, priority: str = INTERACTIVE) -> Iterator[LLMTicket]:
+        ticket = self.acquire(project, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, project: str, priority: str = INTERACTIVE) -> AsyncIterator[LLMTicket]:
+        ticket = await self.aacquire(project, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def metrics(self) -> Dict[str, object]:
+        """Queue depth, running requests and wait times per priority class"""
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": len(self._running),
+                "running": {priority: sum(1 for ticket in self._running if ticket.priority == priority)
+                            for priority in PRIORITIES},
+                "queued": {priority: self._queued((priority,)) for priority in PRIORITIES},
+                "peak_queued": self.peak_queued,
+                "granted": dict(self._granted),
+                "wait_mean": {priority: round(statistics.mean(waits), 3) if waits else 0.0
+                              for priority, waits in self._waits.items()},
+                "wait_max": {priority: round(max(waits), 3) if waits else 0.0 for priority, waits in self._waits.items()},
+                "preemptions": self.preemptions
+            }
+
+
+_shared: Optional[LLMScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler() -> LLMScheduler:
+    """The process-wide scheduler: every agent in a process talks to the same Ollama"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LLMScheduler()
+        return _shared
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Build and Test Log Distiller for ULCA
+Streams over command output and keeps only what explains a failure: error blocks,
+stack traces, file:line references and the first failing test, deduplicated and
+capped to a token budget before it reaches the prompt.
+"""
+
+import os
+import re
+import shlex
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Pattern, Tuple
+
+# Configuration
+FAILURE_CONTEXT_TOKENS = 1500
+CHARS_PER_TOKEN = 4  # Rough estimate; good enough for budgeting prompt sections
+MAX_BLOCK_LINES = 30
+MAX_STORED_BLOCKS = 100
+MAX_LOCATIONS = 15
+MAX_FAILING_TESTS = 50
+FALLBACK_TAIL_LINES = 40
+
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')
+# Volatile tokens that make otherwise identical errors look different
+VOLATILE = re.compile(r'0x[0-9a-fA-F]+|\b\d+(\.\d+)?\s?(ms|s|sec|secs|seconds)\b|\d{2}:\d{2}:\d{2}(\.\d+)?')
+LOCATION = re.compile(
+    r'(?:File "(?P<py_path>[^"]+)", line (?P<py_line>\d+))'
+    r'|(?P<path>(?:[A-Za-z]:)?[\w./\\-]*[\w-]\.(?:py|js|jsx|mjs|cjs|ts|tsx|java|kt|kts|rs|swift|m|mm|dart|go|c|cc|cpp|h|hpp|gradle))'
+    r'(?::|\(|:\s?line\s)(?P<line>\d+)'
+)
+
+
+class LogMatcher:
+    """Recognises one toolchain's error output; subclass and register_matcher() to add more"""
+
+    name = "generic"
+    commands: Tuple[str, ...] = ()  # Command words that select this matcher
+    start_patterns: List[Pattern] = [
+        re.compile(r'^Traceback \(most recent call last\)'),
+        re.compile(r'\b(error|ERROR|Error|FAILED|FAILURE|Fatal|fatal|panic|Exception)\b'),
+    ]
+    continuation_patterns: List[Pattern] = [
+        re.compile(r'^\s+\S'),  # Indented stack frames / source excerpts
+        re.compile(r'^\w+(\.\w+)*(Error|Exception)\b'),
+        re.compile(r'^Caused by:'),
+    ]
+    failing_test_patterns: List[Pattern] = []
+    context_after = 0  # Lines always kept after a block starts (source excerpt, caret)
+
+    def selects(self, command: str) -> bool:
+        words = re.split(r'[\s;&|]+', command.strip())
+        return any(word.split('/')[-1] in self.commands for word in words)
+
+    def starts_block(self, line: str) -> bool:
+        return any(p.search(line) for p in self.start_patterns)
+
+    def continues_block(self, line: str) -> bool:
+        return any(p.search(line) for p in self.continuation_patterns)
+
+    def failing_test(self, line: str) -> Optional[str]:
+        for pattern in self.failing_test_patterns:
+            match = pattern.search(line)
+            if match:
+                return match.group(1).strip()
+        return None
+
+    def narrow_command(self, command: str, failing_tests: List[str], cwd: str = ".") -> Optional[str]:
+        """A command re-running only the given failing tests, or None if the tool can't"""
+        return None
+
+
+class PytestMatcher(LogMatcher):
+    name = "pytest"
+    commands = ("pytest", "py.test", "tox", "nox")
+    start_patterns = [
+        re.compile(r'^E\s'),
+        re.compile(r'^>\s'),
+        re.compile(r'^\S+\.py:\d+: \w*(Error|Exception|Failed|Exit)\b'),
+        re.compile(r'^(FAILED|ERROR) \S+'),
+        re.compile(r'^Traceback \(most recent call last\)'),
+        re.compile(r'^_+ ERROR collecting'),
+    ]
+    continuation_patterns = [re.compile(r'^E\s'), re.compile(r'^\s+\S'), re.compile(r'^\w+(Error|Exception)\b')]
+    failing_test_patterns = [re.compile(r'^FAILED (\S+)'), re.compile(r'^ERROR (\S+)')]
+
+    def narrow_command(self, command, failing_tests, cwd="."):
+        nodes = [t for t in failing_tests if t.split("::")[0].endswith(".py")]
+        if not nodes or any(c in command for c in "|;&"):
+            return None
+        # Drop positional test paths; keep options such as -q or -x
+        words = [w for w in shlex.split(command) if not os.path.exists(os.path.join(cwd, w.split("::")[0])) or w.startswith("-")]
+        return " ".join(shlex.quote(w) for w in words + nodes)
+
+
+class NpmMatcher(LogMatcher):
+    name = "npm/tsc"
+    commands = ("npm", "npx", "yarn", "pnpm", "tsc", "node", "jest", "vitest", "eslint")
+    start_patterns = [
+        re.compile(r'error TS\d+:'),
+        re.compile(r'^npm (ERR!|error)'),
+        re.compile(r'^\s*(\w*Error|AssertionError)(\s\[\w+\])?:'),
+        re.compile(r'^\s*●\s'),
+        re.compile(r'^\s*\d+:\d+\s+error\s'),  # eslint
+        re.compile(r'\berror\b.*\bin\b.*\.(js|ts|tsx|jsx)'),
+    ]
+    continuation_patterns = [re.compile(r'^\s+at '), re.compile(r'^\s+(Expected|Received)'), re.compile(r'^\s+>?\s*\d+ \|')]
+    failing_test_patterns = [re.compile(r'^\s*●\s+(.+?)\s*$'), re.compile(r'^\s*✕\s+(.+?)(\s+\(\d+\s?ms\))?$')]
+    context_after = 1
+
+
+class GradleMatcher(LogMatcher):
+    name = "gradle/javac"
+    commands = ("gradle", "gradlew", "mvn", "mvnw", "javac", "java", "kotlinc")
+    start_patterns = [
+        re.compile(r'\.(java|kt|kts):\d+: error:'),
+        re.compile(r'^e: '),
+        re.compile(r'^\* What went wrong:'),
+        re.compile(r'^FAILURE: Build failed'),
+        re.compile(r'^\[ERROR\]'),
+        re.compile(r'^Exception in thread'),
+        re.compile(r'^\S+(Exception|Error)(: |$)'),
+        re.compile(r'\bFAILED$'),
+    ]
+    continuation_patterns = [
+        re.compile(r'^\s+at '), re.compile(r'^Caused by:'), re.compile(r'^\s+\^'),
+        re.compile(r'^\s+\.\.\. \d+ more'), re.compile(r'^> '), re.compile(r'^\s+(symbol|location|required|found|reason):')
+    ]
+    failing_test_patterns = [re.compile(r'^(\S+ > \S+(?:\(\))?) FAILED'), re.compile(r'^\[ERROR\]\s+(\S+)\s+Time elapsed.*FAILURE')]
+    context_after = 2
+
+    def narrow_command(self, command, failing_tests, cwd="."):
+        tests = [t.replace(" > ", ".").rstrip("()") for t in failing_tests if " > " in t]
+        if not tests or "gradle" not in command or " test" not in command:
+            return None
+        return command + "".join(f" --tests {shlex.quote(t)}" for t in tests)
+
+
+class CargoMatcher(LogMatcher):
+    name = "cargo"
+    commands = ("cargo", "rustc")
+    start_patterns = [
+        re.compile(r'^error(\[E\d+\])?:'),
+        re.compile(r"^thread '.+' panicked at"),
+        re.compile(r'^---- \S+ stdout ----'),
+    ]
+    continuation_patterns = [re.compile(r'^\s*(-->|\||\d+\s+\||= )'), re.compile(r'^\s+\S')]
+    failing_test_patterns = [re.compile(r'^---- (\S+) stdout ----'), re.compile(r'^test (\S+) \.\.\. FAILED')]
+
+    def narrow_command(self, command, failing_tests, cwd="."):
+        # cargo test takes a single name filter
+        if len(failing_tests) != 1 or not re.match(r'^cargo test\b', command.strip()) or " -- " in command:
+            return None
+        return f"{command} {shlex.quote(failing_tests[0])}"
+
+
+class XcodebuildMatcher(LogMatcher):
+    name = "xcodebuild"
+    commands = ("xcodebuild", "swift", "xcrun", "swiftc")
+    start_patterns = [
+        re.compile(r':\d+:\d+: (fatal )?error: '),
+        re.compile(r'^\*\* (BUILD|TEST|ARCHIVE) FAILED \*\*'),
+        re.compile(r'^error: '),
+        re.compile(r"^Test Case '.+' failed"),
+        re.compile(r'^Fatal error: '),
+    ]
+    continuation_patterns = [re.compile(r'^\s+\^'), re.compile(r'^\s+\S')]
+    failing_test_patterns = [re.compile(r"^Test Case '-\[(\S+ \S+)\]' failed"), re.compile(r'error: -\[(\S+ \S+)\]')]
+    context_after = 2
+
+
+class FlutterMatcher(LogMatcher):
+    name = "flutter"
+    commands = ("flutter", "dart")
+    start_patterns = [
+        re.compile(r'\.dart:\d+:\d+: Error:'),
+        re.compile(r'^\s*error • '),
+        re.compile(r'^Error: '),
+        re.compile(r'EXCEPTION CAUGHT BY'),
+        re.compile(r'^FAILURE: Build failed'),
+        re.compile(r'\[E\]$'),
+    ]
+    continuation_patterns = [re.compile(r'^#\d+\s'), re.compile(r'^\s+\S'), re.compile(r'^\s*\^')]
+    failing_test_patterns = [re.compile(r'^\d+:\d+ \+\d+(?: ~\d+)?(?: -\d+)?: (.+?) \[E\]$')]
+    context_after = 2
+
+
+MATCHERS: List[LogMatcher] = [
+    PytestMatcher(), NpmMatcher(), GradleMatcher(), CargoMatcher(), XcodebuildMatcher(), FlutterMatcher()
+]
+GENERIC_MATCHER = LogMatcher()
+
+
+def register_matcher(matcher: LogMatcher, first: bool = True):
+    """Add a toolchain matcher; earlier matchers win when several select a command"""
+    if first:
+        MATCHERS.insert(0, matcher)
+    else:
+        MATCHERS.append(matcher)
+
+
+def matcher_for_command(command: str) -> LogMatcher:
+    for matcher in MATCHERS:
+        if matcher.selects(command):
+            return matcher
+    return GENERIC_MATCHER
+
+
+class LogDistiller:
+    """Incrementally distils a command's output; feed() matches the OutputCallback signature"""
+
+    def __init__(self, command: str, matcher: Optional[LogMatcher] = None):
+        self.command = command
+        self.matcher = matcher or matcher_for_command(command)
+        self.blocks: "OrderedDict[str, Dict]" = OrderedDict()  # normalized text -> block
+        self.locations: "OrderedDict[str, None]" = OrderedDict()
+        self.failing_tests: "OrderedDict[str, None]" = OrderedDict()
+        self.total_lines = 0
+        self.dropped_blocks = 0
+        self.tail: List[str] = []
+        self._current: Optional[List[list]] = None  # [line, repeat count] pairs
+        self._after = 0
+
+    def feed(self, stream: str, line: str):
+        """Consume one output line"""
+        line = ANSI_ESCAPE.sub('', line).rstrip()
+        self.total_lines += 1
+        self.tail.append(line)
+        if len(self.tail) > FALLBACK_TAIL_LINES:
+            del self.tail[0]
+        if not line.strip():
+            if self._current is not None and self._after <= 0:
+                self._close_block()
+            return
+
+        if len(self.failing_tests) < MAX_FAILING_TESTS:
+            test = self.matcher.failing_test(line)
+            if test:
+                self.failing_tests.setdefault(test, None)
+        if len(self.locations) < MAX_LOCATIONS * 4:
+            self._collect_locations(line)
+
+        if self._current is not None:
+            # Fixed context (source excerpt, caret) never swallows the next error
+            if self.matcher.continues_block(line) or (self._after > 0 and not self.matcher.starts_block(line)):
+                self._after -= 1
+                self._append(line)
+                return
+            self._close_block()
+
+        if self.matcher.starts_block(line):
+            self._current = [[line, 1]]
+            self._after = self.matcher.context_after
+
+    @property
+    def failing_test(self) -> Optional[str]:
+        return next(iter(self.failing_tests), None)
+
+    def error_signature(self) -> FrozenSet[str]:
+        """Normalized error blocks, for telling whether a fix attempt made progress"""
+        if self._current is not None:
+            self._close_block()
+        return frozenset(self.blocks)
+
+    def narrow_command(self, cwd: str = ".") -> Optional[str]:
+        """Re-run only the failing tests, when the toolchain supports selecting them"""
+        return self.matcher.narrow_command(self.command, list(self.failing_tests), str(cwd))
+
+    def feed_text(self, text: str):
+        for line in text.splitlines():
+            self.feed("stdout", line)
+
+    def _append(self, line: str):
+        if self._current[-1][0] == line:
+            self._current[-1][1] += 1  # Collapse runs of an identical line
+        elif len(self._current) < MAX_BLOCK_LINES:
+            self._current.append([line, 1])
+        elif len(self._current) == MAX_BLOCK_LINES:
+            self._current.append(["    ...", 1])
+
+    def _close_block(self):
+        block, self._current, self._after = self._current, None, 0
+        if not block:
+            return
+        lines = [text if count == 1 else f"{text}  [repeated {count} times]" for text, count in block]
+        key = VOLATILE.sub('#', "\n".join(lines))
+        if key in self.blocks:
+            self.blocks[key]["count"] += 1
+        elif len(self.blocks) < MAX_STORED_BLOCKS:
+            self.blocks[key] = {"lines": lines, "count": 1}
+        else:
+            self.dropped_blocks += 1
+
+    def _collect_locations(self, line: str):
+        for match in LOCATION.finditer(line):
+            path = match.group("py_path") or match.group("path")
+            number = match.group("py_line") or match.group("line")
+            if "site-packages" in path or "node_modules" in path or path.startswith("<"):
+                continue  # Frames in dependencies rarely need editing
+            self.locations.setdefault(f"{path}:{number}", None)
+
+    def render(self, max_tokens: int = FAILURE_CONTEXT_TOKENS, returncode: Optional[int] = None,
+               log_path: Optional[str] = None) -> str:
+        """Compose the distilled failure report within the token budget"""
+        if self._current is not None:
+            self._close_block()
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        header = [f"$ {self.command}"]
+        status = f"exit {returncode}, " if returncode is not None else ""
+        header.append(f"({status}{self.total_lines} output lines, parsed as {self.matcher.name})")
+        if self.failing_tests:
+            more = f" (+{len(self.failing_tests) - 1} more)" if len(self.failing_tests) > 1 else ""
+            header.append(f"First failing test: {self.failing_test}{more}")
+        if self.locations:
+            header.append("Locations: " + ", ".join(list(self.locations)[:MAX_LOCATIONS]))
+        text = "\n".join(header)
+
+        blocks = list(self.blocks.values())
+        if not blocks:
+            tail = "\n".join(line for line in self.tail if line.strip())
+            remaining = max_chars - len(text) - 30
+            if tail and remaining > 0:
+                text += "\nLast output lines:\n" + tail[-remaining:]
+            return text
+
+        used, shown = len(text), 0
+        parts = [text]
+        for block in blocks:
+            block_text = "\n".join(block["lines"])
+            if block["count"] > 1:
+                block_text += f"\n(same error repeated {block['count']} times)"
+            if used + len(block_text) + 2 > max_chars:
+                if shown == 0:
+                    block_text = block_text[:max(0, max_chars - used - 40)] + "\n..."
+                else:
+                    break
+            parts.append(block_text)
+            used += len(block_text) + 2
+            shown += 1
+        omitted = len(blocks) - shown + self.dropped_blocks
+        if omitted:
+            where = f"; full log: {log_path}" if log_path else ""
+            parts.append(f"... {omitted} more error blocks omitted{where}")
+        return "\n\n".join(parts)
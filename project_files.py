@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Project file discovery for ULCA
+Shared helpers for walking a project tree and fingerprinting its source files
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+# Per-project cache directory for indexes and logs
+ULCA_CACHE_DIR = ".ulca"
+
+# Directory names that never contain project sources worth indexing
+IGNORED_DIRS = {
+    ".git", ".hg", ".svn", ".ulca", "__pycache__", "node_modules", ".venv", "venv",
+    "build", "dist", ".gradle", ".idea", ".vscode", ".pytest_cache", ".mypy_cache",
+    ".tox", ".nox", "Pods", "DerivedData", ".dart_tool", "target"
+}
+
+# Agent state files that must not be fed back to the model as project code
+IGNORED_FILES = {"project_context.json"}
+
+# Extensions treated as source/text files by the indexers
+SOURCE_EXTENSIONS = {
+    ".py", ".pyw", ".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".kt", ".kts", ".java", ".swift",
+    ".dart", ".rs", ".go", ".c", ".h", ".cpp", ".hpp", ".cs", ".rb", ".php",
+    ".html", ".css", ".scss", ".json", ".yaml", ".yml", ".toml", ".xml", ".gradle",
+    ".md", ".txt", ".sh", ".sql"
+}
+
+MAX_INDEXED_FILE_BYTES = 512 * 1024  # Skip generated/minified blobs
+
+
+def iter_project_files(root: Path, extensions: Optional[Iterable[str]] = None) -> Iterator[Path]:
+    """Yield indexable files under root, skipping hidden and build directories"""
+    root = Path(root)
+    wanted: Set[str] = set(extensions) if extensions is not None else SOURCE_EXTENSIONS
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Prune in place so os.walk never descends into ignored trees
+        dirnames[:] = sorted(
+            d for d in dirnames
+            if d not in IGNORED_DIRS and not d.startswith('.')
+        )
+        for name in sorted(filenames):
+            if name.startswith('.') or name in IGNORED_FILES:
+                continue
+            path = Path(dirpath) / name
+            if path.suffix.lower() not in wanted:
+                continue
+            try:
+                if path.stat().st_size > MAX_INDEXED_FILE_BYTES:
+                    continue
+            except OSError:
+                continue
+            yield path
+
+
+def relative_path(root: Path, path: Path) -> str:
+    """Return a POSIX-style path relative to the project root"""
+    return Path(path).resolve().relative_to(Path(root).resolve()).as_posix()
+
+
+def file_digest(path: Path) -> str:
+    """Return the SHA-1 hex digest of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_text(path: Path) -> Optional[str]:
+    """Read a file as UTF-8 text, returning None for binary or unreadable files"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (UnicodeDecodeError, OSError):
+        return None
+
+
+class FileManifest:
+    """Snapshot of project files: relative path -> mtime, size and content hash"""
+
+    def __init__(self, project_dir: Path, entries: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.project_dir = Path(project_dir).resolve()
+        self.entries: Dict[str, Dict[str, Any]] = entries or {}
+
+    @classmethod
+    def scan(cls, project_dir: Path, previous: Optional['FileManifest'] = None) -> 'FileManifest':
+        """Walk the project, re-hashing only files whose mtime or size changed"""
+        manifest = cls(project_dir)
+        known = previous.entries if previous else {}
+        for path in iter_project_files(manifest.project_dir):
+            try:
+                stat = path.stat()
+                rel = relative_path(manifest.project_dir, path)
+                entry = known.get(rel)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    manifest.entries[rel] = entry
+                else:
+                    manifest.entries[rel] = {"mtime": stat.st_mtime, "size": stat.st_size,
+                                             "hash": file_digest(path)}
+            except (OSError, ValueError):
+                continue
+        return manifest
+
+    def diff(self, newer: 'FileManifest') -> Dict[str, List[str]]:
+        """Compare against a newer manifest"""
+        old, new = self.entries, newer.entries
+        return {
+            "added": sorted(set(new) - set(old)),
+            "removed": sorted(set(old) - set(new)),
+            "modified": sorted(rel for rel in set(old) & set(new) if old[rel]["hash"] != new[rel]["hash"])
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Persistent PTY Shell for ULCA
+Keeps one pty-backed bash per agent so `cd`, activated virtualenvs, exported
+variables and shell functions survive between agent-issued commands.
+Run this file directly to benchmark it against spawning a shell per command.
+"""
+
+import os
+import re
+import secrets
+import select
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from command_runner import (
+    COMMAND_IDLE_TIMEOUT, COMMAND_TIMEOUT, TAIL_LINES, OutputCallback,
+    format_tail, open_command_log
+)
+from project_files import ULCA_CACHE_DIR
+
+try:
+    import pty
+    import termios
+except ImportError:  # Windows: no pty support, commands fall back to fresh processes
+    pty = None
+    termios = None
+
+# Configuration
+SHELL_PROGRAM = "/bin/bash"
+SHELL_START_TIMEOUT = 10
+INTERRUPT_GRACE_SECONDS = 3
+READ_CHUNK = 65536
+
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]|\r')
+
+
+class ShellError(Exception):
+    """Raised when the persistent shell cannot be started or has died"""
+
+
+class PersistentShell:
+    """A long-lived interactive bash driven through a pseudo-terminal"""
+
+    def __init__(self, project_dir: Path, log_dir: Optional[Path] = None):
+        if pty is None:
+            raise ShellError("Persistent shell requires a POSIX system with pty support")
+        self.project_dir = Path(project_dir).resolve()
+        self.log_dir = Path(log_dir) if log_dir else self.project_dir / ULCA_CACHE_DIR / "logs"
+        self.cwd = str(self.project_dir)
+        self.pid: Optional[int] = None
+        self.fd: Optional[int] = None
+        self.restarts = 0
+        self.commands_run = 0
+
+    def start(self):
+        """Spawn bash on a new pty in the last known working directory"""
+        env = dict(os.environ, PS1="", PS2="", PROMPT_COMMAND="", TERM="dumb", HISTFILE="/dev/null")
+        pid, fd = pty.fork()
+        if pid == 0:  # Child: become the shell
+            try:
+                os.chdir(self.cwd)
+            except OSError:
+                os.chdir(self.project_dir)
+            os.execve(SHELL_PROGRAM, [SHELL_PROGRAM, "--noprofile", "--norc", "--noediting", "-i"], env)
+        self.pid, self.fd = pid, fd
+
+        # No echo: we only want command output back from the terminal
+        attrs = termios.tcgetattr(fd)
+        attrs[3] &= ~termios.ECHO
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+        token = secrets.token_hex(8)
+        self._write(f"set +o history; bind 'set enable-bracketed-paste off' 2>/dev/null; echo __ULCA_READY_{token}__\n")
+        self._read_until(re.compile(f"__ULCA_READY_{token}__"), SHELL_START_TIMEOUT)
+
+    def is_alive(self) -> bool:
+        if self.pid is None:
+            return False
+        try:
+            pid, _ = os.waitpid(self.pid, os.WNOHANG)
+        except ChildProcessError:
+            return False
+        return pid == 0
+
+    def close(self):
+        """Terminate the shell and release the pty"""
+        if self.pid is not None:
+            try:
+                os.killpg(self.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            try:
+                os.waitpid(self.pid, 0)
+            except ChildProcessError:
+                pass
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+        self.pid, self.fd = None, None
+
+    def restart(self):
+        self.close()
+        self.restarts += 1
+        self.start()
+
+    def _write(self, data: str):
+        os.write(self.fd, data.encode('utf-8'))
+
+    def _read_until(self, pattern, timeout: float, on_chunk=None, idle_timeout: Optional[float] = None):
+        """Read pty output until pattern matches; returns (text, match) or raises TimeoutError"""
+        buffer = ""
+        started = last_output = time.monotonic()
+        while True:
+            match = pattern.search(buffer)
+            if match:
+                return buffer, match
+            now = time.monotonic()
+            if now - started > timeout or (idle_timeout and now - last_output > idle_timeout):
+                raise TimeoutError(buffer)
+            ready, _, _ = select.select([self.fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, READ_CHUNK)
+            except OSError:
+                raise ShellError("Persistent shell exited unexpectedly")
+            if not data:
+                raise ShellError("Persistent shell closed its terminal")
+            text = ANSI_ESCAPE.sub('', data.decode('utf-8', errors='replace'))
+            last_output = time.monotonic()
+            if on_chunk:
+                on_chunk(text)
+            buffer += text
+
+    def run(self, command: str, on_output: Optional[OutputCallback] = None, log: bool = True,
+            timeout: float = COMMAND_TIMEOUT, idle_timeout: Optional[float] = COMMAND_IDLE_TIMEOUT) -> Dict[str, Any]:
+        """Run one command in the shell; returns the same result shape as StreamingExecutor.run
+
+        The pty merges the command's stdout and stderr, so both arrive as "stdout" lines and in
+        "stdout"; "stderr" only holds this shell's own error, such as a timeout or a lost shell.
+        """
+        if not self.is_alive():
+            if self.pid is not None:
+                self.restarts += 1
+                self.close()
+            self.start()
+
+        started = time.monotonic()
+        token = secrets.token_hex(8)
+        sentinel = re.compile(rf"__ULCA_DONE_{token}__(-?\d+)__(.*?)__END__\n")
+        log_path, log_file = open_command_log(self.log_dir, command) if log else (None, None)
+        tail, count, partial, blanks = deque(maxlen=TAIL_LINES), [0], [""], [0]
+
+        def emit(line: str):
+            tail.append(line)
+            count[0] += 1
+            if log_file:
+                log_file.write(line + "\n")
+            if on_output:
+                try:
+                    on_output("stdout", line)
+                except Exception:
+                    pass
+
+        def emit_lines(chunk: str):
+            # Blank lines are held back because the sentinel is preceded by one
+            text = partial[0] + chunk
+            lines = text.split("\n")
+            partial[0] = lines.pop()
+            for line in lines:
+                if f"__ULCA_DONE_{token}__" in line:
+                    blanks[0] = max(0, blanks[0] - 1)
+                    break
+                if not line.strip():
+                    blanks[0] += 1
+                    continue
+                for _ in range(blanks[0]):
+                    emit("")
+                blanks[0] = 0
+                emit(line)
+
+        # Braces keep cd/export/source in this shell; stdin is detached so nothing blocks on the pty
+        self._write(f"{{\n{command}\n}} </dev/null\n"
+                    f"printf '\\n__ULCA_DONE_{token}__%s__%s__END__\\n' \"$?\" \"$PWD\"\n")
+        error, timed_out = None, False
+        try:
+            _, match = self._read_until(sentinel, timeout, emit_lines, idle_timeout)
+            returncode, self.cwd = int(match.group(1)), match.group(2)
+        except TimeoutError:
+            timed_out = True
+            error = f"Command timed out after {int(time.monotonic() - started)} seconds"
+            returncode = -1
+            if not self._recover():
+                error += "; shell restarted, exported variables and other shell state were lost"
+        except ShellError as e:
+            error = f"{e}; exported variables and other shell state were lost"
+            returncode = -1
+            self.close()
+            self.restarts += 1
+
+        if partial[0].strip() and f"__ULCA_DONE_{token}__" not in partial[0]:
+            emit_lines("\n")
+        self.commands_run += 1
+        duration = time.monotonic() - started
+        if log_file:
+            log_file.write(f"[exit {returncode} after {duration:.1f}s]\n")
+            log_file.close()
+
+        stdout = format_tail(tail, count[0], log_path).strip("\n")
+        return {
+            "returncode": returncode,
+            "cpu_time": None,
+            "max_rss_kb": None,
+            "stdout": stdout,
+            "stderr": error or "",
+            "duration": duration,
+            "timed_out": timed_out,
+            "log_path": str(log_path) if log_path else None,
+            "lines": count[0]
+        }
+
+    def environment(self, names: List[str]) -> Optional[Dict[str, str]]:
+        """Current values of the named variables in this shell, or None if it could not be asked"""
+        names = [name for name in names if re.fullmatch(r'[A-Za-z_]\w*', name)]
+        values: Dict[str, str] = {}
+
+        def collect(stream: str, line: str):
+            if line.startswith("__ULCA_ENV__"):
+                name, _, value = line[len("__ULCA_ENV__"):].partition("=")
+                values[name] = value
+
+        # Newlines would split a value across lines; the key only needs it to change when the value does
+        query = "; ".join(f"printf '__ULCA_ENV__%s=%s\\n' {name} \"${{{name}//$'\\n'/ }}\"" for name in names)
+        result = self.run(query or "true", on_output=collect, log=False, timeout=SHELL_START_TIMEOUT)
+        self.commands_run -= 1  # A lookup, not one of the agent's commands
+        return values if result["returncode"] == 0 else None
+
+    def _recover(self) -> bool:
+        """Interrupt a stuck command; restart the shell if it does not come back"""
+        try:
+            self._write("\x03")
+            probe = secrets.token_hex(8)
+            self._write(f"\necho __ULCA_PROBE_{probe}__\n")
+            self._read_until(re.compile(f"__ULCA_PROBE_{probe}__"), INTERRUPT_GRACE_SECONDS)
+            return True
+        except (TimeoutError, ShellError, OSError):
+            self.restart()
+            return False
+
+
+def benchmark(iterations: int = 100, command: str = "true"):
+    """Compare per-command overhead of a fresh shell vs the persistent pty shell"""
+    project_dir = Path.cwd()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        subprocess.run(command, shell=True, cwd=project_dir, capture_output=True, text=True)
+    spawn_ms = (time.perf_counter() - started) * 1000 / iterations
+
+    shell = PersistentShell(project_dir)
+    shell.start()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        shell.run(command, log=False)
+    persistent_ms = (time.perf_counter() - started) * 1000 / iterations
+    shell.close()
+
+    print(f"📊 {iterations} x `{command}`")
+    print(f"   fresh shell per command: {spawn_ms:.2f} ms/command")
+    print(f"   persistent pty shell:    {persistent_ms:.2f} ms/command")
+    if persistent_ms > 0:
+        print(f"   speed-up: {spawn_ms / persistent_ms:.1f}x")
+    return spawn_ms, persistent_ms
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
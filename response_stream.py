@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Incremental Response Parsing for ULCA
+Parses a model reply in one pass as it streams: an Aho-Corasick automaton spots
+confirmation requests and a line state machine tracks code fences, TODO items and
+proposed actions, so each is reported as soon as the text that defines it arrives.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from action_plan import FENCE_OPEN, MAX_PLAN_ACTIONS, FenceTracker, block_actions, delete_action
+
+# Configuration
+CONFIRMATION_INDICATORS = [
+    'should i proceed', 'shall i proceed', 'do you want me to',
+    'would you like me to', 'can i proceed', 'may i proceed',
+    'do you approve', 'should i continue', 'shall i continue',
+    'do you want me to continue', 'would you like me to continue'
+]
+QUESTION_CONTEXT_BEFORE = 100  # Characters of lead-in kept with a confirmation question
+QUESTION_CONTEXT_AFTER = 200  # The question ends at "?", the end of its line or this many characters
+
+ResponseEvent = Callable[[str, Any], None]  # (kind, payload): "todo", "action" or "confirmation"
+
+
+class IndicatorAutomaton:
+    """Aho-Corasick matcher over lowercase phrases that can be fed text in arbitrary chunks"""
+
+    def __init__(self, phrases: List[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+        for phrase in phrases:
+            state = 0
+            for char in phrase:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(phrase)
+
+        # Breadth-first failure links; outputs inherit those of their failure state
+        queue = list(self.goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+        self.state = 0
+
+    def reset(self):
+        self.state = 0
+
+    def feed(self, text: str, offset: int = 0) -> List[Tuple[int, str]]:
+        """Advance over text; returns (end offset, phrase) for every match completed in it"""
+        matches = []
+        goto, fail, output = self.goto, self.fail, self.output
+        state = self.state
+        for index, char in enumerate(text.lower()):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                matches.extend((offset + index + 1, phrase) for phrase in output[state])
+        self.state = state
+        return matches
+
+
+def is_todo_line(line: str) -> bool:
+    """A list item that mentions a todo or task"""
+    line = line.strip()
+    if not (line.startswith(('-', '*', '•')) or (line and line[0].isdigit() and '. ' in line)):
+        return False
+    lowered = line.lower()
+    return 'todo' in lowered or 'task' in lowered
+
+
+class StreamingResponseParser:
+    """Consumes a reply chunk by chunk and reports TODOs, actions and confirmation requests early"""
+
+    def __init__(self, on_event: Optional[ResponseEvent] = None):
+        self.on_event = on_event
+        self.automaton = IndicatorAutomaton(CONFIRMATION_INDICATORS)
+        self.lines: List[str] = []
+        self.todo_items: List[str] = []
+        self.actions: List[Dict[str, Any]] = []
+        self.needs_confirmation = False
+        self.confirmation_question = ""
+        self._chunks: List[str] = []
+        self._length = 0
+        self._line = ""
+        self._fence: Optional[Dict[str, Any]] = None  # Open fence: tracker, info and first line
+        self._question_start: Optional[int] = None  # Offset of an indicator whose sentence is still arriving
+        self._prose_start = 0  # Offset just after the last code block; question lead-in never reaches into one
+        self._closed = False
+
+    def feed(self, chunk: str):
+        """Consume the next piece of the reply"""
+        if not chunk or self._closed:
+            return
+        self._chunks.append(chunk)
+        position = 0
+        while position < len(chunk):
+            newline = chunk.find("\n", position)
+            end = len(chunk) if newline == -1 else newline
+            self._feed_segment(chunk[position:end], self._length + position)
+            if newline == -1:
+                break
+            self._end_line(self._length + newline)
+            position = newline + 1
+        self._length += len(chunk)
+
+    def _feed_segment(self, segment: str, offset: int):
+        """Text within the current line: scan it for indicators unless it is inside a code block"""
+        self._line += segment
+        if self._fence is None and not self.needs_confirmation:
+            for end, phrase in self.automaton.feed(segment, offset):
+                self._question_start = end - len(phrase)
+                self.needs_confirmation = True
+                break
+        if self._question_start is not None:
+            question_mark = segment.find("?", max(0, self._question_start - offset))
+            if question_mark != -1:
+                self._finish_question(offset + question_mark + 1)
+            elif offset + len(segment) - self._question_start >= QUESTION_CONTEXT_AFTER:
+                self._finish_question(self._question_start + QUESTION_CONTEXT_AFTER)
+
+    def _end_line(self, offset: int):
+        """State machine step for one completed line"""
+        line, self._line = self._line, ""
+        number = len(self.lines)
+        self.lines.append(line)
+        if self._question_start is not None:
+            self._finish_question(offset)
+        self._step(line, number, offset)
+
+    def _step(self, line: str, number: int, offset: int):
+        """Fences, TODOs and deletions for one line; fences nest as in action_plan.iter_fences"""
+        if self._fence is not None:
+            if self._fence["tracker"].closes(line, number):
+                self._close_fence(number, offset)
+            return
+
+        match = FENCE_OPEN.match(line)
+        if match:
+            self._fence = {"tracker": FenceTracker(match.group("fence")), "info": match.group("info").strip(),
+                           "start": number}
+            self.automaton.reset()
+            return
+        if is_todo_line(line):
+            self.todo_items.append(line.strip())
+            self._emit("todo", line.strip())
+        action = delete_action(line, number)
+        if action:
+            self._add_action(action)
+
+    def _close_fence(self, end: int, offset: int):
+        block = {"info": self._fence["info"], "body": "\n".join(self.lines[self._fence["start"] + 1:end]),
+                 "start": self._fence["start"], "end": end}
+        self._fence = None
+        self._prose_start = offset + 1
+        self.automaton.reset()
+        for action in block_actions(block, self.lines):
+            self._add_action(action)
+
+    def _add_action(self, action: Dict[str, Any]):
+        if len(self.actions) < MAX_PLAN_ACTIONS:
+            self.actions.append(action)
+            self._emit("action", action)
+
+    def _finish_question(self, end: int):
+        text = "".join(self._chunks)
+        start = max(self._prose_start, self._question_start - QUESTION_CONTEXT_BEFORE)
+        paragraph = text.rfind("\n\n", start, self._question_start)
+        if paragraph != -1:
+            start = paragraph + 2  # Lead-in stops at the paragraph the question belongs to
+        self.confirmation_question = text[start:min(end, self._question_start + QUESTION_CONTEXT_AFTER)].strip()
+        self._question_start = None
+        self._emit("confirmation", self.confirmation_question)
+
+    def _emit(self, kind: str, payload: Any):
+        if self.on_event:
+            self.on_event(kind, payload)
+
+    def close(self):
+        """Flush the last line; an unterminated code block is discarded as truncated"""
+        if self._closed:
+            return
+        if self._line:
+            self._end_line(self._length)
+        while self._fence is not None and self._fence["tracker"].first_closer is not None:
+            # Inner fences never balanced: the first closing line ended the block after all
+            end = self._fence["tracker"].first_closer
+            self._close_fence(end, self._length)
+            for number in range(end + 1, len(self.lines)):
+                self._step(self.lines[number], number, self._length)
+        if self._question_start is not None:
+            self._finish_question(self._length)
+        self._closed = True
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def result(self) -> Tuple[str, List[Dict[str, Any]], List[str], bool, str]:
+        """(response, actions, todo_items, needs_confirmation, confirmation_question)"""
+        self.close()
+        return self.text, self.actions, self.todo_items, self.needs_confirmation, self.confirmation_question
+
+
+def parse_response(response: str) -> Tuple[str, List[Dict[str, Any]], List[str], bool, str]:
+    """Parse a complete reply in one pass"""
+    parser = StreamingResponseParser()
+    parser.feed(response)
+    return parser.result()
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Semantic Code Search for ULCA
+Embeds project source chunks with Ollama and searches them with cosine similarity
+over a memory-mapped NumPy matrix.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from project_files import ULCA_CACHE_DIR, file_digest, iter_project_files, read_text, relative_path
+
+try:
+    import numpy as np
+except ImportError:  # Semantic search is optional; the agent works without it
+    np = None
+
+# Configuration
+OLLAMA_EMBEDDINGS_API = "http://localhost:11434/api/embeddings"
+EMBEDDING_MODEL = "nomic-embed-text"
+INDEX_VERSION = 1
+EMBED_BATCH_SIZE = 32
+EMBED_WORKERS = 4
+EMBED_TIMEOUT = 60
+CHUNK_LINES = 60
+CHUNK_OVERLAP = 10
+MAX_CHUNK_CHARS = 2000
+IVF_THRESHOLD = 20000  # Switch to bucketed search above this many chunks
+IVF_PROBES = 4
+IVF_ITERATIONS = 8
+
+
+class EmbeddingError(Exception):
+    """Raised when the embedding backend cannot produce vectors"""
+
+
+class OllamaEmbedder:
+    """Embeds text through Ollama's /api/embeddings endpoint"""
+
+    def __init__(self, model: str = EMBEDDING_MODEL, api_url: str = OLLAMA_EMBEDDINGS_API,
+                 workers: int = EMBED_WORKERS):
+        self.model = model
+        self.api_url = api_url
+        self.workers = workers
+        self.session = requests.Session()
+
+    @property
+    def name(self) -> str:
+        return f"ollama:{self.model}"
+
+    def _embed_one(self, text: str) -> List[float]:
+        try:
+            response = self.session.post(
+                self.api_url,
+                json={"model": self.model, "prompt": text},
+                timeout=EMBED_TIMEOUT
+            )
+            response.raise_for_status()
+            embedding = response.json().get("embedding")
+        except requests.exceptions.RequestException as e:
+            raise EmbeddingError(f"Embedding request failed: {e}")
+        except ValueError as e:
+            raise EmbeddingError(f"Invalid embedding response: {e}")
+        if not embedding:
+            raise EmbeddingError(f"Model '{self.model}' returned no embedding")
+        return embedding
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts, issuing requests over a small keep-alive pool"""
+        if len(texts) <= 1 or self.workers <= 1:
+            return [self._embed_one(text) for text in texts]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self._embed_one, texts))
+
+
+class LocalHashEmbedder:
+    """Offline stand-in for Ollama: hashed bag-of-identifiers vectors"""
+
+    TOKEN_PATTERN = re.compile(r'[A-Za-z][a-z0-9]+|[A-Z]+(?![a-z])|\d+')
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    @property
+    def name(self) -> str:
+        return f"local-hash:{self.dim}"
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dim
+            for token in self.TOKEN_PATTERN.findall(text):
+                digest = hashlib.md5(token.lower().encode('utf-8')).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % self.dim
+                vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+            vectors.append(vector)
+        return vectors
+
+
+def chunk_text(text: str, lines_per_chunk: int = CHUNK_LINES,
+               overlap: int = CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """Split text into overlapping line windows (1-based, inclusive line numbers)"""
+    lines = text.splitlines()
+    if not lines:
+        return []
+    step = max(1, lines_per_chunk - overlap)
+    chunks = []
+    for start in range(0, len(lines), step):
+        end = min(len(lines), start + lines_per_chunk)
+        body = "\n".join(lines[start:end]).strip()
+        if body:
+            chunks.append({"start_line": start + 1, "end_line": end, "text": body})
+        if end >= len(lines):
+            break
+    return chunks
+
+
+class SemanticIndex:
+    """Incremental embedding index stored under <project>/.ulca/semantic"""
+
+    def __init__(self, project_dir: Path, embedder: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 cache_dir: Optional[Path] = None, use_ivf: Optional[bool] = None):
+        if np is None:
+            raise ImportError("numpy is required for semantic search (pip install numpy)")
+        self.project_dir = Path(project_dir).resolve()
+        self.embedder = embedder or OllamaEmbedder()
+        self.cache_dir = Path(cache_dir) if cache_dir else self.project_dir / ULCA_CACHE_DIR / "semantic"
+        self.vectors_file = self.cache_dir / "vectors.npy"
+        self.meta_file = self.cache_dir / "meta.json"
+        self.ivf_file = self.cache_dir / "ivf.npz"
+        self.use_ivf = use_ivf
+        self.meta = self._load_meta()
+        self._ivf = None
+        self._meta_dirty = False
+        self.ready = threading.Event()
+        self.error: Optional[Exception] = None
+        self.last_update: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def _empty_meta(self) -> Dict[str, Any]:
+        return {
+            "version": INDEX_VERSION,
+            "embedder": getattr(self.embedder, "name", "custom"),
+            "dim": 0,
+            "generation": 0,
+            "rows": [],
+            "files": {}
+        }
+
+    def _load_meta(self) -> Dict[str, Any]:
+        if self.meta_file.exists() and self.vectors_file.exists():
+            try:
+                with open(self.meta_file, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if (meta.get("version") == INDEX_VERSION
+                        and meta.get("embedder") == getattr(self.embedder, "name", "custom")):
+                    return meta
+            except (json.JSONDecodeError, IOError):
+                pass
+        return self._empty_meta()
+
+    def _write_meta(self):
+        tmp_file = self.meta_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_file, self.meta_file)
+
+    def _load_vectors(self):
+        """Open the vector matrix read-only as a memory map"""
+        if not self.meta["rows"] or not self.vectors_file.exists():
+            return None
+        return np.load(self.vectors_file, mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.meta["rows"])
+
+    def start(self):
+        """Build or catch up the index on a background thread; search only once ready is set"""
+        self._thread = threading.Thread(target=self._background_update, name="ulca-semantic-index", daemon=True)
+        self._thread.start()
+
+    def _background_update(self):
+        try:
+            self.last_update = self.update()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def stale_paths(self, entries: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Paths whose FileManifest hash differs from the indexed one, plus files that are gone"""
+        known = self.meta["files"]
+        stale = [rel for rel, entry in entries.items() if known.get(rel, {}).get("hash") != entry["hash"]]
+        return stale + [rel for rel in known if rel not in entries]
+
+    def _changed_files(self, paths: Optional[List[Path]]) -> Dict[str, Any]:
+        """Work out which files need (re-)embedding and which have disappeared"""
+        known = self.meta["files"]
+        if paths is None:
+            candidates = list(iter_project_files(self.project_dir))
+            removed = set(known)
+        else:
+            candidates = [Path(p) if Path(p).is_absolute() else self.project_dir / p for p in paths]
+            removed = set()
+
+        changed = {}
+        for path in candidates:
+            try:
+                rel = relative_path(self.project_dir, path)
+            except ValueError:
+                continue
+            removed.discard(rel)
+            if not path.exists():
+                if rel in known:
+                    removed.add(rel)
+                continue
+            stat = path.stat()
+            entry = known.get(rel)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                continue
+            digest = file_digest(path)
+            if entry and entry["hash"] == digest:
+                # Touched but unchanged: refresh the stat so we skip hashing next time
+                entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+                self._meta_dirty = True
+                continue
+            changed[rel] = {"path": path, "hash": digest, "mtime": stat.st_mtime, "size": stat.st_size}
+        return {"changed": changed, "removed": removed}
+
+    def _embed_chunks(self, texts: List[str]):
+        """Embed texts in batches and return an L2-normalised float32 matrix"""
+        batches = []
+        for i in range(0, len(texts), EMBED_BATCH_SIZE):
+            vectors = self.embedder(texts[i:i + EMBED_BATCH_SIZE])
+            batches.append(np.asarray(vectors, dtype=np.float32))
+        matrix = np.vstack(batches)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def update(self, paths: Optional[List[Path]] = None) -> Dict[str, int]:
+        """Re-embed new or modified files; pass paths to limit the scan to those files"""
+        delta = self._changed_files(paths)
+        changed, removed = delta["changed"], delta["removed"]
+        if not changed and not removed:
+            if self._meta_dirty and self.meta_file.exists():
+                self._write_meta()
+                self._meta_dirty = False
+            return {"embedded": 0, "removed": 0, "chunks": len(self)}
+
+        new_rows, texts = [], []
+        for rel, info in changed.items():
+            content = read_text(info["path"])
+            if content is None:
+                continue
+            for chunk in chunk_text(content):
+                new_rows.append([rel, chunk["start_line"], chunk["end_line"]])
+                texts.append(f"{rel}:{chunk['start_line']}-{chunk['end_line']}\n"
+                             f"{chunk['text'][:MAX_CHUNK_CHARS]}")
+
+        new_vectors = self._embed_chunks(texts) if texts else None
+
+        stale = set(changed) | removed
+        old_vectors = self._load_vectors()
+        keep = [i for i, row in enumerate(self.meta["rows"]) if row[0] not in stale]
+        rows = [self.meta["rows"][i] for i in keep] + new_rows
+
+        parts = []
+        if old_vectors is not None and keep:
+            parts.append(np.asarray(old_vectors[keep], dtype=np.float32))
+        if new_vectors is not None:
+            parts.append(new_vectors)
+        del old_vectors
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if parts:
+            matrix = np.vstack(parts)
+            tmp_file = self.cache_dir / "vectors.tmp.npy"
+            out = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=np.float32, shape=matrix.shape)
+            out[:] = matrix
+            out.flush()
+            del out
+            os.replace(tmp_file, self.vectors_file)
+            self.meta["dim"] = int(matrix.shape[1])
+        elif self.vectors_file.exists():
+            self.vectors_file.unlink()
+
+        for rel in stale:
+            self.meta["files"].pop(rel, None)
+        for rel, info in changed.items():
+            self.meta["files"][rel] = {"hash": info["hash"], "mtime": info["mtime"], "size": info["size"]}
+        self.meta["rows"] = rows
+        self.meta["generation"] += 1
+        self._write_meta()
+        self._meta_dirty = False
+        self._ivf = None
+
+        return {"embedded": len(new_rows), "removed": len(removed), "chunks": len(rows)}
+
+    def _ivf_enabled(self) -> bool:
+        if self.use_ivf is not None:
+            return self.use_ivf
+        return len(self) >= IVF_THRESHOLD
+
+    def _build_ivf(self, vectors):
+        """Spherical k-means over the matrix; buckets are probed at query time"""
+        n = vectors.shape[0]
+        k = int(min(1024, max(8, np.sqrt(n))))
+        k = min(k, n)
+        rng = np.random.default_rng(0)
+        centroids = np.array(vectors[np.sort(rng.choice(n, size=k, replace=False))], dtype=np.float32)
+        assign = np.zeros(n, dtype=np.int32)
+        step = 8192
+        for _ in range(IVF_ITERATIONS):
+            for i in range(0, n, step):
+                assign[i:i + step] = np.argmax(vectors[i:i + step] @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+        np.savez(self.ivf_file, centroids=centroids, assign=assign,
+                 generation=np.array(self.meta["generation"]))
+        return centroids, assign
+
+    def _get_ivf(self, vectors):
+        if self._ivf is None and self.ivf_file.exists():
+            data = np.load(self.ivf_file)
+            if int(data["generation"]) == self.meta["generation"]:
+                self._ivf = (data["centroids"], data["assign"])
+        if self._ivf is None:
+            self._ivf = self._build_ivf(vectors)
+        return self._ivf
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Return the top_k chunks most similar to query"""
+        vectors = self._load_vectors()
+        if vectors is None:
+            return []
+        query_vector = self._embed_chunks([query])[0]
+        if query_vector.shape[0] != vectors.shape[1]:
+            raise EmbeddingError("Query embedding dimension does not match the index; rebuild required")
+
+        if self._ivf_enabled():
+            centroids, assign = self._get_ivf(vectors)
+            probes = np.argsort(centroids @ query_vector)[::-1][:IVF_PROBES]
+            candidates = np.flatnonzero(np.isin(assign, probes))
+            scores = np.asarray(vectors[candidates]) @ query_vector
+        else:
+            candidates = np.arange(vectors.shape[0])
+            scores = np.asarray(vectors @ query_vector)
+
+        # Over-fetch so overlapping windows of the same file can be collapsed
+        limit = min(len(scores), top_k * 3)
+        if limit == 0:
+            return []
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+
+        results, seen = [], []
+        for idx in best:
+            path, start, end = self.meta["rows"][int(candidates[idx])]
+            if any(p == path and start <= e and end >= s for p, s, e in seen):
+                continue
+            seen.append((path, start, end))
+            results.append({"path": path, "start_line": start, "end_line": end,
+                            "score": float(scores[idx])})
+            if len(results) >= top_k:
+                break
+        return results
+
+    def read_snippet(self, result: Dict[str, Any], max_chars: int = 1500) -> str:
+        """Load the source lines for a search result from disk"""
+        content = read_text(self.project_dir / result["path"]) or ""
+        lines = content.splitlines()[result["start_line"] - 1:result["end_line"]]
+        snippet = "\n".join(lines)
+        if len(snippet) > max_chars:
+            snippet = snippet[:max_chars] + "\n... (truncated)"
+        return snippet
+
+    def format_results(self, results: List[Dict[str, Any]], max_chars: int = 4000) -> str:
+        """Render search results as compact, size-capped prompt context"""
+        sections, used = [], 0
+        for result in results:
+            header = f"--- {result['path']} (lines {result['start_line']}-{result['end_line']}, score {result['score']:.2f}) ---"
+            snippet = self.read_snippet(result, max_chars=max(200, max_chars - used - len(header)))
+            block = f"{header}\n{snippet}"
+            if used + len(block) > max_chars and sections:
+                break
+            sections.append(block)
+            used += len(block)
+        return "\n".join(sections)
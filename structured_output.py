@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Structured Responses for ULCA
+JSON schema passed as Ollama's `format` so the model answers with analysis, TODO
+items, actions and its confirmation question as fields instead of free prose,
+plus a fast validator that turns the reply into the agent's parse result.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from file_edits import looks_like_edit
+
+# Configuration
+MAX_ANALYSIS_CHARS = 800  # Grammar-enforced caps keep structured replies short
+MAX_QUESTION_CHARS = 300
+MAX_TODO_ITEMS = 10
+MAX_TODO_CHARS = 160
+MAX_STRUCTURED_ACTIONS = 20
+
+RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string", "maxLength": MAX_ANALYSIS_CHARS},
+        "todo_items": {
+            "type": "array",
+            "maxItems": MAX_TODO_ITEMS,
+            "items": {"type": "string", "maxLength": MAX_TODO_CHARS}
+        },
+        "actions": {
+            "type": "array",
+            "maxItems": MAX_STRUCTURED_ACTIONS,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string", "enum": ["write", "edit", "delete", "command"]},
+                    "path": {"type": "string"},
+                    "content": {"type": "string"},
+                    "command": {"type": "string"}
+                },
+                "required": ["type"]
+            }
+        },
+        "needs_confirmation": {"type": "boolean"},
+        "question": {"type": "string", "maxLength": MAX_QUESTION_CHARS}
+    },
+    "required": ["analysis", "todo_items", "actions", "needs_confirmation", "question"]
+}
+
+STRUCTURED_INSTRUCTIONS = f"""RESPOND WITH A SINGLE JSON OBJECT MATCHING THE REQUIRED SCHEMA, no prose around it:
+- "analysis": your reasoning and the next step in at most 3 short sentences
+- "todo_items": new tasks for the TODO list, each under {MAX_TODO_CHARS} characters ([] if none)
+- "actions": changes to make, applied as one batch after the user approves. Each is
+  {{"type": "write", "path": <relative path>, "content": <full file content>}} for new files,
+  {{"type": "edit", "path": ..., "content": <SEARCH/REPLACE blocks or a unified diff>}} for existing files,
+  {{"type": "delete", "path": ...}} or {{"type": "command", "command": <shell command>}} ([] if none)
+- "needs_confirmation": true if you need the user's answer before going further
+- "question": the one question for the user ("" if none)
+Do not repeat file contents in "analysis"."""
+
+_JSON_TYPES = {"object": dict, "array": list, "string": str, "boolean": bool}
+
+
+def schema_errors(value: Any, schema: Dict[str, Any], where: str = "$") -> List[str]:
+    """Check types, required keys and enums; length caps are left to the grammar"""
+    expected = _JSON_TYPES.get(schema.get("type"))
+    if expected and not isinstance(value, expected):
+        return [f"{where}: expected {schema['type']}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{where}: {value!r} is not one of {schema['enum']}"]
+    errors = []
+    if isinstance(value, dict):
+        errors += [f"{where}.{key}: missing" for key in schema.get("required", []) if key not in value]
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors += schema_errors(value[key], subschema, f"{where}.{key}")
+    elif isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            errors += schema_errors(item, schema["items"], f"{where}[{index}]")
+    return errors
+
+
+def parse_structured_response(text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Decode and validate a structured reply; returns (data, "") or (None, reason)"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").partition("\n")[2]  # Tolerate a fenced reply from unconstrained models
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        return None, f"invalid JSON: {e}"
+    errors = schema_errors(data, RESPONSE_SCHEMA)
+    if errors:
+        return None, "; ".join(errors[:3])
+    return data, ""
+
+
+def to_actions(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Convert structured actions into the dicts extract_actions produces"""
+    actions = []
+    for index, item in enumerate(data["actions"]):
+        kind = item["type"]
+        if kind == "command":
+            if item.get("command", "").strip():
+                actions.append({"type": "command", "command": item["command"].strip(), "line": index})
+            continue
+        path = item.get("path", "").strip()
+        if not path:
+            continue
+        if kind == "delete":
+            actions.append({"type": "delete", "path": path, "line": index})
+            continue
+        content = item.get("content", "")
+        if kind == "write" and looks_like_edit(content):
+            kind = "edit"  # Models sometimes label a diff as a write
+        if kind == "write" and not content.endswith("\n"):
+            content += "\n"
+        actions.append({"type": kind, "path": path, "content": content, "line": index})
+    return actions
+
+
+def render_response(data: Dict[str, Any]) -> str:
+    """Human-readable text for the chat and conversation history"""
+    parts = [data["analysis"].strip()]
+    if data["todo_items"]:
+        parts.append("\n".join(f"- {item.strip()}" for item in data["todo_items"]))
+    if data["question"].strip():
+        parts.append(data["question"].strip())
+    return "\n\n".join(part for part in parts if part)
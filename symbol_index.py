@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Symbol and Import-Graph Index for ULCA
+Records definitions, references and imports for Python (via ast) and
+JS/TS/Kotlin/Java/Swift (via regex) so prompts can carry just the relevant code.
+"""
+
+import ast
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from language_support import (
+    DEFINITION_PATTERNS, EXTENSION_LANGUAGES, IMPORT_PATTERNS,
+    is_control_word, keywords_for_language, language_for_path
+)
+from project_files import file_digest, iter_project_files, read_text, relative_path
+
+# Configuration
+PROCESS_POOL_MIN_FILES = 64  # Below this, parsing in-process beats pool start-up
+MAX_SYMBOL_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+MAX_CALLERS_SHOWN = 8
+MAX_DEFINITION_LINES = 80
+
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_$][\w$]*')
+PYTHON_BUILTIN_NAMES = {'print', 'len', 'str', 'int', 'dict', 'list', 'set', 'range', 'open',
+                        'isinstance', 'super', 'self', 'cls', 'None', 'True', 'False'}
+
+
+def _python_symbols(content: str) -> Dict[str, Any]:
+    """Extract definitions, references and imports from Python source"""
+    tree = ast.parse(content)
+    definitions, imports = [], []
+    references: Dict[str, List[int]] = defaultdict(list)
+
+    def visit(node, prefix: str):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = f"{prefix}{child.name}"
+                if isinstance(child, ast.ClassDef):
+                    kind = "class"
+                else:
+                    kind = "method" if prefix and prefix[:-1] in class_names else "function"
+                if isinstance(child, ast.ClassDef):
+                    class_names.add(qualname)
+                start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                definitions.append({
+                    "name": child.name, "qualname": qualname, "kind": kind,
+                    "start_line": start, "end_line": getattr(child, "end_lineno", child.lineno)
+                })
+                visit(child, qualname + ".")
+            else:
+                visit(child, prefix)
+
+    class_names: Set[str] = set()
+    visit(tree, "")
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            imports.append(module)
+            # "from pkg import mod" may name a submodule rather than a symbol
+            imports.extend(f"{module}.{alias.name}" if node.module else f"{module}{alias.name}"
+                           for alias in node.names if alias.name != "*")
+        elif isinstance(node, ast.Name) and node.id not in PYTHON_BUILTIN_NAMES:
+            references[node.id].append(node.lineno)
+        elif isinstance(node, ast.Attribute):
+            references[node.attr].append(node.lineno)
+
+    return {"definitions": definitions, "references": dict(references), "imports": imports}
+
+
+def _block_end(lines: List[str], start: int) -> int:
+    """Find the closing brace of a block opened at or after line index start"""
+    depth, opened = 0, False
+    for i in range(start, len(lines)):
+        # Strip string literals and line comments before counting braces
+        line = re.sub(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`', '""', lines[i])
+        line = line.split('//', 1)[0]
+        for char in line:
+            if char == '{':
+                depth += 1
+                opened = True
+            elif char == '}':
+                depth -= 1
+        if opened and depth <= 0:
+            return i + 1
+        if not opened and i > start and line.strip().endswith(';'):
+            return i + 1  # Declaration without a body (abstract/interface member)
+    return start + 1
+
+
+def _regex_symbols(content: str, language: str) -> Dict[str, Any]:
+    """Extract definitions, references and imports with the per-language regex tables"""
+    lines = content.splitlines()
+    keywords = set(keywords_for_language(language))
+    definitions, imports = [], []
+    references: Dict[str, List[int]] = defaultdict(list)
+    def_patterns = DEFINITION_PATTERNS.get(language, [])
+    import_patterns = IMPORT_PATTERNS.get(language, [])
+    open_classes: List[Tuple[str, int]] = []
+
+    for index, line in enumerate(lines):
+        lineno = index + 1
+        stripped = line.strip()
+        if stripped.startswith(('//', '*', '/*')):
+            continue
+
+        for pattern in import_patterns:
+            for match in pattern.finditer(line):
+                imports.append(match.group('module'))
+
+        for kind, pattern in def_patterns:
+            match = pattern.match(line)
+            if not match:
+                continue
+            name = match.group('name')
+            if name in keywords or is_control_word(name):
+                continue
+            end = _block_end(lines, index)
+            open_classes = [(cls, cls_end) for cls, cls_end in open_classes if cls_end >= lineno]
+            parent = open_classes[-1][0] if open_classes and kind in ('method', 'function') else ""
+            definitions.append({
+                "name": name,
+                "qualname": f"{parent}.{name}" if parent else name,
+                "kind": "method" if parent else kind,
+                "start_line": lineno,
+                "end_line": max(end, lineno)
+            })
+            if kind in ('class', 'interface'):
+                open_classes.append((name, end))
+            break
+
+        for word in IDENTIFIER_PATTERN.findall(line):
+            if word not in keywords and not is_control_word(word):
+                references[word].append(lineno)
+
+    return {"definitions": definitions, "references": dict(references), "imports": imports}
+
+
+def extract_file_symbols(path: str) -> Optional[Dict[str, Any]]:
+    """Parse one file into its symbol table; top-level so it can run in a worker process"""
+    language = language_for_path(path)
+    if language is None:
+        return None
+    content = read_text(Path(path))
+    if content is None:
+        return None
+    try:
+        if language == 'python':
+            symbols = _python_symbols(content)
+        else:
+            symbols = _regex_symbols(content, language)
+    except (SyntaxError, ValueError):
+        # Half-edited Python files still contribute their references
+        symbols = _regex_symbols(content, 'python') if language == 'python' else {
+            "definitions": [], "references": {}, "imports": []}
+    symbols["language"] = language
+    return symbols
+
+
+class SymbolIndex:
+    """Incremental project-wide symbol table and import graph"""
+
+    def __init__(self, project_dir: Path):
+        self.project_dir = Path(project_dir).resolve()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._definitions: Dict[str, List[Tuple[str, Dict[str, Any]]]] = defaultdict(list)
+        self._references: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+        self._imports: Dict[str, Set[str]] = {}
+        self._importers: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def state(self) -> Dict[str, Dict[str, Any]]:
+        """Per-file symbol tables, in a JSON-serialisable form"""
+        return self.files
+
+    def load_state(self, files: Dict[str, Dict[str, Any]]):
+        """Restore per-file tables saved with state()"""
+        self.files = files
+        self._rebuild_lookups()
+
+    def update(self, paths: Optional[List[Path]] = None) -> Dict[str, int]:
+        """Re-parse new or changed files (all files when paths is None)"""
+        extensions = set(EXTENSION_LANGUAGES)
+        if paths is None:
+            candidates = list(iter_project_files(self.project_dir, extensions))
+            removed = set(self.files)
+        else:
+            candidates = [Path(p) if Path(p).is_absolute() else self.project_dir / p for p in paths]
+            removed = set()
+
+        changed: Dict[str, Dict[str, Any]] = {}
+        for path in candidates:
+            try:
+                rel = relative_path(self.project_dir, path)
+            except ValueError:
+                continue
+            removed.discard(rel)
+            if path.suffix.lower() not in extensions:
+                continue
+            if not path.exists():
+                if rel in self.files:
+                    removed.add(rel)
+                continue
+            stat = path.stat()
+            entry = self.files.get(rel)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                continue
+            digest = file_digest(path)
+            if entry and entry["hash"] == digest:
+                entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+                continue
+            changed[rel] = {"path": str(path), "hash": digest, "mtime": stat.st_mtime, "size": stat.st_size}
+
+        if not changed and not removed:
+            return {"parsed": 0, "removed": 0, "files": len(self.files)}
+
+        for rel, symbols in zip(changed, self._parse_all([info["path"] for info in changed.values()])):
+            if symbols is None:
+                removed.add(rel)
+                continue
+            symbols.update({k: changed[rel][k] for k in ("hash", "mtime", "size")})
+            self.files[rel] = symbols
+        for rel in removed:
+            self.files.pop(rel, None)
+
+        self._rebuild_lookups()
+        return {"parsed": len(changed), "removed": len(removed), "files": len(self.files)}
+
+    def _parse_all(self, paths: List[str]) -> List[Optional[Dict[str, Any]]]:
+        if len(paths) < PROCESS_POOL_MIN_FILES:
+            return [extract_file_symbols(p) for p in paths]
+        with ProcessPoolExecutor(max_workers=MAX_SYMBOL_WORKERS) as pool:
+            return list(pool.map(extract_file_symbols, paths, chunksize=16))
+
+    def _rebuild_lookups(self):
+        """Rebuild the name and import-graph lookups from the per-file tables"""
+        self._definitions = defaultdict(list)
+        self._references = defaultdict(list)
+        self._importers = defaultdict(set)
+        self._imports = {}
+        for rel, symbols in self.files.items():
+            for definition in symbols["definitions"]:
+                self._definitions[definition["name"]].append((rel, definition))
+            for name, lines in symbols["references"].items():
+                for line in lines:
+                    self._references[name].append((rel, line))
+            targets = set()
+            for module in symbols["imports"]:
+                target = self._resolve_import(rel, module, symbols["language"])
+                if target and target != rel:
+                    targets.add(target)
+            self._imports[rel] = targets
+            for target in targets:
+                self._importers[target].add(rel)
+
+    def _resolve_import(self, rel: str, module: str, language: str) -> Optional[str]:
+        """Map an import string onto an indexed project file, if it is one"""
+        if language == 'python':
+            level = len(module) - len(module.lstrip('.'))
+            parts = [p for p in module.lstrip('.').split('.') if p]
+            if level:
+                base = Path(rel).parent
+                for _ in range(level - 1):
+                    base = base.parent
+                stems = [base.joinpath(*parts).as_posix()]
+            else:
+                # Absolute imports may be rooted at the project, the importer's package or,
+                # for scripts and tests run with a sys.path tweak, one of its parent directories
+                stems = ['/'.join(parts)] + [parent.joinpath(*parts).as_posix()
+                                             for parent in Path(rel).parents if parent != Path('.')]
+            for stem in stems:
+                for candidate in (f"{stem}.py", f"{stem}/__init__.py"):
+                    if candidate in self.files:
+                        return candidate
+            return None
+        if language == 'javascript':
+            if not module.startswith('.'):
+                return None
+            stem = os.path.normpath(os.path.join(os.path.dirname(rel), module)).replace(os.sep, '/')
+            for suffix in ('', '.ts', '.tsx', '.js', '.jsx', '.mjs', '.cjs', '/index.ts', '/index.js'):
+                if stem + suffix in self.files:
+                    return stem + suffix
+            return None
+        if language in ('java', 'kotlin'):
+            path_tail = module.rstrip('.*').replace('.', '/')
+            for candidate in self.files:
+                stem = Path(candidate).with_suffix('').as_posix()
+                # Match whole path components so foo.Bar does not resolve to foo/FooBar.java
+                if stem == path_tail or stem.endswith('/' + path_tail):
+                    return candidate
+        return None
+
+    def where(self, name: str) -> List[Dict[str, Any]]:
+        """Return every definition of name (plain or qualified)"""
+        short = name.split('.')[-1]
+        results = []
+        for rel, definition in self._definitions.get(short, []):
+            if '.' in name and not definition["qualname"].endswith(name):
+                continue
+            results.append(dict(definition, path=rel))
+        return results
+
+    def enclosing_definition(self, rel: str, line: int) -> Optional[Dict[str, Any]]:
+        """Return the innermost definition in rel that spans line"""
+        best = None
+        for definition in self.files.get(rel, {}).get("definitions", []):
+            if definition["start_line"] <= line <= definition["end_line"]:
+                if best is None or definition["start_line"] >= best["start_line"]:
+                    best = definition
+        return best
+
+    def callers(self, name: str) -> List[Dict[str, Any]]:
+        """Return references to name outside its own definitions, with their enclosing symbol"""
+        own = {(rel, d["start_line"]) for rel, d in self._definitions.get(name, [])}
+        results, seen = [], set()
+        for rel, line in self._references.get(name, []):
+            if (rel, line) in own:
+                continue
+            enclosing = self.enclosing_definition(rel, line)
+            if enclosing and enclosing["name"] == name:
+                continue
+            key = (rel, enclosing["qualname"] if enclosing else line)
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append({"path": rel, "line": line,
+                            "caller": enclosing["qualname"] if enclosing else "<module>"})
+        return results
+
+    def imports_of(self, rel: str) -> List[str]:
+        """Project files imported by rel"""
+        return sorted(self._imports.get(rel, set()))
+
+    def importers_of(self, rel: str) -> List[str]:
+        """Project files that import rel"""
+        return sorted(self._importers.get(rel, set()))
+
+    def snippet(self, rel: str, definition: Dict[str, Any], max_lines: int = MAX_DEFINITION_LINES) -> str:
+        """Return the source of a definition, truncated to max_lines"""
+        content = read_text(self.project_dir / rel) or ""
+        lines = content.splitlines()[definition["start_line"] - 1:definition["end_line"]]
+        if len(lines) > max_lines:
+            lines = lines[:max_lines] + [f"... ({definition['end_line'] - definition['start_line'] + 1 - max_lines} more lines)"]
+        return "\n".join(lines)
+
+    def find_mentions(self, text: str, limit: int = 3) -> List[Tuple[str, Dict[str, Any]]]:
+        """Pick the definitions a request most likely refers to"""
+        mentioned_files = {rel for rel in self.files
+                           if re.search(r'(?<![\w.])' + re.escape(Path(rel).name) + r'\b', text)}
+        scored = []
+        for word in set(IDENTIFIER_PATTERN.findall(text)):
+            if len(word) < 3:
+                continue
+            for rel, definition in self._definitions.get(word, []):
+                score = 1
+                if rel in mentioned_files:
+                    score += 4
+                if '_' in word or (word[0].islower() and any(c.isupper() for c in word)):
+                    score += 2  # snake_case / camelCase words are rarely plain English
+                scored.append((score, rel, definition))
+        scored.sort(key=lambda item: (-item[0], item[1], item[2]["start_line"]))
+        return [(rel, definition) for _, rel, definition in scored[:limit]]
+
+    def build_context(self, text: str, max_chars: int = 4000) -> str:
+        """Compact definitions, imports and callers for the symbols a request mentions"""
+        sections, used = [], 0
+        for rel, definition in self.find_mentions(text):
+            header = f"--- {definition['kind']} {definition['qualname']} ({rel}:{definition['start_line']}-{definition['end_line']}) ---"
+            parts = [header, self.snippet(rel, definition)]
+            imports = self.imports_of(rel)
+            if imports:
+                parts.append(f"Imports: {', '.join(imports)}")
+            callers = self.callers(definition["name"])
+            if callers:
+                shown = ", ".join(f"{c['caller']} ({c['path']}:{c['line']})" for c in callers[:MAX_CALLERS_SHOWN])
+                more = f" and {len(callers) - MAX_CALLERS_SHOWN} more" if len(callers) > MAX_CALLERS_SHOWN else ""
+                parts.append(f"Called from: {shown}{more}")
+            block = "\n".join(parts)
+            if used + len(block) > max_chars:
+                if sections:
+                    break
+                block = block[:max_chars] + "\n... (truncated)"
+            sections.append(block)
+            used += len(block)
+        return "\n".join(sections)
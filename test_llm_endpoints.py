@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Endpoint Pool Tests for ULCA
+Run with: python -m pytest test_llm_endpoints.py
+"""
+
+import json
+
+import pytest
+
+from concurrency_control import ConcurrencyStore
+from llm_endpoints import EndpointPool, parse_endpoints
+
+URL = "http://ollama-test:11434"
+
+
+def make_pool(tmp_path, limit):
+    """A single adaptive endpoint whose stored limit is `limit`; records every capacity change"""
+    store_file = tmp_path / "concurrency.json"
+    store_file.write_text(json.dumps({URL: {"limit": limit}}))
+    capacities = []
+    pool = EndpointPool([URL], on_capacity=capacities.append, store=ConcurrencyStore(store_file))
+    return pool, capacities
+
+
+def fail_once(pool):
+    with pytest.raises(ConnectionError):
+        with pool.request("model"):
+            raise ConnectionError("connection refused")
+
+
+def test_learned_limit_sizes_the_pool(tmp_path):
+    pool, capacities = make_pool(tmp_path, 4)
+    assert pool.capacity == 4
+    assert pool.batch_concurrency() == 5
+    assert capacities == [4]
+
+
+def test_single_endpoint_recovers_after_one_failure(tmp_path):
+    pool, capacities = make_pool(tmp_path, 4)
+    endpoint = pool.endpoints[0]
+    fail_once(pool)
+    assert not endpoint.healthy
+    limit = endpoint.controller.limit  # The failure halved it
+
+    for _ in range(5):
+        with pool.request("model", usage={"eval_count": 10}):
+            pass
+
+    assert endpoint.healthy
+    assert pool.capacity == endpoint.controller.limit == limit
+    assert pool.batch_concurrency() == limit + 1
+    assert capacities[-1] == limit
+
+
+def test_learned_limit_still_applies_while_the_only_endpoint_is_down(tmp_path):
+    pool, _ = make_pool(tmp_path, 4)
+    fail_once(pool)
+    assert pool.capacity == pool.endpoints[0].controller.limit
+    assert pool.batch_concurrency() == pool.endpoints[0].controller.limit + 1
+
+
+def test_fixed_endpoint_keeps_its_parallel(tmp_path):
+    pool = EndpointPool([{"url": URL, "parallel": 3}])
+    assert pool.endpoints[0].controller is None
+    fail_once(pool)
+    with pool.request("model"):
+        pass
+    assert pool.capacity == 3
+    assert pool.batch_concurrency() == 3
+
+
+def test_global_setting_can_fix_parallel():
+    assert parse_endpoints(f" {URL}, http://cpu-2:11434=2 ,") == [URL, {"url": "http://cpu-2:11434", "parallel": 2}]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Streaming Response Parser Tests for ULCA
+Run with: python -m pytest test_response_stream.py
+"""
+
+from action_plan import extract_actions
+from response_stream import StreamingResponseParser, parse_response
+
+NESTED_README = """Here is the updated README.
+
+FILE: README.md
+```markdown
+# Tool
+
+Usage:
+```python
+code
+```
+
+More text.
+```
+
+```bash
+pytest -q
+```
+"""
+
+UNBALANCED = """`docs/notes.md`:
+```md
+hi
+```js
+unclosed
+```
+- TODO: check the notes
+"""
+
+
+def streamed(reply, size):
+    parser = StreamingResponseParser()
+    for start in range(0, len(reply), size):
+        parser.feed(reply[start:start + size])
+    return parser.result()
+
+
+def test_nested_fence_keeps_the_whole_file():
+    _, actions, _, _, _ = parse_response(NESTED_README)
+    assert [action["type"] for action in actions] == ["write", "command"]
+    assert actions[0]["content"] == "# Tool\n\nUsage:\n```python\ncode\n```\n\nMore text.\n"
+    assert actions[1]["command"] == "pytest -q"
+
+
+def test_stream_and_whole_text_parsers_agree():
+    for reply in (NESTED_README, UNBALANCED):
+        expected = [(action["type"], action.get("path"), action.get("content"), action.get("command"))
+                    for action in extract_actions(reply)]
+        for size in (1, 7, len(reply)):
+            _, actions, _, _, _ = streamed(reply, size)
+            assert [(action["type"], action.get("path"), action.get("content"), action.get("command"))
+                    for action in actions] == expected
+
+
+def test_unbalanced_inner_fence_falls_back_to_the_first_closer():
+    _, actions, todos, _, _ = parse_response(UNBALANCED)
+    assert actions[0]["content"] == "hi\n```js\nunclosed\n"
+    assert todos == ["- TODO: check the notes"]
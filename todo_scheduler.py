@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Parallel TODO Execution for ULCA
+Orders open TODO items into a dependency graph (explicit "after T2" references,
+or inferred from the files two items mention) and works through it with a pool
+of workers. Independent items run concurrently; writes to the same file are
+serialized by per-path locks, and items whose dependency failed are not started.
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from action_plan import PATH_TOKEN
+
+# Configuration
+TODO_PARALLELISM = 2  # Items worked on at once; raise it when several Ollama replicas or spare cores are available
+MAX_SCHEDULED_TODOS = 20  # Items taken per run, in priority order
+
+# "after T2", "depends on T1 and T3", "blocked by T4"
+DEPENDENCY_REFERENCE = re.compile(r'\b(?:after|depends on|requires|blocked by|once)\s+(T\d+(?:\s*(?:,|and|&)\s*T\d+)*)',
+                                  re.IGNORECASE)
+TODO_ID = re.compile(r'\bT\d+\b', re.IGNORECASE)
+MENTIONED_PATH = re.compile(r'(?<![\w/])`?' + PATH_TOKEN + r'`?(?![\w/])')
+
+RunItem = Callable[[Dict[str, Any]], Dict[str, Any]]  # item -> {"ok": bool, "detail": str}
+ProgressCallback = Callable[[Dict[str, Any]], None]  # {"id", "state", "detail", "duration"}
+
+
+def mentioned_paths(text: str) -> Set[str]:
+    """File paths named in a TODO ("update src/app.py") used to infer which items touch the same file"""
+    paths = set()
+    for match in MENTIONED_PATH.finditer(text):
+        path = match.group("path")
+        pure = PurePosixPath(path)
+        # "e.g." and version numbers look like paths; real file names have a word before an alphabetic suffix
+        if "/" in path or (len(pure.stem) >= 2 and re.search(r'[A-Za-z]', pure.suffix)):
+            paths.add(os.path.normpath(path))
+    return paths
+
+
+def explicit_dependencies(item: Dict[str, Any]) -> Set[str]:
+    """IDs an item declares it depends on, in its depends_on field or its text"""
+    ids = {todo_id.upper() for todo_id in item.get("depends_on", [])}
+    for match in DEPENDENCY_REFERENCE.finditer(item["text"]):
+        ids.update(todo_id.upper() for todo_id in TODO_ID.findall(match.group(1)))
+    ids.discard(item["id"])
+    return ids
+
+
+def build_graph(items: List[Dict[str, Any]]) -> Dict[str, Set[str]]:
+    """Dependencies among the given items (already in schedule order)
+
+    References to items outside the run (finished or dropped ones) count as
+    satisfied. Items naming the same file are chained in schedule order so
+    they never race on it.
+    """
+    scheduled = {item["id"] for item in items}
+    graph: Dict[str, Set[str]] = {}
+    last_toucher: Dict[str, str] = {}
+    for item in items:
+        depends = explicit_dependencies(item) & scheduled
+        for path in mentioned_paths(item["text"]):
+            if path in last_toucher:
+                depends.add(last_toucher[path])
+            last_toucher[path] = item["id"]
+        graph[item["id"]] = depends
+    return graph
+
+
+def waves(graph: Dict[str, Set[str]], order: List[str]) -> List[List[str]]:
+    """Group items into rounds that could run together; items left over are part of a cycle"""
+    done: Set[str] = set()
+    remaining = list(order)
+    rounds = []
+    while remaining:
+        ready = [todo_id for todo_id in remaining if graph[todo_id] <= done]
+        if not ready:
+            break
+        rounds.append(ready)
+        done.update(ready)
+        remaining = [todo_id for todo_id in remaining if todo_id not in done]
+    return rounds
+
+
+class PathLocks:
+    """One lock per project-relative path; an item holds every path it writes while applying"""
+
+    def __init__(self):
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, paths: Iterable[str]) -> Iterator[None]:
+        # Sorted acquisition order means two items can never deadlock on each other's files
+        with self._guard:
+            locks = [self._locks.setdefault(path, threading.Lock())
+                     for path in sorted({os.path.normpath(path) for path in paths})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+class TodoScheduler:
+    """Runs TODO items concurrently in dependency order and reports progress per item"""
+
+    def __init__(self, run_item: RunItem, parallelism: int = TODO_PARALLELISM,
+                 on_progress: Optional[ProgressCallback] = None):
+        self.run_item = run_item
+        self.parallelism = max(1, parallelism)
+        self.on_progress = on_progress
+
+    def _report(self, todo_id: str, state: str, detail: str = "", duration: Optional[float] = None):
+        if self.on_progress:
+            self.on_progress({"id": todo_id, "state": state, "detail": detail, "duration": duration})
+
+    def _timed(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        self._report(item["id"], "started")
+        try:
+            outcome = self.run_item(item)
+        except Exception as e:
+            outcome = {"ok": False, "detail": f"unexpected error: {e}"}
+        outcome["duration"] = round(time.monotonic() - started, 3)
+        return outcome
+
+    def run(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Work through the items; returns per-item outcomes with timings"""
+        order = [item["id"] for item in items]
+        by_id = {item["id"]: item for item in items}
+        graph = build_graph(items)
+        dependents: Dict[str, List[str]] = {todo_id: [] for todo_id in order}
+        for todo_id, depends in graph.items():
+            for dependency in depends:
+                dependents[dependency].append(todo_id)
+        waiting = {todo_id: len(depends) for todo_id, depends in graph.items()}
+        ready = [todo_id for todo_id in order if not waiting[todo_id]]
+        results: Dict[str, Dict[str, Any]] = {}
+
+        def block(todo_id: str, reason: str):
+            for child in dependents[todo_id]:
+                if child not in results:
+                    results[child] = {"id": child, "status": "blocked", "detail": reason, "duration": 0.0}
+                    self._report(child, "blocked", reason)
+                    block(child, f"depends on {child}, which was not completed")
+
+        started = time.monotonic()
+        running: Dict[Future, str] = {}
+        peak = 0
+        with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="ulca-todo") as pool:
+            while ready or running:
+                while ready and len(running) < self.parallelism:
+                    todo_id = ready.pop(0)
+                    running[pool.submit(self._timed, by_id[todo_id])] = todo_id
+                peak = max(peak, len(running))
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    todo_id = running.pop(future)
+                    outcome = future.result()
+                    status = "done" if outcome["ok"] else "failed"
+                    results[todo_id] = {"id": todo_id, "status": status, "detail": outcome.get("detail", ""),
+                                        "duration": outcome["duration"]}
+                    self._report(todo_id, status, outcome.get("detail", ""), outcome["duration"])
+                    if status != "done":
+                        block(todo_id, f"depends on {todo_id}, which failed")
+                        continue
+                    for child in dependents[todo_id]:
+                        waiting[child] -= 1
+                        if not waiting[child] and child not in results:
+                            ready.append(child)
+                # Keep schedule (priority) order among everything that is ready
+                ready.sort(key=order.index)
+
+        for todo_id in order:
+            if todo_id not in results:
+                results[todo_id] = {"id": todo_id, "status": "blocked", "detail": "dependency cycle", "duration": 0.0}
+                self._report(todo_id, "blocked", "dependency cycle")
+        wall_time = time.monotonic() - started
+        return {
+            "finished_at": datetime.now().isoformat(),
+            "items": [results[todo_id] for todo_id in order],
+            "parallelism": self.parallelism,
+            "peak_concurrency": peak,
+            "wall_time": round(wall_time, 3),
+            "work_time": round(sum(result["duration"] for result in results.values()), 3)
+        }
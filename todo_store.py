@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+TODO Store for ULCA
+Keeps the project TODO list as items with stable IDs, status, priority and
+insertion order, collapsing near-duplicate wordings of the same task on insert.
+"""
+
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+# Configuration
+DUPLICATE_THRESHOLD = 0.7  # Token Jaccard similarity at which two TODOs are the same task
+MIN_TODO_TOKENS = 2  # Shorter items ("Tasks:", "Next") carry no actionable content
+STATUSES = ("open", "in_progress", "done", "dropped")
+PRIORITIES = {1: "high", 2: "normal", 3: "low"}
+DEFAULT_PRIORITY = 2
+
+# List markers and labels the model puts in front of a task: "- ", "2. ", "* Task 1:", "TODO:"
+LEADING_MARKERS = re.compile(r'^\s*(?:[-*•]+\s*|\d+[.)]\s*|\[[ xX]?\]\s*|(?:todo|task)\s*\d*\s*[:.-]\s*)+', re.IGNORECASE)
+# The model narrating what it will do is not a task: "First, I'll help you organize..."
+NARRATION = re.compile(r"^(?:first|then|next|now|finally)?,?\s*(?:i'll|i will|i can|let me|let's|we can|we'll)\b",
+                       re.IGNORECASE)
+PRIORITY_HINT = re.compile(r'\b(?:urgent|critical|asap|blocker|high priority)\b|\(high\)|\[p1\]', re.IGNORECASE)
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "into", "for", "on", "with", "by", "at", "from",
+    "be", "is", "are", "it", "its", "this", "that", "these", "those", "as", "so", "all", "each",
+    "then", "first", "next", "also", "more", "any", "some", "our", "your", "their", "we", "you"
+}
+# Modifiers that reword a task without changing it: "clear steps", "specific steps", "manageable steps"
+FILLER_WORDS = {
+    "clear", "specific", "complex", "manageable", "small", "smaller", "simple", "proper", "properly",
+    "better", "basic", "detailed", "clean", "good", "relevant", "necessary", "appropriate", "overall",
+    "initial", "possible", "various", "different", "multiple", "individual", "actual", "certain"
+}
+
+TodoListener = Callable[[str, Dict[str, Any]], None]  # ("added" | "merged" | "updated", item)
+
+
+def clean_text(text: str) -> str:
+    """Strip list markers, labels and wrapping quotes from a TODO line"""
+    text = LEADING_MARKERS.sub("", text.strip()).strip().strip('"\'')
+    return LEADING_MARKERS.sub("", text).strip()  # Quoted items carry their own numbering
+
+
+def _stem(token: str) -> str:
+    for suffix in ("ing", "es", "ed", "s"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def signature(text: str) -> Set[str]:
+    """Normalized content tokens used to compare two wordings of a task"""
+    # Identifiers keep their exact spelling: "fix parse_args" and "fix parse_argv" differ
+    tokens = re.findall(r"[A-Za-z0-9_./-]+", clean_text(text))
+    words = set()
+    for token in tokens:
+        if re.search(r'[_./]|\d|[a-z][A-Z]', token):
+            words.add(token)
+        else:
+            lowered = token.lower().strip("-")
+            if lowered and lowered not in STOPWORDS and lowered not in FILLER_WORDS:
+                words.add(_stem(lowered))
+    return words
+
+
+def is_actionable(text: str) -> bool:
+    """Reject section headers, narration and fragments the parser picked up as TODOs"""
+    cleaned = clean_text(text)
+    if not cleaned or cleaned.endswith(":") or NARRATION.match(cleaned):
+        return False
+    return len(signature(cleaned)) >= MIN_TODO_TOKENS
+
+
+class TodoStore:
+    """TODO items held in the context's todo_list, indexed by ID and by content token"""
+
+    def __init__(self, items: List[Any], on_change: Optional[TodoListener] = None):
+        self.items = items  # The context list itself, so saving the context saves the store
+        self.next_id = 1
+        self.on_change = on_change
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_token: Dict[str, Set[str]] = {}
+        self._signatures: Dict[str, Set[str]] = {}
+
+        # Older contexts stored plain strings; convert them, collapsing their duplicates
+        legacy = [item for item in items if isinstance(item, str)]
+        items[:] = [item for item in items if isinstance(item, dict)]
+        for item in items:
+            self._index(item)
+            self.next_id = max(self.next_id, int(item["id"].lstrip("T")) + 1)
+        for text in legacy:
+            self.add(text, notify=False)
+        self.converted = len(legacy)
+
+    def _index(self, item: Dict[str, Any]):
+        words = signature(item["text"])
+        self._by_id[item["id"]] = item
+        self._signatures[item["id"]] = words
+        for word in words:
+            self._by_token.setdefault(word, set()).add(item["id"])
+
+    def get(self, todo_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(todo_id.upper() if todo_id.lower().startswith("t") else f"T{todo_id}")
+
+    def find_duplicate(self, text: str) -> Optional[Dict[str, Any]]:
+        """The most similar existing item at or above DUPLICATE_THRESHOLD, via the token index"""
+        words = signature(text)
+        if not words:
+            return None
+        shared: Dict[str, int] = {}
+        for word in words:
+            for todo_id in self._by_token.get(word, ()):
+                shared[todo_id] = shared.get(todo_id, 0) + 1
+        best, best_score = None, 0.0
+        for todo_id, overlap in shared.items():
+            other = self._signatures[todo_id]
+            score = overlap / len(words | other)
+            if score > best_score:
+                best, best_score = todo_id, score
+        return self._by_id[best] if best is not None and best_score >= DUPLICATE_THRESHOLD else None
+
+    def add(self, text: str, priority: Optional[int] = None, notify: bool = True) -> Optional[Dict[str, Any]]:
+        """Insert a TODO or fold it into its near-duplicate; returns the item, or None if not actionable"""
+        if not is_actionable(text):
+            return None
+        now = datetime.now().isoformat()
+        duplicate = self.find_duplicate(text)
+        if duplicate is not None:
+            duplicate["mentions"] = duplicate.get("mentions", 1) + 1
+            duplicate["updated_at"] = now
+            if priority is not None and priority < duplicate["priority"]:
+                duplicate["priority"] = priority
+            if notify and self.on_change:
+                self.on_change("merged", duplicate)
+            return duplicate
+
+        cleaned = clean_text(text)
+        item = {
+            "id": f"T{self.next_id}",
+            "text": cleaned,
+            "status": "open",
+            "priority": priority or (1 if PRIORITY_HINT.search(cleaned) else DEFAULT_PRIORITY),
+            "order": self.next_id,
+            "mentions": 1,
+            "created_at": now,
+            "updated_at": now
+        }
+        self.next_id += 1
+        self.items.append(item)
+        self._index(item)
+        if notify and self.on_change:
+            self.on_change("added", item)
+        return item
+
+    def update(self, todo_id: str, status: Optional[str] = None, priority: Optional[int] = None,
+               depends_on: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Change an item's status, priority or dependencies; raises KeyError or ValueError for bad input"""
+        item = self.get(todo_id)
+        if item is None:
+            raise KeyError(f"no TODO {todo_id}")
+        if status is not None:
+            if status not in STATUSES:
+                raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+            item["status"] = status
+        if priority is not None:
+            if priority not in PRIORITIES:
+                raise ValueError("priority must be 1 (high), 2 (normal) or 3 (low)")
+            item["priority"] = priority
+        if depends_on is not None:
+            resolved = [self.get(other) for other in depends_on]
+            if None in resolved:
+                raise KeyError(f"no TODO {depends_on[resolved.index(None)]}")
+            if item in resolved:
+                raise ValueError(f"{item['id']} cannot depend on itself")
+            item["depends_on"] = [other["id"] for other in resolved]
+        item["updated_at"] = datetime.now().isoformat()
+        if self.on_change:
+            self.on_change("updated", item)
+        return item
+
+    def active(self) -> List[Dict[str, Any]]:
+        """Open and in-progress items, highest priority first, then in insertion order"""
+        return sorted((item for item in self.items if item["status"] in ("open", "in_progress")),
+                      key=lambda item: (item["priority"], item["order"]))
+
+    def ordered(self) -> List[Dict[str, Any]]:
+        """All items: active ones first, then done, then dropped"""
+        rank = {status: index for index, status in enumerate(STATUSES)}
+        return sorted(self.items, key=lambda item: (min(rank[item["status"]], 1), rank[item["status"]],
+                                                   item["priority"], item["order"]))
+
+    def prompt_lines(self) -> List[str]:
+        """Compact form for the LLM prompt: only work that is still open"""
+        return [f"[{item['id']}] ({PRIORITIES[item['priority']]}{', in progress' if item['status'] == 'in_progress' else ''}) "
+                f"{item['text']}" for item in self.active()]
+
+
+def format_item(item: Dict[str, Any]) -> str:
+    marks = {"open": "☐", "in_progress": "▶", "done": "☑", "dropped": "✗"}
+    priority = "" if item["priority"] == DEFAULT_PRIORITY else f" [{PRIORITIES[item['priority']]}]"
+    repeats = f" (x{item['mentions']})" if item.get("mentions", 1) > 1 else ""
+    after = f" (after {', '.join(item['depends_on'])})" if item.get("depends_on") else ""
+    return f"{marks[item['status']]} {item['id']}{priority} {item['text']}{after}{repeats}"
@@ -18,10 +18,11 @@ from PyQt6.QtWidgets import (
     QTreeWidgetItem, QTabWidget, QTextBrowser, QProgressBar, QStatusBar,
     QToolBar, QMenuBar, QFileDialog, QMessageBox, QDialog, QDialogButtonBox,
     QVBoxLayout as QVBox, QHBoxLayout as QHBox, QFormLayout, QSpinBox,
-    QComboBox, QCheckBox, QGroupBox, QScrollArea, QFrame, QSizePolicy
+    QComboBox, QCheckBox, QGroupBox, QScrollArea, QFrame, QSizePolicy,
+    QListWidget, QListWidgetItem
 )
 from PyQt6.QtCore import (
-    Qt, QThread, pyqtSignal, QTimer, QSettings, QSize, QMimeData,
+    Qt, QObject, pyqtSignal, QTimer, QSettings, QSize, QMimeData,
     QUrl, QPropertyAnimation, QEasingCurve, QRect
 )
 from PyQt6.QtGui import (
@@ -31,32 +32,31 @@ from PyQt6.QtGui import (
 )
 
 # Import the existing ULCA backend
-from universal_claude_agent import ULCAgent
+from async_agent import AsyncULCAgent, EventLoopThread
+from language_support import LANGUAGE_KEYWORDS
+from todo_store import format_item
 
-class LLMWorker(QThread):
-    """Worker thread for LLM API calls"""
-    response_received = pyqtSignal(str)
-    error_occurred = pyqtSignal(str)
-    progress_updated = pyqtSignal(int)
+class AgentTaskBridge(QObject):
+    """Carries results of agent coroutines from the shared event loop thread to the GUI thread"""
+    finished = pyqtSignal(str, str)  # (task, result)
+    failed = pyqtSignal(str, str)  # (task, error)
     
-    def __init__(self, agent: ULCAgent, prompt: str):
-        super().__init__()
-        self.agent = agent
-        self.prompt = prompt
-        
-    def run(self):
-        try:
-            # Emit progress updates
-            self.progress_updated.emit(25)
-            
-            # Call the LLM
-            response = self.agent.process_user_input(self.prompt)
-            
-            self.progress_updated.emit(100)
-            self.response_received.emit(response)
-            
-        except Exception as e:
-            self.error_occurred.emit(str(e))
+    def watch(self, task: str, future):
+        """Emit finished or failed when a future from EventLoopThread.submit completes"""
+        def done(future):
+            try:
+                self.finished.emit(task, future.result())
+            except Exception as e:
+                self.failed.emit(task, str(e))
+        future.add_done_callback(done)
+
+class CommandOutputBridge(QObject):
+    """Carries command output lines from worker threads to the GUI thread"""
+    line_received = pyqtSignal(str, str)  # (stream, line)
+
+class ResponseEventBridge(QObject):
+    """Carries early parse events of a streaming reply from the worker thread to the GUI thread"""
+    event_received = pyqtSignal(str, object)  # (kind, payload)
 
 class ConfirmationDialog(QDialog):
     """Modal dialog for file operation confirmations"""
@@ -154,37 +154,19 @@ class CodeEditor(QTextEdit):
             
     def highlight_python(self, colors):
         """Apply Python syntax highlighting"""
-        keywords = ['def', 'class', 'import', 'from', 'as', 'if', 'else', 'elif', 
-                   'for', 'while', 'try', 'except', 'finally', 'with', 'return', 
-                   'True', 'False', 'None', 'self', 'lambda', 'yield', 'async', 'await']
-        
-        self.highlight_keywords(keywords, colors['keywords'])
+        self.highlight_keywords(LANGUAGE_KEYWORDS['python'], colors['keywords'])
         
     def highlight_javascript(self, colors):
         """Apply JavaScript/TypeScript syntax highlighting"""
-        keywords = ['function', 'const', 'let', 'var', 'if', 'else', 'for', 'while',
-                   'try', 'catch', 'finally', 'return', 'class', 'extends', 'import',
-                   'export', 'default', 'async', 'await', 'new', 'this', 'super']
-        
-        self.highlight_keywords(keywords, colors['keywords'])
+        self.highlight_keywords(LANGUAGE_KEYWORDS['javascript'], colors['keywords'])
         
     def highlight_java_kotlin(self, colors):
         """Apply Java/Kotlin syntax highlighting"""
-        keywords = ['public', 'private', 'protected', 'class', 'interface', 'enum',
-                   'if', 'else', 'for', 'while', 'try', 'catch', 'finally', 'return',
-                   'new', 'this', 'super', 'static', 'final', 'abstract', 'extends',
-                   'implements', 'import', 'package', 'fun', 'val', 'var', 'when']
-        
-        self.highlight_keywords(keywords, colors['keywords'])
+        self.highlight_keywords(LANGUAGE_KEYWORDS['java_kotlin'], colors['keywords'])
         
     def highlight_swift(self, colors):
         """Apply Swift syntax highlighting"""
-        keywords = ['func', 'class', 'struct', 'enum', 'protocol', 'extension',
-                   'if', 'else', 'for', 'while', 'guard', 'defer', 'return',
-                   'var', 'let', 'init', 'self', 'super', 'import', 'public',
-                   'private', 'internal', 'final', 'override', 'convenience']
-        
-        self.highlight_keywords(keywords, colors['keywords'])
+        self.highlight_keywords(LANGUAGE_KEYWORDS['swift'], colors['keywords'])
         
     def highlight_keywords(self, keywords, color):
         """Highlight keywords in the text"""
@@ -211,6 +193,7 @@ class FileExplorer(QTreeWidget):
         self.setHeaderLabel("Project Files")
         self.setColumnCount(1)
         self.itemClicked.connect(self.on_item_clicked)
+        self.itemExpanded.connect(self.on_item_expanded)
         
     def set_project_directory(self, project_dir: str):
         """Set the project directory and populate the tree"""
@@ -227,7 +210,7 @@ class FileExplorer(QTreeWidget):
         self.expandItem(root_item)
         
     def populate_tree(self, parent_item: QTreeWidgetItem, directory: Path):
-        """Recursively populate the tree with directory contents"""
+        """Populate one directory level; subdirectories load when expanded"""
         try:
             for item in sorted(directory.iterdir()):
                 if item.name.startswith('.'):  # Skip hidden files
@@ -239,7 +222,8 @@ class FileExplorer(QTreeWidget):
                 if item.is_dir():
                     tree_item.setIcon(0, self.style().standardIcon(self.style().StandardPixmap.SP_DirIcon))
                     tree_item.setData(0, Qt.ItemDataRole.UserRole, str(item))
-                    self.populate_tree(tree_item, item)
+                    # Placeholder child so the expand arrow shows without walking the subtree
+                    QTreeWidgetItem(tree_item)
                 else:
                     # Set appropriate icon based on file type
                     icon = self.get_file_icon(item)
@@ -250,6 +234,12 @@ class FileExplorer(QTreeWidget):
             # Skip directories we can't access
             pass
             
+    def on_item_expanded(self, item: QTreeWidgetItem):
+        """Load a directory's contents the first time it is expanded"""
+        if item.childCount() == 1 and item.child(0).data(0, Qt.ItemDataRole.UserRole) is None:
+            item.takeChild(0)
+            self.populate_tree(item, Path(item.data(0, Qt.ItemDataRole.UserRole)))
+            
     def get_file_icon(self, file_path: Path) -> QIcon:
         """Get appropriate icon for file type"""
         extension = file_path.suffix.lower()
@@ -346,6 +336,7 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.agent = None
+        self.agent_loop = EventLoopThread()  # Every agent turn runs here instead of in a thread per message
         self.current_file = None
         self.settings = QSettings("ULCA", "DesktopGUI")
         
@@ -409,6 +400,13 @@ class MainWindow(QMainWindow):
             }
         """)
         self.tab_widget.addTab(self.terminal_output, "Terminal")
+        self.command_output_bridge = CommandOutputBridge()
+        self.command_output_bridge.line_received.connect(self.append_terminal_line)
+        self.response_event_bridge = ResponseEventBridge()
+        self.response_event_bridge.event_received.connect(self.handle_response_event)
+        self.agent_task_bridge = AgentTaskBridge()
+        self.agent_task_bridge.finished.connect(self.handle_agent_task)
+        self.agent_task_bridge.failed.connect(self.handle_agent_task_error)
         
         center_layout.addWidget(self.tab_widget)
         center_panel.setLayout(center_layout)
@@ -437,8 +435,9 @@ class MainWindow(QMainWindow):
         todo_group = QGroupBox("TODO List")
         todo_layout = QVBox()
         
-        self.todo_display = QTextBrowser()
+        self.todo_display = QListWidget()
         self.todo_display.setMaximumHeight(200)
+        self.todo_rows: Dict[str, QListWidgetItem] = {}  # TODO ID -> row, so changes update one row
         todo_layout.addWidget(self.todo_display)
         
         todo_group.setLayout(todo_layout)
@@ -533,7 +532,9 @@ class MainWindow(QMainWindow):
             project_dir = os.getcwd()
             
             # Create agent
-            self.agent = ULCAgent(project_dir)
+            self.agent = AsyncULCAgent(project_dir)
+            self.agent.add_output_listener(self.command_output_bridge.line_received.emit)
+            self.agent.add_response_listener(self.response_event_bridge.event_received.emit)
             
             # Update UI
             self.project_dir_label.setText(f"Project: {Path(project_dir).name}")
@@ -545,12 +546,29 @@ class MainWindow(QMainWindow):
             # Update TODO list
             self.update_todo_display()
             
-                    # Add welcome message
+            # Indexes are validated against the snapshot in the background
+            self.statusBar().showMessage("Indexing project in background...")
+            QTimer.singleShot(500, self.check_index_ready)
+            
+            # Add welcome message
             self.add_chat_message("ULCA", "Hello! I'm your Universal Local Claude Agent. I'm ready to help you with your project development. What would you like to work on?", "system")
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to initialize agent: {str(e)}")
             
+    def check_index_ready(self):
+        """Poll the agent's background index refresh and report when it is done"""
+        if not self.agent:
+            return
+        if self.agent.index_cache.ready.is_set():
+            refresh = self.agent.index_cache.last_refresh
+            start_type = "warm start" if refresh.get("warm_start") else "full scan"
+            self.statusBar().showMessage(
+                f"Index ready ({start_type}, {refresh.get('changed_files', 0)} changed files)"
+            )
+        else:
+            QTimer.singleShot(500, self.check_index_ready)
+            
     def apply_settings(self):
         """Apply settings changes to the UI"""
         # Apply editor settings
@@ -649,15 +667,57 @@ class MainWindow(QMainWindow):
         self.llm_progress.setValue(0)
         self.llm_status_label.setText("Status: Processing...")
         
-        # Create worker thread for LLM call
-        self.llm_worker = LLMWorker(self.agent, message)
-        self.llm_worker.response_received.connect(self.handle_llm_response)
-        self.llm_worker.error_occurred.connect(self.handle_llm_error)
-        self.llm_worker.progress_updated.connect(self.llm_progress.setValue)
-        
-        # Start worker
-        self.llm_worker.start()
+        self.llm_progress.setValue(25)
+        self.run_agent_task("turn", self.agent.aprocess_user_input(message))
+        
+    def run_agent_task(self, task: str, coroutine):
+        """Run an agent coroutine on the shared event loop; the result comes back as a signal"""
+        self.agent_task_bridge.watch(task, self.agent_loop.submit(coroutine))
+        
+    def handle_agent_task(self, task: str, result: str):
+        """Route a finished agent coroutine to its handler"""
+        if task == "turn":
+            self.llm_progress.setValue(100)
+            self.handle_llm_response(result)
+        elif task == "confirmation":
+            self.handle_confirmation_result(result)
+        elif task == "test":
+            self.handle_test_response(result)
+            
+    def handle_agent_task_error(self, task: str, error: str):
+        """Route a failed agent coroutine to its error handler"""
+        if task == "test":
+            self.handle_test_error(error)
+        else:
+            self.handle_llm_error(error)
+        
+    def append_terminal_line(self, stream: str, line: str):
+        """Append one line of command output to the Terminal tab"""
+        colors = {"command": "#6897bb", "stderr": "#e74c3c", "status": "#808080"}
+        escaped = line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        if stream == "command":
+            escaped = f"$ {escaped}"
+        color = colors.get(stream)
+        html = f'<span style="color: {color};">{escaped}</span>' if color else escaped
+        self.terminal_output.append(f'<pre style="margin: 0;">{html}</pre>')
+        
+        # Keep the view pinned to the newest output
+        scrollbar = self.terminal_output.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
         
+    def handle_response_event(self, kind: str, payload):
+        """Reflect TODOs, actions and confirmation requests while the reply is still streaming"""
+        if kind in ("todo_added", "todo_merged", "todo_updated"):
+            self.show_todo_item(payload)
+        elif kind == "todo_progress":
+            self.llm_status_label.setText(f"Status: {payload['id']} {payload['state']}")
+        elif kind == "action":
+            target = payload.get('path') or payload.get('command')
+            self.llm_status_label.setText(f"Status: Proposed {payload['type']} {target}")
+        elif kind == "confirmation":
+            self.llm_status_label.setText("Status: Claude is asking for confirmation...")
+            self.llm_progress.setValue(75)
+            
     def handle_llm_response(self, response: str):
         """Handle LLM response"""
         # Hide progress
@@ -707,23 +767,44 @@ class MainWindow(QMainWindow):
         if not self.agent:
             return
             
-        # Send confirmation to agent
-        if hasattr(self.agent, '_handle_confirmation_response'):
-            result = self.agent._handle_confirmation_response(response)
+        # Approval may apply a plan or resume generation: keep it off the GUI thread
+        self.llm_status_label.setText("Status: Processing...")
+        self.run_agent_task("confirmation", self.agent.ahandle_confirmation_response(response))
+        
+    def handle_confirmation_result(self, result: str):
+        """Show what the agent did with the user's confirmation answer"""
+        self.llm_status_label.setText("Status: Ready")
+        if result == "AWAITING_CONFIRMATION":
+            # Approval produced a concrete plan that needs its own review
+            self.show_confirmation_dialog()
+        else:
             self.add_chat_message("Claude", result, "assistant")
+        self.update_todo_display()
             
     def update_todo_display(self):
         """Update the TODO list display"""
         if not self.agent:
             return
             
-        todos = self.agent.context.get('todo_list', [])
-        if todos:
-            todo_text = "\n".join([f"• {todo}" for todo in todos])
-        else:
-            todo_text = "No TODO items"
-            
-        self.todo_display.setPlainText(todo_text)
+        self.todo_display.clear()
+        self.todo_rows = {}
+        todos = self.agent.todos.ordered()
+        if not todos:
+            self.todo_display.addItem("No TODO items")
+        for todo in todos:
+            self.show_todo_item(todo)
+            
+    def show_todo_item(self, todo: Dict[str, Any]):
+        """Add or refresh a single TODO row without rebuilding the list"""
+        if not self.todo_rows:
+            self.todo_display.clear()  # Drop the "No TODO items" placeholder
+        row = self.todo_rows.get(todo["id"])
+        if row is None:
+            row = QListWidgetItem()
+            self.todo_display.addItem(row)
+            self.todo_rows[todo["id"]] = row
+        row.setText(format_item(todo))
+        row.setToolTip(f"{todo['status']} - mentioned {todo.get('mentions', 1)}x, updated {todo['updated_at']}")
         
     def test_llm_connection(self):
         """Test LLM connection"""
@@ -737,12 +818,7 @@ class MainWindow(QMainWindow):
             # Simple test prompt
             test_prompt = "Please respond with 'Connection test successful!' and nothing else."
             
-            # Create worker for test
-            self.test_worker = LLMWorker(self.agent, test_prompt)
-            self.test_worker.response_received.connect(self.handle_test_response)
-            self.test_worker.error_occurred.connect(self.handle_test_error)
-            
-            self.test_worker.start()
+            self.run_agent_task("test", self.agent.aprocess_user_input(test_prompt))
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to test LLM: {str(e)}")
@@ -783,6 +859,14 @@ class MainWindow(QMainWindow):
         self.settings.setValue("geometry", self.saveGeometry())
         self.settings.setValue("windowState", self.saveState())
         
+        # Write pending context changes and stop jobs before the loop goes away
+        if self.agent:
+            try:
+                self.agent_loop.run(self.agent.aclose(), timeout=10)
+            except Exception:
+                pass
+        self.agent_loop.stop()
+        
         event.accept()
 
 def main():
@@ -0,0 +1,683 @@
+#!/usr/bin/env python3
+"""
+Daemon Mode for ULCA
+`serve` keeps one AsyncULCAgent per project warm on a single event loop: loaded
+context, symbol and semantic indexes, the digest worker and a model Ollama keeps
+in memory. A JSON API on localhost exposes them, streaming replies as server-sent
+events. ULCAClient speaks that API, and `attach` turns the CLI into a thin client.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import signal
+import statistics
+import sys
+import time
+from datetime import datetime
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from async_agent import AsyncULCAgent
+from llm_endpoints import shared_pool
+from llm_scheduler import BACKGROUND, shared_scheduler
+from todo_store import format_item
+from universal_claude_agent import LLM_ERROR_REPLY, OLLAMA_API_BASE, REQUEST_TIMEOUT
+
+# Configuration
+SERVE_HOST = "127.0.0.1"  # Loopback only: the API edits files and runs commands
+SERVE_PORT = 8765
+SERVE_KEEP_ALIVE = "30m"  # Ollama keep_alive for served projects, so the model stays loaded between turns
+SERVER_INFO_FILE = Path.home() / ".ulca" / "server.json"  # URL and token of the running daemon, owner-readable only
+REQUEST_READ_TIMEOUT = 30
+MAX_REQUEST_BYTES = 1024 * 1024
+HISTORY_LIMIT = 20
+METRIC_SAMPLES = 200  # Turn timings kept per project
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+
+RunTurn = Callable[[], Awaitable[str]]
+EventSink = Callable[[str, str], None]  # (kind, JSON payload)
+
+
+class APIError(Exception):
+    """A request the daemon rejects, with the HTTP status to answer it with"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def write_server_info(info_file: Path, url: str, token: str):
+    """Publish where the daemon listens; the token makes the file a credential, so only the owner may read it"""
+    info_file.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(info_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({"url": url, "token": token, "pid": os.getpid(), "started_at": datetime.now().isoformat()}, f,
+                  indent=2)
+
+
+def read_server_info(info_file: Path = SERVER_INFO_FILE) -> Optional[Dict[str, Any]]:
+    try:
+        with open(info_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+
+
+def search_history(history: List[Dict[str, Any]], query: str, limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
+    """Conversation entries containing every word of the query, newest first"""
+    words = query.lower().split()
+    matches = []
+    for entry in reversed(history):
+        text = f"{entry.get('user_input', '')}\n{entry.get('agent_response', '')}".lower()
+        if all(word in text for word in words):
+            matches.append(entry)
+            if len(matches) >= limit:
+                break
+    return matches
+
+
+def iter_events(lines: Iterable[str]) -> Iterator[Tuple[str, Any]]:
+    """(event, JSON data) pairs from the lines of a server-sent event stream"""
+    kind, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield kind, json.loads("\n".join(data))
+            kind, data = "message", []
+        elif line.startswith("event:"):
+            kind = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[6:] if line.startswith("data: ") else line[5:])
+
+
+async def read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+    """Method, target, lower-cased headers and body of one HTTP/1.1 request"""
+    request_line = await reader.readline()
+    if not request_line:
+        raise ConnectionError("client closed the connection")
+    try:
+        method, target, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise APIError(400, "malformed request line")
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise APIError(400, "invalid Content-Length")
+    if length > MAX_REQUEST_BYTES:
+        raise APIError(413, f"request body over {MAX_REQUEST_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, payload: Any):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    writer.write((f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+async def send_event(writer: asyncio.StreamWriter, kind: str, data: str) -> bool:
+    """Write one event as its own HTTP chunk so clients see it at once; False once the client is gone"""
+    event = f"event: {kind}\ndata: {data}\n\n".encode("utf-8")
+    try:
+        writer.write(f"{len(event):x}\r\n".encode("latin-1") + event + b"\r\n")
+        await writer.drain()
+        return True
+    except (ConnectionError, OSError):
+        return False
+
+
+class ProjectSession:
+    """A warm agent for one project and the timings of the turns served from it"""
+
+    def __init__(self, agent: AsyncULCAgent):
+        self.agent = agent
+        self.lock = asyncio.Lock()  # A turn takes over the agent's listeners, so turns run one at a time
+        self.opened_at = datetime.now().isoformat()
+        self.warmup: Optional[asyncio.Future] = None
+        self.turns = 0
+        self.errors = 0
+        self.tokens = 0
+        self.first_token: List[float] = []
+        self.turn_time: List[float] = []
+
+    async def turn(self, run: RunTurn, on_event: EventSink) -> Dict[str, Any]:
+        """Run one message or confirmation, forwarding its tokens, TODOs, actions and command output"""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        first_token: List[float] = []
+
+        def forward(kind: str, payload: Any):
+            # Events come from the loop, from command threads and from background jobs alike
+            if kind == "token":
+                self.tokens += 1
+                if not first_token:
+                    first_token.append(time.monotonic() - started)
+            loop.call_soon_threadsafe(on_event, kind, json.dumps(payload, default=str))
+
+        def forward_output(stream: str, line: str):
+            forward("output", {"stream": stream, "line": line})
+
+        async with self.lock:
+            self.agent.add_response_listener(forward)
+            self.agent.add_output_listener(forward_output)
+            try:
+                reply = await run()
+            except APIError:
+                raise
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.agent.remove_response_listener(forward)
+                self.agent.remove_output_listener(forward_output)
+
+        duration = time.monotonic() - started
+        self.turns += 1
+        if reply == LLM_ERROR_REPLY:
+            self.errors += 1
+        self._sample(self.turn_time, duration)
+        if first_token:
+            self._sample(self.first_token, first_token[0])
+        awaiting = reply == "AWAITING_CONFIRMATION"
+        return {
+            "reply": self.agent.pending_question if awaiting else reply,
+            "awaiting_confirmation": self.agent.confirmation_mode,
+            "question": self.agent.pending_question,
+            "duration": round(duration, 3)
+        }
+
+    @staticmethod
+    def _sample(samples: List[float], value: float):
+        samples.append(value)
+        del samples[:-METRIC_SAMPLES]
+
+    def status(self) -> Dict[str, Any]:
+        agent = self.agent
+        return {
+            "project": str(agent.project_dir),
+            "opened_at": self.opened_at,
+            "project_goal": agent.context.get("project_goal", ""),
+            "current_status": agent.context.get("current_status", ""),
+            "awaiting_confirmation": agent.confirmation_mode,
+            "question": agent.pending_question,
+            "open_todos": len(agent.todos.active()),
+            "running_jobs": agent.jobs.running_count()
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        def mean(samples: List[float]) -> float:
+            return round(statistics.mean(samples), 3) if samples else 0.0
+
+        return {
+            "turns": self.turns,
+            "errors": self.errors,
+            "tokens": self.tokens,
+            "first_token_mean": mean(self.first_token),
+            "turn_time_mean": mean(self.turn_time),
+            "turn_time_max": round(max(self.turn_time), 3) if self.turn_time else 0.0,
+            "open_todos": len(self.agent.todos.active()),
+            "running_jobs": self.agent.jobs.running_count(),
+            "file_operations": len(self.agent.context.get("file_operations", [])),
+            "build_attempts": len(self.agent.context.get("build_attempts", []))
+        }
+
+
+class ULCAServer:
+    """Warm agents per project behind a local JSON API with server-sent event streaming
+
+    Every request carries the project directory ("project" in the JSON body or
+    query string); its agent is created on first use and kept until shutdown.
+    A streamed turn keeps running if its client disconnects, so a confirmation it
+    asks for can still be answered from another client.
+    """
+
+    def __init__(self, host: str = SERVE_HOST, port: int = SERVE_PORT, token: Optional[str] = None,
+                 info_file: Path = SERVER_INFO_FILE):
+        self.host = host
+        self.port = port
+        self.token = token or secrets.token_urlsafe(24)
+        self.info_file = info_file
+        self.sessions: Dict[Path, ProjectSession] = {}
+        self._opening: Dict[Path, asyncio.Future] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._started = time.monotonic()
+        self.routes: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+            ("GET", "/health"): self.health,
+            ("GET", "/projects"): self.list_projects,
+            ("POST", "/projects"): self.open_project,
+            ("GET", "/status"): self.status,
+            ("GET", "/todos"): self.todos,
+            ("GET", "/jobs"): self.jobs,
+            ("GET", "/metrics"): self.metrics,
+            ("GET", "/history"): self.history
+        }
+        # POST only; answered as an event stream when the client accepts text/event-stream
+        self.turns: Dict[str, Callable[[Dict[str, Any]], Awaitable[Tuple[ProjectSession, RunTurn]]]] = {
+            "/messages": self.message_turn,
+            "/confirm": self.confirm_turn
+        }
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # Port 0 picks a free one
+        write_server_info(self.info_file, self.url, self.token)
+
+    async def serve_forever(self, projects: Iterable[str] = ()):
+        await self.start()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (NotImplementedError, RuntimeError):
+            pass  # No signal handlers on Windows event loops
+        print(f"🛰️  ULCA daemon listening on {self.url}")
+        print(f"🔑 Clients find the URL and token in {self.info_file}")
+        try:
+            for project in projects:
+                await self.session(project)
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stop accepting requests, flush every agent's context and stop its jobs and shell"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for session in list(self.sessions.values()):
+            await session.agent.aclose()
+        self.sessions.clear()
+        info = read_server_info(self.info_file)
+        if info and info.get("token") == self.token:
+            self.info_file.unlink(missing_ok=True)
+
+    async def session(self, project: Optional[str]) -> ProjectSession:
+        """The warm session for a project directory, starting its agent on first use"""
+        if not project:
+            raise APIError(400, "missing 'project' (the project directory)")
+        path = Path(project).expanduser().resolve()
+        if path in self.sessions:
+            return self.sessions[path]
+        if not path.is_dir():
+            raise APIError(404, f"no such project directory: {path}")
+        if path not in self._opening:
+            self._opening[path] = asyncio.ensure_future(self._open(path))
+        # Shielded: a client hanging up must not abort an agent other requests wait for
+        return await asyncio.shield(self._opening[path])
+
+    async def _open(self, path: Path) -> ProjectSession:
+        print(f"🔥 Warming up {path}")
+        try:
+            # Loading the context and starting the index cache touch the disk
+            agent = await asyncio.to_thread(AsyncULCAgent, str(path))
+        finally:
+            self._opening.pop(path, None)
+        agent.llm_keep_alive = SERVE_KEEP_ALIVE
+        session = ProjectSession(agent)
+        self.sessions[path] = session
+        # An empty prompt makes Ollama load the model without generating anything
+        session.warmup = asyncio.ensure_future(agent._acall_llm("", num_predict=1, quiet=True, priority=BACKGROUND))
+        return session
+
+    def _check_access(self, headers: Dict[str, str]):
+        host = headers.get("host", "")
+        if not host.endswith("]"):
+            host = host.rsplit(":", 1)[0]
+        # A web page can reach localhost through DNS rebinding, but it cannot fake the Host header
+        if host not in LOCAL_HOSTS + (self.host,):
+            raise APIError(403, f"unexpected Host header {host!r}")
+        if not secrets.compare_digest(headers.get("authorization", ""), f"Bearer {self.token}"):
+            raise APIError(401, f"missing or wrong bearer token (see {self.info_file})")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, target, headers, body = await asyncio.wait_for(read_request(reader), REQUEST_READ_TIMEOUT)
+                self._check_access(headers)
+                parts = urlsplit(target)
+                params: Dict[str, Any] = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+                if body:
+                    data = json.loads(body)
+                    if not isinstance(data, dict):
+                        raise APIError(400, "the request body must be a JSON object")
+                    params.update(data)
+                if method == "POST" and parts.path in self.turns:
+                    session, run = await self.turns[parts.path](params)
+                    if "text/event-stream" in headers.get("accept", ""):
+                        await self._stream_turn(writer, session, run)
+                    else:
+                        await send_json(writer, 200, await session.turn(run, lambda kind, data: None))
+                    return
+                route = self.routes.get((method, parts.path))
+                if route is None:
+                    known = parts.path in self.turns or any(path == parts.path for _, path in self.routes)
+                    raise APIError(405 if known else 404, f"no route for {method} {parts.path}")
+                await send_json(writer, 200, await route(params))
+            except APIError as e:
+                await send_json(writer, e.status, {"error": str(e)})
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                await send_json(writer, 400, {"error": "the request body is not valid JSON"})
+            except asyncio.TimeoutError:
+                await send_json(writer, 408, {"error": "request not received in time"})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            except Exception as e:
+                print(f"❌ Request failed: {e}")
+                await send_json(writer, 500, {"error": f"unexpected error: {e}"})
+        except (ConnectionError, OSError):
+            pass  # Client went away before the answer was written
+        finally:
+            writer.close()
+
+    async def _stream_turn(self, writer: asyncio.StreamWriter, session: ProjectSession, run: RunTurn):
+        """Answer with text/event-stream: one event per token, TODO, action and output line, then done or error"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        events: "asyncio.Queue[Optional[Tuple[str, str]]]" = asyncio.Queue()
+        task = asyncio.ensure_future(session.turn(run, lambda kind, data: events.put_nowait((kind, data))))
+        # Events reach the queue through call_soon_threadsafe, so they are all in before this sentinel
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        connected = True
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            if connected:
+                connected = await send_event(writer, *event)
+        try:
+            final = ("done", json.dumps(task.result(), default=str))
+        except Exception as e:
+            final = ("error", json.dumps({"status": getattr(e, "status", 500), "message": str(e)}))
+        if connected and await send_event(writer, *final):
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+    async def health(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"ok": True, "pid": os.getpid(), "uptime": round(time.monotonic() - self._started, 1),
+                "projects": [str(path) for path in self.sessions]}
+
+    async def list_projects(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"projects": [session.status() for session in self.sessions.values()]}
+
+    async def open_project(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.session(params.get("project"))).status()
+
+    async def status(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.session(params.get("project"))).status()
+
+    async def todos(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Open TODOs in priority order, or every item with all=1"""
+        todos = (await self.session(params.get("project"))).agent.todos
+        show_all = str(params.get("all", "")).lower() in ("1", "true", "yes")
+        return {"items": todos.ordered() if show_all else todos.active()}
+
+    async def jobs(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        jobs = (await self.session(params.get("project"))).agent.jobs
+        return {"jobs": [{**jobs.attempt_record(job), "submitted_at": job["submitted_at"]} for job in jobs.list_jobs()]}
+
+    async def metrics(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn timings and agent counters for one project, or for every warm project plus LLM queue and endpoints"""
+        if params.get("project"):
+            return (await self.session(params["project"])).metrics()
+        return {"projects": {str(path): session.metrics() for path, session in self.sessions.items()},
+                "llm": shared_scheduler().metrics(), "endpoints": shared_pool(OLLAMA_API_BASE).stats()}
+
+    async def history(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        session = await self.session(params.get("project"))
+        try:
+            limit = int(params.get("limit", HISTORY_LIMIT))
+        except ValueError:
+            raise APIError(400, "limit must be a number")
+        history = session.agent.context.get("conversation_history", [])
+        return {"entries": search_history(history, str(params.get("q", "")), limit)}
+
+    async def message_turn(self, params: Dict[str, Any]) -> Tuple[ProjectSession, RunTurn]:
+        message = str(params.get("message") or "").strip()
+        if not message:
+            raise APIError(400, "missing 'message'")
+        session = await self.session(params.get("project"))
+        agent = session.agent
+
+        async def run() -> str:
+            # Checked under the session lock: an earlier turn may just have asked for confirmation
+            if agent.confirmation_mode:
+                raise APIError(409, f"a confirmation is pending ({agent.pending_question}); answer it at /confirm")
+            return await agent.aprocess_user_input(message)
+        return session, run
+
+    async def confirm_turn(self, params: Dict[str, Any]) -> Tuple[ProjectSession, RunTurn]:
+        """Answer the pending confirmation with "answer" (yes/no/exit) or a boolean "approve\""""
+        answer = str(params.get("answer") or "").strip()
+        if not answer and "approve" in params:
+            answer = "yes" if params["approve"] else "no"
+        if not answer:
+            raise APIError(400, "missing 'answer' or 'approve'")
+        session = await self.session(params.get("project"))
+        agent = session.agent
+
+        async def run() -> str:
+            if not agent.confirmation_mode:
+                raise APIError(409, "no confirmation is pending")
+            return await agent.ahandle_confirmation_response(answer)
+        return session, run
+
+
+class ULCAClient:
+    """Blocking client of a running daemon; streamed turns hand each event to on_event(kind, payload)"""
+
+    def __init__(self, url: Optional[str] = None, token: Optional[str] = None, info_file: Path = SERVER_INFO_FILE):
+        if url is None or token is None:
+            info = read_server_info(info_file)
+            if info is None:
+                raise ConnectionError(f"no ULCA daemon found in {info_file}; start one with "
+                                      f"`python universal_claude_agent.py serve`")
+            url = url or info["url"]
+            token = token or info["token"]
+        self.url = url.rstrip("/")
+        self.http = requests.Session()
+        self.http.headers["Authorization"] = f"Bearer {token}"
+
+    @staticmethod
+    def _json(response: requests.Response) -> Dict[str, Any]:
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code >= 400:
+            raise APIError(response.status_code, data.get("error", response.reason))
+        return data
+
+    def _get(self, path: str, **params) -> Dict[str, Any]:
+        return self._json(self.http.get(self.url + path, params=params, timeout=REQUEST_TIMEOUT))
+
+    def _turn(self, path: str, body: Dict[str, Any],
+              on_event: Optional[Callable[[str, Any], None]]) -> Dict[str, Any]:
+        # No read timeout: a turn may run a long command without producing output
+        response = self.http.post(self.url + path, json=body, stream=True, timeout=(REQUEST_TIMEOUT, None),
+                                  headers={"Accept": "text/event-stream"})
+        if response.status_code >= 400:
+            self._json(response)
+        with response:
+            for kind, payload in iter_events(response.iter_lines(decode_unicode=True)):
+                if kind == "done":
+                    return payload
+                if kind == "error":
+                    raise APIError(payload.get("status", 500), payload["message"])
+                if on_event:
+                    on_event(kind, payload)
+        raise ConnectionError("the daemon closed the stream before the turn finished")
+
+    def health(self) -> Dict[str, Any]:
+        return self._get("/health")
+
+    def open(self, project: str) -> Dict[str, Any]:
+        return self._json(self.http.post(self.url + "/projects", json={"project": project}, timeout=REQUEST_TIMEOUT))
+
+    def status(self, project: str) -> Dict[str, Any]:
+        return self._get("/status", project=project)
+
+    def todos(self, project: str, show_all: bool = False) -> List[Dict[str, Any]]:
+        return self._get("/todos", project=project, all=int(show_all))["items"]
+
+    def jobs(self, project: str) -> List[Dict[str, Any]]:
+        return self._get("/jobs", project=project)["jobs"]
+
+    def metrics(self, project: str) -> Dict[str, Any]:
+        return self._get("/metrics", project=project)
+
+    def history(self, project: str, query: str, limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
+        return self._get("/history", project=project, q=query, limit=limit)["entries"]
+
+    def send(self, project: str, message: str,
+             on_event: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+        return self._turn("/messages", {"project": project, "message": message}, on_event)
+
+    def confirm(self, project: str, answer: str,
+                on_event: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+        return self._turn("/confirm", {"project": project, "answer": answer}, on_event)
+
+
+ATTACHED_HELP = """
+📚 Attached Commands:
+- status / todo / jobs / metrics: Show the daemon's state for this project
+- history <words>: Search earlier conversation turns
+- exit/quit/q: Detach (the daemon keeps the project warm)
+Anything else is sent to Claude. Other built-in commands need a local session.
+"""
+
+
+def run_attached(client: ULCAClient, project_dir: str):
+    """The interactive CLI loop as a thin client of the daemon"""
+    project = str(Path(project_dir).resolve())
+    status = client.open(project)
+    print("\n" + "="*60)
+    print(f"🔗 Attached to the ULCA daemon at {client.url}")
+    print("="*60)
+    print(f"📁 Working in: {project}")
+    print(f"🎯 Project goal: {status['project_goal'] or 'Not defined'}")
+    print(f"📋 TODO items: {status['open_todos']} open")
+    awaiting = status["awaiting_confirmation"]
+    if awaiting:
+        print(f"🔒 Awaiting confirmation: {status['question']}")
+    streamed: List[str] = []
+    printed_lines: List[str] = []
+
+    def on_event(kind: str, payload: Any):
+        if kind == "token":
+            streamed.append(payload)
+            print(payload, end="", flush=True)
+        elif kind == "output":
+            marker = "❗" if payload["stream"] == "stderr" else "│"
+            printed_lines.append(payload["line"])
+            print(f"\n   {marker} {payload['line']}", end="", flush=True)
+        elif kind == "todo_added":
+            print(f"\n   📝 {format_item(payload)}", end="", flush=True)
+
+    while True:
+        try:
+            user_input = input("\n🔒 CONFIRMATION REQUIRED (yes/no): " if awaiting else "\n🎯 You: ").strip()
+            command = user_input.lower()
+            if not user_input:
+                continue
+            if command in ('exit', 'quit', 'q'):
+                print("\n👋 Detached. The daemon keeps this project warm.")
+                break
+            if command == 'help':
+                print(ATTACHED_HELP)
+            elif command == 'status':
+                for key, value in client.status(project).items():
+                    print(f"   {key}: {value}")
+            elif command == 'todo':
+                items = client.todos(project, show_all=True)
+                print("\n".join(f"   {format_item(item)}" for item in items) or "📝 No TODO items.")
+            elif command == 'jobs':
+                jobs = client.jobs(project)
+                print("\n".join(f"   [{job['job_id']}] {job['status']:<8} {job['command']}" for job in jobs)
+                      or "🧰 No background jobs.")
+            elif command == 'metrics':
+                for key, value in client.metrics(project).items():
+                    print(f"   {key}: {value}")
+            elif command.startswith('history '):
+                for entry in client.history(project, user_input[8:]):
+                    print(f"   [{entry['timestamp'][:19]}] 🎯 {entry['user_input'][:80]}")
+                    print(f"      🤖 {' '.join(entry['agent_response'].split())[:160]}")
+            else:
+                streamed.clear()
+                printed_lines.clear()
+                print("\n🤖 Claude: ", end="", flush=True)
+                if awaiting:
+                    result = client.confirm(project, user_input, on_event)
+                else:
+                    result = client.send(project, user_input, on_event)
+                awaiting = result["awaiting_confirmation"]
+                if awaiting:
+                    print(f"\n\n🔒 CONFIRMATION REQUIRED:\n   {result['question']}")
+                    print("\n💬 Please respond with 'yes' or 'no' to continue.")
+                elif not streamed:
+                    # Command output may have been printed after the "Claude:" label
+                    print(f"\n{result['reply']}" if printed_lines else result["reply"])
+                else:
+                    print()
+        except APIError as e:
+            print(f"\n❌ {e}")
+            if e.status == 409:
+                awaiting = client.status(project)["awaiting_confirmation"]
+        except requests.exceptions.ConnectionError:
+            print("\n❌ Lost the connection to the daemon.")
+            break
+        except KeyboardInterrupt:
+            print("\n\n⚠️  Interrupted. Type 'exit' to detach.")
+        except EOFError:
+            print("\n\n👋 End of input. Detached.")
+            break
+
+
+def main(argv: List[str]):
+    """`serve` and `attach` entry points of universal_claude_agent.py"""
+    parser = argparse.ArgumentParser(prog="universal_claude_agent.py", description="ULCA daemon mode")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Keep agents warm and serve them on a local JSON API")
+    serve.add_argument("projects", nargs="*", help="Project directories to warm up right away")
+    serve.add_argument("--host", default=SERVE_HOST)
+    serve.add_argument("--port", type=int, default=SERVE_PORT)
+    attach = commands.add_parser("attach", help="Use a running daemon from this terminal")
+    attach.add_argument("project", nargs="?", default=os.getcwd())
+    attach.add_argument("--url", help=f"Daemon URL (default: read from {SERVER_INFO_FILE})")
+    attach.add_argument("--token", help="Bearer token (default: read from the same file)")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(ULCAServer(args.host, args.port).serve_forever(args.projects))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        print("\n👋 Daemon stopped. Project contexts have been saved.")
+        return
+
+    try:
+        client = ULCAClient(args.url, args.token)
+        run_attached(client, args.project)
+    except (ConnectionError, requests.exceptions.ConnectionError) as e:
+        print(f"❌ Cannot reach the ULCA daemon: {e}")
+        sys.exit(1)
+    except APIError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -5,22 +5,86 @@ A stateful, interactive development partner that works with local Claude models
 to assist with any project type while maintaining persistent context.
 """
 
+import difflib
 import json
 import os
 import subprocess
 import sys
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Callable, Dict, List, Optional, Set, Tuple, Any
 import requests
 import shutil
 
+from semantic_index import EMBEDDING_MODEL, EmbeddingError, LocalHashEmbedder, OllamaEmbedder, SemanticIndex
+from symbol_index import SymbolIndex
+from git_context import ChangeTracker
+from index_cache import ProjectIndexCache
+from file_digests import FileDigestCache
+from command_runner import COMMAND_TIMEOUT, StreamingExecutor
+from job_manager import JobManager
+from pty_shell import PersistentShell, ShellError
+from log_distiller import FAILURE_CONTEXT_TOKENS, LogDistiller, matcher_for_command
+from build_fixer import BuildFixer
+from command_cache import CommandCache
+from file_edits import EditConflict, apply_edit, looks_like_edit
+from affected_tests import PYTEST_COMMAND, AffectedTestSelector, run_sharded
+from action_plan import ActionPlan
+from response_stream import StreamingResponseParser, parse_response
+from todo_store import TodoStore, format_item
+from llm_scheduler import (BACKGROUND, BATCH, CONFIRMATION, INTERACTIVE, PREEMPTIBLE, LLMPreempted, LLMTicket,
+                           shared_scheduler)
+from llm_endpoints import shared_pool
+from file_map import MAP_NUM_PREDICT, MapRun, select_files
+from todo_scheduler import MAX_SCHEDULED_TODOS, PathLocks, TodoScheduler, build_graph, waves
+from structured_output import (RESPONSE_SCHEMA, STRUCTURED_INSTRUCTIONS, parse_structured_response,
+                               render_response, to_actions)
+
 # Configuration
 OLLAMA_API_BASE = "http://localhost:11434/api/generate"
 PROJECT_CONTEXT_FILE = "project_context.json"
 MAX_RETRIES = 3
 REQUEST_TIMEOUT = 120  # Increased timeout for GGUF models
+SEMANTIC_TOP_K = 4
+SEMANTIC_CONTEXT_CHARS = 4000  # Cap on retrieved code injected into the prompt
+SYMBOL_CONTEXT_CHARS = 4000
+DIGEST_NUM_PREDICT = 80  # File digests are one line; keep background generations short
+MAX_BUILD_ATTEMPTS = 200  # build_attempts entries kept in the context file
+MAX_FILE_OPERATIONS = 500  # file_operations entries kept in the context file
+PLAN_DIFF_LINES = 40  # Diff lines previewed per file when confirming an action plan
+FIX_NUM_PREDICT = 4096  # Fix replies carry whole files
+USE_PERSISTENT_SHELL = False  # Run agent commands in one long-lived shell (`shell on`)
+STRUCTURED_MAX_FAILURES = 2  # Consecutive unusable structured replies before structured output is turned off
+
+FREE_TEXT_INSTRUCTIONS = """YOUR RESPONSE MUST INCLUDE:
+1. Your analysis and thought process
+2. A specific, actionable next step
+3. If you need to modify files, clearly state what you'll do and ask for permission. Put each file in a
+   fenced block directly after a line "FILE: <relative path>" (full content for new files, SEARCH/REPLACE
+   blocks or a unified diff for existing ones), list removals as "DELETE: <relative path>" and shell
+   commands in ```bash blocks. Everything you propose is applied as one batch once the user approves.
+4. If the task is complex, break it down into a TODO list
+5. If you need clarification, ask specific questions
+
+FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or request for permission if you plan to take action."""
+
+# Sent with the KV context of the reply that asked, so the model continues where it stopped
+CONTINUE_PROMPT = """The user answered: "{answer}". Carry out what you proposed now. Put each file in a fenced block
+directly after a line "FILE: <relative path>" (full content for new files, SEARCH/REPLACE blocks or a unified
+diff for existing ones), list removals as "DELETE: <relative path>" and commands in ```bash blocks.
+Do not ask for permission again."""
+APPROVE_ANSWERS = ('yes', 'y', 'proceed', 'continue', 'approve')
+LLM_ERROR_REPLY = ("I'm sorry, but I encountered an error communicating with my local Claude model. "
+                   "Please check that the model is running and accessible.")
+
+# One TODO item of a `todo run` batch; the user approved the batch, so the model must not stop to ask
+TODO_TASK_PROMPT = """Work on TODO item {id} only: {text}
+The user has approved this task. Make the changes now: put each file in a fenced block directly after a line
+"FILE: <relative path>" (full content for new files, SEARCH/REPLACE blocks or a unified diff for existing ones),
+list removals as "DELETE: <relative path>" and commands in ```bash blocks. Other TODO items are handled
+separately, possibly at the same time; do not touch files that only they need. Do not ask questions."""
 
 class ULCAgent:
     """Universal Local Claude Agent - Main agent class"""
@@ -28,10 +92,42 @@ class ULCAgent:
     def __init__(self, project_dir: str):
         self.project_dir = Path(project_dir).resolve()
         self.context_file = self.project_dir / PROJECT_CONTEXT_FILE
+        self._context_lock = threading.RLock()  # Background jobs also write the context
         self.context = self._load_or_create_context()
         self.confirmation_mode = False
         self.pending_action = None
         self.pending_question = None
+        self.pending_plan: Optional[ActionPlan] = None
+        self.structured_failures = 0
+        self.response_listeners: List[Callable[[str, Any], None]] = []
+        self.llm_keep_alive: Optional[str] = None  # How long Ollama keeps the model loaded after a request
+        self.llm_scheduler = shared_scheduler()  # Shared with every other agent in this process
+        # Hosts come only from global config: in the daemon this pool serves every project, so one
+        # project's private hosts must not take requests from the others
+        self.llm_pool = shared_pool(OLLAMA_API_BASE)
+        if self.context.get('llm_config', {}).get('endpoints'):
+            print("⚠️  Ignoring llm_config.endpoints; list extra Ollama hosts in ULCA_OLLAMA_ENDPOINTS")
+        self._prompt_lock = threading.Lock()  # Prompt building reads git state and lazily builds indexes
+        self.todos = TodoStore(self.context.setdefault('todo_list', []), on_change=self._on_todo_change)
+        if self.todos.converted:
+            self._save_context()
+        self._restore_pending_confirmation()
+        self.semantic_index = None
+        self.semantic_search_disabled = False
+        self.symbol_index = SymbolIndex(self.project_dir)
+        self.index_cache = ProjectIndexCache(self.project_dir, self.symbol_index)
+        self.index_cache.start()
+        self.file_digests = FileDigestCache(self.project_dir, self._summarize_for_digest)
+        self.executor = StreamingExecutor(self.project_dir)
+        self.output_listeners: List[Callable[[str, str], None]] = []
+        self.jobs = JobManager(self.executor, on_output=self._emit_command_output,
+                               record_attempt=self._record_build_attempt)
+        self.change_tracker = ChangeTracker(self.project_dir, self._execute_command)
+        self.command_cache = CommandCache(self.project_dir)
+        self.test_selector = AffectedTestSelector(self.project_dir, self.symbol_index)
+        self.shell: Optional[PersistentShell] = None
+        if USE_PERSISTENT_SHELL:
+            self._set_persistent_shell(True)
         
     def _load_or_create_context(self) -> Dict[str, Any]:
         """Load existing context or create new one"""
@@ -57,7 +153,13 @@ class ULCAgent:
             "build_attempts": [],
             "llm_config": {
                 "model": "claude-3.5-sonnet",
-                "api_base": OLLAMA_API_BASE
+                "api_base": OLLAMA_API_BASE,
+                "embedding_model": EMBEDDING_MODEL,
+                "file_digests": True,
+                "command_cache": False,
+                "structured_output": False,
+                "todo_parallelism": "auto",  # Follow the learned Ollama concurrency; a number fixes it
+                "map_parallelism": "auto"
             }
         }
         self._save_context(context)
@@ -68,13 +170,47 @@ class ULCAgent:
         """Save context to file"""
         if context is None:
             context = self.context
-        context["last_updated"] = datetime.now().isoformat()
         
-        try:
-            with open(self.context_file, 'w', encoding='utf-8') as f:
-                json.dump(context, f, indent=2, ensure_ascii=False)
-        except IOError as e:
-            print(f"❌ Error saving context: {e}")
+        with self._context_lock:
+            context["last_updated"] = datetime.now().isoformat()
+            try:
+                with open(self.context_file, 'w', encoding='utf-8') as f:
+                    json.dump(context, f, indent=2, ensure_ascii=False)
+            except IOError as e:
+                print(f"❌ Error saving context: {e}")
+    
+    def _record_build_attempt(self, attempt: Dict[str, Any]):
+        """Append a command run (with timing and resource usage) to build_attempts"""
+        with self._context_lock:
+            attempts = self.context.setdefault("build_attempts", [])
+            attempts.append(attempt)
+            del attempts[:-MAX_BUILD_ATTEMPTS]
+            self._save_context()
+    
+    def _record_file_operation(self, entry: Dict[str, Any]):
+        """Append one applied, failed or declined plan action to file_operations"""
+        with self._context_lock:
+            operations = self.context.setdefault("file_operations", [])
+            operations.append(entry)
+            del operations[:-MAX_FILE_OPERATIONS]
+            self._save_context()
+    
+    def _record_command_outcome(self, command: str, result: Dict[str, Any], distiller: LogDistiller):
+        """Keep a distilled report of the last failing command for the next prompt"""
+        with self._context_lock:
+            last_failure = self.context.get("last_command_failure")
+            if result["returncode"] != 0:
+                self.context["last_command_failure"] = {
+                    "command": command,
+                    "returncode": result["returncode"],
+                    "failed_at": datetime.now().isoformat(),
+                    "report": distiller.render(FAILURE_CONTEXT_TOKENS, result["returncode"], result.get("log_path"))
+                }
+            elif last_failure and last_failure.get("command") == command:
+                self.context.pop("last_command_failure")
+            else:
+                return
+            self._save_context()
     
     def _get_file_listing(self) -> str:
         """Get current directory listing"""
@@ -95,81 +231,240 @@ class ULCAgent:
         except Exception as e:
             return f"Error getting file listing: {e}"
     
-    def _execute_command(self, command: str, capture_output: bool = True) -> Tuple[int, str, str]:
+    def add_output_listener(self, listener: Callable[[str, str], None]):
+        """Register a callback receiving (stream, line) for every command output line"""
+        self.output_listeners.append(listener)
+    
+    def add_response_listener(self, listener: Callable[[str, Any], None]):
+        """Register a callback receiving (kind, payload) for tokens, TODOs, actions and confirmation requests as they stream"""
+        self.response_listeners.append(listener)
+    
+    def remove_output_listener(self, listener: Callable[[str, str], None]):
+        """Stop forwarding command output to a listener"""
+        if listener in self.output_listeners:
+            self.output_listeners.remove(listener)
+    
+    def remove_response_listener(self, listener: Callable[[str, Any], None]):
+        """Stop forwarding reply events to a listener"""
+        if listener in self.response_listeners:
+            self.response_listeners.remove(listener)
+    
+    def _emit_response_event(self, kind: str, payload: Any):
+        """Forward one early parse event from a streaming reply to all listeners"""
+        for listener in self.response_listeners:
+            listener(kind, payload)
+    
+    def _on_stream_event(self, kind: str, payload: Any):
+        """Record TODOs the moment a streaming reply mentions them, then notify listeners"""
+        if kind == "todo":
+            with self._context_lock:
+                if self.todos.add(payload):
+                    self._save_context()
+        self._emit_response_event(kind, payload)
+    
+    def _reply_chunk_handler(self, parser: StreamingResponseParser) -> Callable[[str], None]:
+        """on_chunk for a streamed reply: listeners get the raw token, then the parser looks for TODOs and actions"""
+        def on_chunk(piece: str):
+            self._emit_response_event("token", piece)
+            parser.feed(piece)
+        return on_chunk
+    
+    def _on_todo_change(self, kind: str, item: Dict[str, Any]):
+        """Forward TODO store changes so views can update single items"""
+        self._emit_response_event(f"todo_{kind}", item)
+    
+    def _print_response_event(self, kind: str, payload: Any):
+        """CLI listener: show what the reply contains while it is still being generated"""
+        if kind == "todo_added":
+            print(f"   📝 {format_item(payload)}")
+        elif kind == "action":
+            print(f"   📎 Proposed: {payload['type']} {payload.get('path') or payload.get('command')}")
+        elif kind == "confirmation":
+            print("   🔒 Claude is asking for confirmation (finishing its reply)...")
+    
+    def _emit_command_output(self, stream: str, line: str):
+        """Forward one line of command output to all listeners"""
+        for listener in self.output_listeners:
+            listener(stream, line)
+    
+    def _print_command_output(self, stream: str, line: str):
+        """CLI listener: echo command output as it arrives"""
+        if stream == "stderr":
+            print(f"   ❗ {line}")
+        elif stream in ("stdout", "status"):
+            print(f"   │ {line}")
+    
+    def _execute_command(self, command: str, capture_output: bool = True, quiet: bool = False) -> Tuple[int, str, str]:
         """Execute a shell command safely"""
-        print(f"🔄 Executing: {command}")
-        
         try:
-            if capture_output:
+            if quiet:
+                # Internal helper commands (git plumbing) are short; capture them whole
                 result = subprocess.run(
                     command, 
                     shell=True, 
                     cwd=self.project_dir, 
                     capture_output=True, 
                     text=True, 
-                    timeout=300
+                    timeout=COMMAND_TIMEOUT
                 )
                 return result.returncode, result.stdout, result.stderr
-            else:
-                result = subprocess.run(
-                    command, 
-                    shell=True, 
-                    cwd=self.project_dir, 
-                    timeout=300
-                )
-                return result.returncode, "", ""
+            
+            result, _ = self._run_streamed(command)
+            if not capture_output:
+                return result["returncode"], "", ""
+            return result["returncode"], result["stdout"], result["stderr"]
         except subprocess.TimeoutExpired:
-            return -1, "", "Command timed out after 5 minutes"
+            return -1, "", f"Command timed out after {COMMAND_TIMEOUT} seconds"
         except Exception as e:
             return -1, "", f"Error executing command: {e}"
     
-    def _call_llm(self, prompt: str) -> str:
-        """Call local LLM API with retry logic"""
-        payload = {
-            "model": "claude-3.5-sonnet",
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1,
-                "top_p": 0.9,
-                "num_predict": 2000,  # Use num_predict for Llama models
-                "stop": ["\n\nHuman:", "\n\nUser:", "Human:", "User:"]  # Stop tokens
-            }
-        }
+    def _run_streamed(self, command: str) -> Tuple[Dict[str, Any], LogDistiller]:
+        """Run a foreground command, streaming its output and distilling it as it arrives"""
+        on_output, distiller, cache_key, result = self._start_command(command)
+        if result is None:
+            # Background jobs always get a fresh process; only foreground commands share the shell
+            runner = self.shell or self.executor
+            result = runner.run(command, on_output=on_output)
+            self._finish_command(command, result, cache_key)
+        self._record_command_outcome(command, result, distiller)
+        return result, distiller
+    
+    def _start_command(self, command: str) -> Tuple[Callable[[str, str], None], LogDistiller, Optional[str],
+                                                    Optional[Dict[str, Any]]]:
+        """Announce a foreground command; returns its output callback, distiller, cache key and any cached result"""
+        print(f"🔄 Executing: {command}")
+        self._emit_command_output("command", command)
+        distiller = LogDistiller(command)
+        
+        def on_output(stream: str, line: str):
+            self._emit_command_output(stream, line)
+            distiller.feed(stream, line)
         
+        cache_key = None
+        if self.context.get('llm_config', {}).get('command_cache', False):
+            if self.shell is None:
+                cache_key = self.command_cache.key_for(command)
+            elif self.command_cache.rule_for(command):
+                # Variables exported in the persistent shell decide the result too
+                environ = self.shell.environment(self.command_cache.env_names(command))
+                cache_key = self.command_cache.key_for(command, self.shell.cwd, environ) if environ is not None else None
+        cached = self.command_cache.get(cache_key) if cache_key else None
+        result = self._replay_cached_result(cached, on_output) if cached else None
+        return on_output, distiller, cache_key, result
+    
+    def _finish_command(self, command: str, result: Dict[str, Any], cache_key: Optional[str]):
+        """Report a command's exit status and cache its result when caching applies"""
+        self._emit_command_output(
+            "status", f"exit code {result['returncode']} ({result['duration']:.1f}s)"
+        )
+        if cache_key:
+            self.command_cache.put(cache_key, command, result)
+    
+    def _replay_cached_result(self, cached: Dict[str, Any], on_output: Callable[[str, str], None]) -> Dict[str, Any]:
+        """Stream a cached result as if the command had run, clearly marked as cached"""
+        marker = (f"[cached result from {cached['cached_at']}: inputs unchanged, command not re-run; "
+                  f"'cache clear' forces a fresh run]")
+        for stream in ("stdout", "stderr"):
+            for line in cached[stream].splitlines():
+                on_output(stream, line)
+        self._emit_command_output("status", f"♻️  cached: exit code {cached['returncode']} "
+                                            f"(originally {cached['duration']:.1f}s)")
+        log_path = cached.get("log_path")
+        if log_path and not os.path.exists(log_path):
+            log_path = None  # Entries cached before logs were kept with them
+        return {
+            "returncode": cached["returncode"],
+            "cpu_time": 0.0,
+            "max_rss_kb": None,
+            "stdout": f"{marker}\n{cached['stdout']}",
+            "stderr": cached["stderr"],
+            "duration": 0.0,
+            "timed_out": False,
+            "log_path": log_path,
+            "lines": 0,
+            "cached": True
+        }
+    
+    def _call_llm(self, prompt: str, num_predict: int = 2000, quiet: bool = False,
+                  response_format: Optional[Dict[str, Any]] = None,
+                  on_chunk: Optional[Callable[[str], None]] = None,
+                  llm_session: Optional[Dict[str, Any]] = None, priority: str = INTERACTIVE,
+                  cancel: Optional[Callable[[], bool]] = None) -> str:
+        """Call local LLM API with retry logic; on_chunk streams the reply as it is generated
+
+        llm_session carries Ollama's KV "context" between calls: it is sent when
+        present and replaced by the context returned with the reply. priority is
+        the request's scheduling class; batch and background calls are streamed
+        so an interactive turn can cancel them, after which they queue again.
+        cancel is polled while such a call streams; once it returns True the
+        call stops and returns an error instead of queueing again.
+        """
+        preemptible = on_chunk is None and priority in PREEMPTIBLE
+        payload = self._llm_payload(prompt, num_predict, on_chunk is not None or preemptible, response_format,
+                                    llm_session)
+        while True:
+            try:
+                return self._post_llm(payload, quiet, on_chunk, llm_session, priority, cancel)
+            except LLMPreempted:
+                if cancel is not None and cancel():
+                    return "Error: LLM request cancelled"
+                if not quiet:
+                    print("⏸️  Gave the model to an interactive request; queued again")
+    
+    def _post_llm(self, payload: Dict[str, Any], quiet: bool, on_chunk: Optional[Callable[[str], None]],
+                  llm_session: Optional[Dict[str, Any]], priority: str,
+                  cancel: Optional[Callable[[], bool]] = None) -> str:
+        """Send one request with retries, holding a scheduler slot and an endpoint for each attempt"""
+        tried: Set[str] = set()
         for attempt in range(MAX_RETRIES):
             try:
-                print(f"🔄 Attempting LLM call (attempt {attempt + 1}/{MAX_RETRIES})...")
-                response = requests.post(
-                    OLLAMA_API_BASE, 
-                    json=payload, 
-                    timeout=REQUEST_TIMEOUT
-                )
-                response.raise_for_status()
-                
-                result = response.json()
+                if not quiet:
+                    print(f"🔄 Attempting LLM call (attempt {attempt + 1}/{MAX_RETRIES})...")
+                usage: Dict[str, Any] = {}  # Generated tokens, for the endpoint's concurrency controller
+                with self.llm_scheduler.slot(str(self.project_dir), priority) as ticket, \
+                        self.llm_pool.request(payload["model"], str(self.project_dir), tried, usage) as endpoint:
+                    response = requests.post(
+                        endpoint.generate_url, 
+                        json=payload, 
+                        timeout=REQUEST_TIMEOUT,
+                        stream=payload["stream"]
+                    )
+                    if "format" in payload and response.status_code == 400:
+                        # Older Ollama versions reject schema formats; retrying will not help
+                        return f"Error: LLM rejected the response format: {response.text[:200]}"
+                    response.raise_for_status()
+                    if payload["stream"]:
+                        return self._read_llm_stream(response, on_chunk or (lambda piece: None), llm_session, ticket,
+                                                     usage, cancel)
+                    
+                    result = response.json()
+                    usage["eval_count"] = result.get("eval_count")
                 if "response" in result:
+                    if llm_session is not None:
+                        llm_session["context"] = result.get("context")
                     return result["response"].strip()
                 else:
                     print(f"⚠️  Unexpected response format: {result}")
                     return "Error: Unexpected response format from LLM"
                     
+            except LLMPreempted:
+                raise
             except requests.exceptions.Timeout:
                 if attempt < MAX_RETRIES - 1:
                     print(f"⏰ Timeout on attempt {attempt + 1}/{MAX_RETRIES}. Retrying...")
-                    time.sleep(5)  # Wait 5 seconds before retry
+                    time.sleep(self._retry_delay(5, tried))  # Wait 5 seconds before retry
                 else:
                     return f"Error: LLM request timed out after {MAX_RETRIES} attempts. The model might be busy or too slow."
             except requests.exceptions.ConnectionError:
                 if attempt < MAX_RETRIES - 1:
                     print(f"🔌 Connection error on attempt {attempt + 1}/{MAX_RETRIES}. Retrying...")
-                    time.sleep(2 ** attempt)  # Exponential backoff
+                    time.sleep(self._retry_delay(2 ** attempt, tried))  # Exponential backoff
                 else:
                     return f"Error: Failed to connect to LLM after {MAX_RETRIES} attempts. Check if Ollama is running."
             except requests.exceptions.RequestException as e:
                 if attempt < MAX_RETRIES - 1:
                     print(f"⚠️  API call failed (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
-                    time.sleep(2 ** attempt)  # Exponential backoff
+                    time.sleep(self._retry_delay(2 ** attempt, tried))  # Exponential backoff
                 else:
                     return f"Error: Failed to communicate with LLM after {MAX_RETRIES} attempts: {e}"
             except Exception as e:
@@ -177,9 +472,178 @@ class ULCAgent:
         
         return "Error: Failed to get response from LLM"
     
-    def _build_system_prompt(self, user_input: str) -> str:
+    def _batch_parallelism(self, key: str) -> int:
+        """Workers for a todo or map run: llm_config[key], or what the Ollama endpoints sustain for "auto" settings"""
+        setting = self.context.get('llm_config', {}).get(key, "auto")
+        if setting == "auto":
+            return self.llm_pool.batch_concurrency()
+        return int(setting)
+    
+    def _retry_delay(self, delay: float, tried: Set[str]) -> float:
+        """Seconds to wait before the next attempt: none while another endpoint can take it"""
+        if self.llm_pool.has_untried(tried):
+            print("🔀 Failing over to another Ollama endpoint")
+            return 0
+        tried.clear()  # Every endpoint failed once: back off, then go round again
+        return delay
+    
+    def _llm_payload(self, prompt: str, num_predict: int, stream: bool,
+                     response_format: Optional[Dict[str, Any]] = None,
+                     llm_session: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Request body for Ollama's generate endpoint"""
+        payload = {
+            "model": "claude-3.5-sonnet",
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": 0.1,
+                "top_p": 0.9,
+                "num_predict": num_predict,  # Use num_predict for Llama models
+                "stop": ["\n\nHuman:", "\n\nUser:", "Human:", "User:"]  # Stop tokens
+            }
+        }
+        if llm_session and llm_session.get("context"):
+            payload["context"] = llm_session["context"]
+        if self.llm_keep_alive:
+            payload["keep_alive"] = self.llm_keep_alive
+        if response_format is not None:
+            payload["format"] = response_format
+            del payload["options"]["stop"]  # The grammar ends the reply; "User:" may appear inside strings
+        return payload
+    
+    def _read_llm_stream(self, response: requests.Response, on_chunk: Callable[[str], None],
+                         llm_session: Optional[Dict[str, Any]] = None, ticket: Optional[LLMTicket] = None,
+                         usage: Optional[Dict[str, Any]] = None,
+                         cancel: Optional[Callable[[], bool]] = None) -> str:
+        """Collect an Ollama streaming reply, handing each piece to on_chunk as it arrives"""
+        pieces: List[str] = []
+        try:
+            for raw in response.iter_lines():
+                if ticket is not None and (ticket.preempted or (cancel is not None and cancel())):
+                    response.close()  # Ollama stops generating once the client is gone
+                    raise LLMPreempted()
+                if not raw:
+                    continue
+                data = json.loads(raw)
+                if "error" in data:
+                    return f"Error: LLM reported an error: {data['error']}"
+                piece = data.get("response", "")
+                if piece:
+                    pieces.append(piece)
+                    on_chunk(piece)
+                if data.get("done"):
+                    if llm_session is not None:
+                        llm_session["context"] = data.get("context")
+                    if usage is not None:
+                        usage["eval_count"] = data.get("eval_count", len(pieces))
+                    break
+        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+            if not pieces:
+                raise  # Nothing consumed yet: the caller may retry from scratch
+            return f"Error: LLM stream interrupted after {len(pieces)} chunks: {e}"
+        return "".join(pieces).strip()
+    
+    def _get_semantic_index(self) -> Optional[SemanticIndex]:
+        """Create the semantic index on first use; None when unavailable"""
+        if self.semantic_search_disabled:
+            return None
+        if self.semantic_index is None:
+            embedding_model = self.context.get('llm_config', {}).get('embedding_model', EMBEDDING_MODEL)
+            # "local" selects the offline stand-in embedder instead of Ollama
+            embedder = LocalHashEmbedder() if embedding_model == "local" else OllamaEmbedder(embedding_model)
+            try:
+                self.semantic_index = SemanticIndex(self.project_dir, embedder=embedder)
+            except ImportError as e:
+                print(f"⚠️  Semantic search disabled: {e}")
+                self.semantic_search_disabled = True
+                return None
+            # The first build can embed the whole repo, so it runs beside the conversation
+            self.semantic_index.start()
+        return self.semantic_index
+    
+    def _search_code(self, query: str, top_k: int = SEMANTIC_TOP_K) -> List[Dict[str, Any]]:
+        """Search the embedding index once built, re-embedding only files the manifest saw change"""
+        index = self._get_semantic_index()
+        if index is None or not index.ready.is_set():
+            return []
+        if index.error is not None:
+            print(f"⚠️  Semantic search unavailable for this session: {index.error}")
+            self.semantic_search_disabled = True
+            return []
+        try:
+            manifest = self.index_cache.manifest
+            paths = index.stale_paths(manifest.entries) if manifest is not None else []
+            stats = index.update(paths=paths) if paths else {"embedded": 0}
+            if stats["embedded"]:
+                print(f"🧭 Indexed {stats['embedded']} code chunks ({stats['chunks']} total)")
+            return index.search(query, top_k=top_k)
+        except EmbeddingError as e:
+            print(f"⚠️  Semantic search unavailable for this session: {e}")
+            self.semantic_search_disabled = True
+            return []
+    
+    def _get_relevant_code(self, user_input: str) -> str:
+        """Get compact code snippets related to the request for the prompt"""
+        results = self._search_code(user_input)
+        if not results:
+            return ""
+        return self.semantic_index.format_results(results, max_chars=SEMANTIC_CONTEXT_CHARS)
+    
+    def _refresh_symbol_index(self):
+        """Bring the symbol index up to date with files changed on disk"""
+        self.index_cache.wait_ready()
+        stats = self.index_cache.refresh()
+        if stats["parsed"]:
+            print(f"🗂️  Indexed symbols in {stats['parsed']} files ({len(self.symbol_index)} total)")
+    
+    def _get_symbol_context(self, user_input: str) -> str:
+        """Get the definitions, imports and callers of symbols the request mentions"""
+        self._refresh_symbol_index()
+        return self.symbol_index.build_context(user_input, max_chars=SYMBOL_CONTEXT_CHARS)
+    
+    def _summarize_for_digest(self, prompt: str) -> str:
+        """LLM call used by the background file digest worker; a turn that pauses digests stops it"""
+        return self._call_llm(prompt, num_predict=DIGEST_NUM_PREDICT, quiet=True, priority=BACKGROUND,
+                              cancel=lambda: self.file_digests.paused)
+    
+    def _get_project_map(self) -> str:
+        """Cheap per-file summaries of the project; queues missing ones for idle time"""
+        manifest = self.index_cache.manifest
+        if manifest is None:
+            return ""
+        if self.context.get('llm_config', {}).get('file_digests', True):
+            self.file_digests.enqueue_missing(manifest)
+            self.file_digests.prune(manifest)
+        return self.file_digests.project_map(manifest)
+    
+    def _build_system_prompt(self, user_input: str, structured: bool = False) -> str:
         """Build comprehensive system prompt for LLM"""
         file_listing = self._get_file_listing()
+        symbol_context = self._get_symbol_context(user_input)
+        symbol_section = f"""
+RELEVANT SYMBOLS (definitions, imports and callers):
+{symbol_context}
+""" if symbol_context else ""
+        change_context = self.change_tracker.changes_since_last_turn()
+        change_section = f"""
+CHANGES SINCE LAST TURN:
+{change_context}
+""" if change_context else ""
+        project_map = self._get_project_map()
+        project_map_section = f"""
+PROJECT MAP (file summaries):
+{project_map}
+""" if project_map else ""
+        last_failure = self.context.get("last_command_failure")
+        failure_section = f"""
+LAST FAILED COMMAND (distilled log):
+{last_failure['report']}
+""" if last_failure else ""
+        relevant_code = self._get_relevant_code(user_input)
+        relevant_code_section = f"""
+RELEVANT CODE (semantic search):
+{relevant_code}
+""" if relevant_code else ""
         
         system_prompt = f"""You are ULCA (Universal Local Claude Agent), a helpful, cautious, and intelligent coding assistant. You work with users to develop any type of project (Android, iOS, web, desktop, etc.).
 
@@ -193,25 +657,18 @@ CURRENT PROJECT CONTEXT:
 - Project Directory: {self.project_dir}
 - Project Goal: {self.context.get('project_goal', 'Not defined')}
 - Current Status: {self.context.get('current_status', 'Unknown')}
-- TODO List: {json.dumps(self.context.get('todo_list', []), indent=2)}
+- TODO List: {json.dumps(self.todos.prompt_lines(), indent=2)}
 
 CONVERSATION HISTORY:
 {self._format_conversation_history()}
 
 CURRENT DIRECTORY CONTENTS:
 {file_listing}
-
+{project_map_section}{change_section}{failure_section}{symbol_section}{relevant_code_section}
 USER'S LATEST REQUEST:
 {user_input}
 
-YOUR RESPONSE MUST INCLUDE:
-1. Your analysis and thought process
-2. A specific, actionable next step
-3. If you need to modify files, clearly state what you'll do and ask for permission
-4. If the task is complex, break it down into a TODO list
-5. If you need clarification, ask specific questions
-
-FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or request for permission if you plan to take action."""
+{STRUCTURED_INSTRUCTIONS if structured else FREE_TEXT_INSTRUCTIONS}"""
 
         return system_prompt
     
@@ -275,9 +732,12 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
             return False
     
     def _modify_file(self, file_path: str, content: str) -> bool:
-        """Modify an existing file"""
+        """Modify an existing file with new full content or a search/replace or diff edit"""
         full_path = self.project_dir / file_path
         
+        if full_path.exists() and looks_like_edit(content):
+            return self._edit_file(file_path, content)
+        
         if not full_path.exists():
             print(f"⚠️  File {file_path} doesn't exist. Creating it instead.")
             return self._create_file(file_path, content)
@@ -295,6 +755,41 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
             print(f"❌ Error modifying file {file_path}: {e}")
             return False
     
+    def _print_diff(self, file_path: str, before: str, after: str, max_lines: int = 80):
+        """Preview a change as a unified diff before asking for approval"""
+        diff = list(difflib.unified_diff(before.splitlines(), after.splitlines(),
+                                         f"a/{file_path}", f"b/{file_path}", lineterm=""))
+        print("\n".join(diff[:max_lines]))
+        if len(diff) > max_lines:
+            print(f"... ({len(diff) - max_lines} more diff lines)")
+    
+    def _edit_file(self, file_path: str, edit: str) -> bool:
+        """Apply a search/replace or unified diff edit, rejecting it cleanly on conflict"""
+        full_path = self.project_dir / file_path
+        try:
+            with open(full_path, 'r', encoding='utf-8') as f:
+                current = f.read()
+            updated, notes = apply_edit(file_path, current, edit)
+        except EditConflict as e:
+            print(f"❌ Edit to {file_path} rejected: {e}")
+            return False
+        except (IOError, UnicodeDecodeError) as e:
+            print(f"❌ Error reading {file_path}: {e}")
+            return False
+        
+        self._print_diff(file_path, current, updated)
+        if not self._handle_file_operation(f"Edit {file_path} ({'; '.join(notes)})"):
+            return False
+        
+        try:
+            with open(full_path, 'w', encoding='utf-8') as f:
+                f.write(updated)
+            print(f"✅ Edited file: {file_path}")
+            return True
+        except Exception as e:
+            print(f"❌ Error modifying file {file_path}: {e}")
+            return False
+    
     def _delete_file(self, file_path: str) -> bool:
         """Delete a file with confirmation"""
         full_path = self.project_dir / file_path
@@ -314,87 +809,219 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
             print(f"❌ Error deleting file {file_path}: {e}")
             return False
     
-    def _parse_llm_response(self, response: str) -> Tuple[str, List[str], List[str], bool, str]:
-        """Parse LLM response for actions, TODO items, and confirmation requests"""
-        actions = []
-        todo_items = []
-        needs_confirmation = False
-        confirmation_question = ""
-        
-        # Look for TODO items (lines starting with - or * or numbered)
-        lines = response.split('\n')
-        for line in lines:
-            line = line.strip()
-            if line.startswith(('-', '*', '•')) or (line and line[0].isdigit() and '. ' in line):
-                if 'todo' in line.lower() or 'task' in line.lower():
-                    todo_items.append(line)
-        
-        # Detect confirmation requests
-        response_lower = response.lower()
-        confirmation_indicators = [
-            'should i proceed', 'shall i proceed', 'do you want me to',
-            'would you like me to', 'can i proceed', 'may i proceed',
-            'do you approve', 'should i continue', 'shall i continue',
-            'do you want me to continue', 'would you like me to continue'
-        ]
-        
-        for indicator in confirmation_indicators:
-            if indicator in response_lower:
-                needs_confirmation = True
-                # Extract the question around the confirmation request
-                start_idx = response_lower.find(indicator)
-                if start_idx != -1:
-                    # Get context around the confirmation request
-                    context_start = max(0, start_idx - 100)
-                    context_end = min(len(response), start_idx + 200)
-                    confirmation_question = response[context_start:context_end].strip()
-                    break
-        
-        return response, actions, todo_items, needs_confirmation, confirmation_question
+    def _parse_llm_response(self, response: str) -> Tuple[str, List[Dict[str, Any]], List[str], bool, str]:
+        """Parse a complete LLM response for actions, TODO items, and confirmation requests"""
+        return parse_response(response)
     
-    def _update_todo_list(self, new_items: List[str]):
-        """Update TODO list with new items"""
-        current_todos = set(self.context.get('todo_list', []))
-        for item in new_items:
-            if item.strip():
-                current_todos.add(item.strip())
-        
-        self.context['todo_list'] = list(current_todos)
-        self._save_context()
+    def _request_structured(self, user_input: str,
+                            session: Dict[str, Any]) -> Optional[Tuple[str, List[Dict[str, Any]], List[str], bool, str]]:
+        """Ask for a schema-constrained reply; None means use the free-text path instead"""
+        print("🧠 Consulting Claude (structured)...")
+        reply = self._call_llm(self._build_system_prompt(user_input, structured=True),
+                               response_format=RESPONSE_SCHEMA, llm_session=session)
+        return self._structured_result(reply)
+    
+    def _structured_result(self, reply: str) -> Optional[Tuple[str, List[Dict[str, Any]], List[str], bool, str]]:
+        """Validate a structured reply, counting failures toward turning structured output off"""
+        if reply.startswith("Error:"):
+            if "response format" not in reply:
+                return None  # Connection problems: the free-text call reports them
+            data, reason = None, reply[len("Error: "):]
+        else:
+            data, reason = parse_structured_response(reply)
+        if data is None:
+            self.structured_failures += 1
+            print(f"⚠️  Structured reply unusable ({reason}); falling back to free text")
+            if self.structured_failures >= STRUCTURED_MAX_FAILURES:
+                self.context.setdefault('llm_config', {})['structured_output'] = False
+                print("⚠️  Structured output turned off: this model does not follow the schema ('structured on' to retry)")
+            return None
+        self.structured_failures = 0
+        return render_response(data), to_actions(data), data["todo_items"], data["needs_confirmation"], data["question"]
+    
+    def _update_todo_list(self, new_items: List[str]) -> int:
+        """Add new TODO items, folding near-duplicates into existing ones; returns how many are new"""
+        with self._context_lock:
+            before = len(self.todos.items)
+            for item in new_items:
+                self.todos.add(item)
+            self._save_context()
+            return len(self.todos.items) - before
     
     def _update_project_goal(self, goal: str):
         """Update project goal"""
         self.context['project_goal'] = goal
         self._save_context()
     
+    def _propose_plan(self, plan: ActionPlan, user_input: str) -> str:
+        """Preview a plan and wait for one confirmation covering all of it"""
+        for action in plan.runnable:
+            if action["operation"] in ("modify", "edit"):
+                self._print_diff(action["path"], action["before"], action["after"], max_lines=PLAN_DIFF_LINES)
+        summary = plan.summary()
+        self._set_pending_confirmation("action_plan", f"Apply {len(plan.runnable)} action(s)?\n{summary}",
+                                       user_input, plan=plan)
+        print("\n🔒 CONFIRMATION REQUIRED:")
+        print(f"📋 Claude proposes {len(plan.runnable)} action(s):")
+        print(summary)
+        print("\n💬 Respond 'yes' to apply them all in order, or 'no' to discard the plan.")
+        return "AWAITING_CONFIRMATION"
+    
+    def _set_pending_confirmation(self, kind: str, question: str, user_input: str,
+                                  plan: Optional[ActionPlan] = None, kv_context: Optional[List[int]] = None):
+        """Enter confirmation mode and persist what approval will resume, so it survives a restart"""
+        self.confirmation_mode = True
+        self.pending_action = kind
+        self.pending_question = question
+        self.pending_plan = plan
+        with self._context_lock:
+            self.context["pending_confirmation"] = {
+                "kind": kind,
+                "question": question,
+                "user_input": user_input,
+                "created_at": datetime.now().isoformat(),
+                "plan": plan.to_dict() if plan else None,
+                "kv_context": kv_context
+            }
+            self.context["current_status"] = "awaiting_confirmation"
+            self._save_context()
+    
+    def _clear_pending_confirmation(self):
+        """Leave confirmation mode and drop the persisted pending state"""
+        self.confirmation_mode = False
+        self.pending_action = None
+        self.pending_question = None
+        self.pending_plan = None
+        with self._context_lock:
+            if self.context.pop("pending_confirmation", None) is not None:
+                self.context["current_status"] = "awaiting_user_input"
+                self._save_context()
+    
+    def _restore_pending_confirmation(self):
+        """Re-enter confirmation mode for a question left unanswered in a previous session"""
+        pending = self.context.get("pending_confirmation")
+        if not pending:
+            return
+        self.confirmation_mode = True
+        self.pending_action = pending["kind"]
+        self.pending_question = pending["question"]
+        if pending.get("plan"):
+            self.pending_plan = ActionPlan.from_dict(self.project_dir, pending["plan"])
+        print(f"🔒 Restored pending confirmation from {pending['created_at']}: answer yes or no")
+    
+    def _continue_after_confirmation(self, answer: str, pending: Dict[str, Any]) -> str:
+        """Resume the reply that asked for approval instead of starting a cold conversation"""
+        prompt, session = self._continuation_prompt(answer, pending)
+        print("🧠 Continuing Claude's plan...")
+        parser = StreamingResponseParser(self._on_stream_event)
+        self.file_digests.pause()
+        try:
+            reply = self._call_llm(prompt, on_chunk=self._reply_chunk_handler(parser), llm_session=session,
+                                   priority=CONFIRMATION)
+        finally:
+            self.file_digests.resume()
+        return self._continuation_result(answer, reply, parser, session)
+    
+    def _continuation_prompt(self, answer: str, pending: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Prompt and LLM session that pick up where the pending reply stopped"""
+        session: Dict[str, Any] = {}
+        if pending.get("kv_context"):
+            # The KV context holds the whole earlier prompt and reply; send only the answer
+            session["context"] = pending["kv_context"]
+            return CONTINUE_PROMPT.format(answer=answer), session
+        return self._build_system_prompt(
+            f"{answer} - go ahead with what you proposed for: {pending.get('user_input', '')}"), session
+    
+    def _continuation_result(self, answer: str, reply: str, parser: StreamingResponseParser,
+                             session: Dict[str, Any]) -> str:
+        if reply.startswith("Error:"):
+            return f"Error continuing with action: {reply}. Please provide a new instruction."
+        return self._handle_parsed_response(answer, (reply, parser.actions, [], *parser.result()[3:]), session)
+    
+    def _apply_plan(self, plan: ActionPlan) -> str:
+        """Apply an approved plan and summarize the outcome"""
+        self.file_digests.pause()
+        try:
+            results = plan.apply(self._run_streamed, self._record_file_operation)
+        finally:
+            self.file_digests.resume()
+        return self._summarize_plan(results)
+    
+    def _summarize_plan(self, results: List[Dict[str, Any]]) -> str:
+        """Record an applied plan in the conversation and describe its outcome"""
+        counts: Dict[str, int] = {}
+        for entry in results:
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        lines = ["Plan finished: " + ", ".join(f"{n} {status}" for status, n in counts.items())]
+        for entry in results:
+            if entry["status"] != "applied":
+                lines.append(f"- {entry['operation']} {entry['target']}: {entry['status']}"
+                             + (f" ({entry['detail']})" if entry.get("detail") else ""))
+        summary = "\n".join(lines)
+        self._update_context("yes", summary, action_taken=f"plan_applied:{counts.get('applied', 0)}/{len(results)}")
+        return summary
+    
     def process_user_input(self, user_input: str) -> str:
         """Process user input and return agent response"""
+        # Background digest generation must not compete with an interactive turn
+        self.file_digests.pause()
+        try:
+            return self._process_user_input(user_input)
+        finally:
+            self.file_digests.resume()
+    
+    def _process_user_input(self, user_input: str) -> str:
+        """Run one interactive turn"""
         print(f"\n🤔 Processing: {user_input}")
         
-        # Build comprehensive prompt
-        system_prompt = self._build_system_prompt(user_input)
-        
-        # Call LLM
-        print("🧠 Consulting Claude...")
-        llm_response = self._call_llm(system_prompt)
-        
-        if llm_response.startswith("Error:"):
-            print(f"❌ {llm_response}")
-            return "I'm sorry, but I encountered an error communicating with my local Claude model. Please check that the model is running and accessible."
+        parsed = None
+        session: Dict[str, Any] = {}
+        if self.context.get('llm_config', {}).get('structured_output', False):
+            parsed = self._request_structured(user_input, session)
         
-        # Parse response
-        parsed_response, actions, todo_items, needs_confirmation, confirmation_question = self._parse_llm_response(llm_response)
+        if parsed is None:
+            # Build comprehensive prompt
+            system_prompt = self._build_system_prompt(user_input)
+            
+            # Call LLM, parsing the reply as it streams
+            print("🧠 Consulting Claude...")
+            parser = StreamingResponseParser(self._on_stream_event)
+            llm_response = self._call_llm(system_prompt, on_chunk=self._reply_chunk_handler(parser),
+                                          llm_session=session)
+            
+            if llm_response.startswith("Error:"):
+                print(f"❌ {llm_response}")
+                return LLM_ERROR_REPLY
+            
+            # TODOs were recorded as they streamed
+            parsed = (llm_response, parser.actions, [], *parser.result()[3:])
+        return self._handle_parsed_response(user_input, parsed, session)
+    
+    def _handle_parsed_response(self, user_input: str, parsed: Tuple[str, List[Dict[str, Any]], List[str], bool, str],
+                                session: Dict[str, Any]) -> str:
+        """Update TODOs, then propose a plan, ask the model's question or return the reply"""
+        parsed_response, actions, todo_items, needs_confirmation, confirmation_question = parsed
         
         # Update TODO list if new items found
         if todo_items:
-            self._update_todo_list(todo_items)
-            print(f"📝 Updated TODO list with {len(todo_items)} new items")
+            added = self._update_todo_list(todo_items)
+            print(f"📝 Updated TODO list: {added} new, {len(todo_items) - added} merged or skipped")
+        
+        # Proposed changes become one plan behind a single confirmation
+        if actions:
+            plan = ActionPlan(self.project_dir, actions)
+            plan.prepare()
+            if plan.runnable:
+                self._update_context(user_input, parsed_response, action_taken="plan_proposed")
+                return self._propose_plan(plan, user_input)
+            print(f"⚠️  None of the {len(actions)} proposed action(s) can be applied:")
+            print(plan.summary())
         
         # Check if LLM is asking for confirmation
         if needs_confirmation:
-            self.confirmation_mode = True
-            self.pending_action = "llm_confirmation"
-            self.pending_question = confirmation_question
+            self._update_context(user_input, parsed_response, action_taken="awaiting_confirmation")
+            self._set_pending_confirmation("llm_confirmation", confirmation_question, user_input,
+                                           kv_context=session.get("context"))
             print(f"\n🔒 CONFIRMATION REQUIRED:")
             print(f"🤖 Claude is asking for your approval:")
             print(f"   {confirmation_question}")
@@ -409,13 +1036,16 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
     
     def run_interactive_loop(self):
         """Main interactive loop"""
+        self.add_output_listener(self._print_command_output)
+        self.add_response_listener(self._print_response_event)
+        
         print("\n" + "="*60)
         print("🚀 Universal Local Claude Agent (ULCA) - Ready!")
         print("="*60)
         print(f"📁 Working in: {self.project_dir}")
         print(f"💾 Context file: {self.context_file}")
         print(f"🎯 Project goal: {self.context.get('project_goal', 'Not defined')}")
-        print(f"📋 TODO items: {len(self.context.get('todo_list', []))}")
+        print(f"📋 TODO items: {len(self.todos.active())} open")
         print("\n💡 I'm ready to help! What would you like to work on?")
         print("   (Type 'exit' to quit, 'help' for commands, 'status' for current state)")
         print("-" * 60)
@@ -434,6 +1064,10 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
                     continue
                 
                 if user_input.lower() in ['exit', 'quit', 'q']:
+                    if self.jobs.running_count():
+                        print(f"🛑 Stopping {self.jobs.running_count()} background job(s)")
+                    self.jobs.shutdown()
+                    self._set_persistent_shell(False)
                     print("\n👋 Goodbye! Your project context has been saved.")
                     break
                 
@@ -449,6 +1083,10 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
                     self._show_todo()
                     continue
                 
+                if user_input.lower().startswith('todo '):
+                    self._control_todo(user_input)
+                    continue
+                
                 if user_input.lower() == 'files':
                     self._show_files()
                     continue
@@ -457,10 +1095,60 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
                     self._test_llm_connection()
                     continue
                 
+                if user_input.lower() == 'endpoints':
+                    self._show_endpoints()
+                    continue
+                
                 if user_input.lower() == 'ls':
                     self._show_files()
                     continue
                 
+                if user_input.lower() == '/find' or user_input.lower().startswith('/find '):
+                    # Slash form so requests like "find the bug in login" still reach the model
+                    self._find_concept(user_input[5:].strip())
+                    continue
+                
+                if user_input.lower().startswith('where '):
+                    self._show_symbol(user_input[6:].strip())
+                    continue
+                
+                if user_input.lower().startswith('bg '):
+                    job_id = self.jobs.submit(user_input[3:].strip())
+                    print(f"🚀 Started job {job_id}: {user_input[3:].strip()}")
+                    continue
+                
+                if user_input.lower() == 'jobs':
+                    self._show_jobs()
+                    continue
+                
+                if user_input.lower().startswith(('kill ', 'wait ')):
+                    self._control_job(user_input)
+                    continue
+                
+                if user_input.lower() == 'affected' or user_input.lower().startswith('affected '):
+                    self._run_affected_tests(user_input[8:].strip())
+                    continue
+                
+                if user_input.lower() == 'map' or user_input.lower().startswith('map '):
+                    self._map_files(user_input[4:].strip())
+                    continue
+                
+                if user_input.lower().startswith('fix '):
+                    self._fix_build(user_input[4:].strip())
+                    continue
+                
+                if user_input.lower() == 'cache' or user_input.lower().startswith('cache '):
+                    self._control_cache(user_input)
+                    continue
+                
+                if user_input.lower() in ('shell on', 'shell off', 'shell'):
+                    self._toggle_shell(user_input)
+                    continue
+                
+                if user_input.lower() in ('structured on', 'structured off', 'structured'):
+                    self._toggle_structured(user_input)
+                    continue
+                
                 if user_input.lower() == 'confirm':
                     if self.confirmation_mode:
                         print(f"🔒 Currently awaiting confirmation for: {self.pending_question}")
@@ -471,9 +1159,7 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
                 if user_input.lower() == 'clear':
                     if self.confirmation_mode:
                         print("🧹 Clearing confirmation mode")
-                        self.confirmation_mode = False
-                        self.pending_action = None
-                        self.pending_question = None
+                        self._clear_pending_confirmation()
                     else:
                         print("✅ No confirmation mode to clear")
                     continue
@@ -481,7 +1167,8 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
                 # Check if we're in confirmation mode
                 if self.confirmation_mode:
                     response = self._handle_confirmation_response(user_input)
-                    print(f"\n🤖 Claude: {response}")
+                    if response != "AWAITING_CONFIRMATION":
+                        print(f"\n🤖 Claude: {response}")
                     continue
                 
                 # Process user input
@@ -509,8 +1196,25 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
 - help: Show this help message
 - status: Show current project status
 - todo: Show current TODO list
+- todo add|start|done|drop|reopen|priority: Manage TODO items by ID (e.g. todo done T3)
+- todo after <id> <ids>: Make a TODO wait for others (e.g. todo after T3 T1 T2)
+- todo run [parallelism]: Work through open TODOs concurrently, in dependency order
 - files: Show current directory contents
+- /find <concept>: Semantic search over the project's code
+- where <symbol>: Show where a function/class is defined and used
+- bg <command>: Run a shell command as a background job
+- jobs: List background jobs with timing and memory usage
+- kill <id>: Stop a background job
+- wait <id>: Wait for a background job and show its result
+- affected [files]: Run only the tests affected by changed files
+- fix <build command>: Run a build and let me patch it until it passes
+- map <globs> <instruction>: Apply one instruction to every matching file, reviewing each diff
+- map resume|status: Continue an interrupted map run, or show the last run's timings
+- cache on|off|clear: Reuse results of tests/linters when their inputs are unchanged
+- shell on|off: Keep one persistent shell so cd/export/venvs carry over between commands
+- structured on|off: Ask the model for schema-constrained JSON replies (falls back to free text)
 - test: Test LLM connection
+- endpoints: Show Ollama endpoints with health, load, models, latency and learned concurrency
 - confirm: Show confirmation status
 - clear: Clear confirmation mode
 - exit/quit/q: Exit the program
@@ -531,28 +1235,518 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
 - Directory: {self.project_dir}
 - Goal: {self.context.get('project_goal', 'Not defined')}
 - Status: {self.context.get('current_status', 'Unknown')}
-- TODO Items: {len(self.context.get('todo_list', []))}
+- TODO Items: {len(self.todos.active())} open / {len(self.todos.items)} total
 - Conversations: {len(self.context.get('conversation_history', []))}
 - Last Updated: {self.context.get('last_updated', 'Unknown')}
 - Agent State: {confirmation_status}
         """
         print(status_text)
+        llm = self.llm_scheduler.metrics()
+        queued = ", ".join(f"{n} {priority}" for priority, n in llm["queued"].items() if n) or "none"
+        waits = ", ".join(f"{priority} {llm['wait_mean'][priority]:.1f}s" for priority, n in llm["granted"].items() if n)
+        print(f"🚦 LLM slots: {llm['in_flight']}/{llm['max_in_flight']} busy, queued: {queued}, "
+              f"{llm['preemptions']} preempted" + (f"\n   Mean wait: {waits}" if waits else ""))
     
     def _show_todo(self):
         """Show current TODO list"""
-        todos = self.context.get('todo_list', [])
+        todos = self.todos.ordered()
         if not todos:
             print("📋 No TODO items defined yet.")
         else:
             print("📋 Current TODO List:")
-            for i, todo in enumerate(todos, 1):
-                print(f"  {i}. {todo}")
+            for todo in todos:
+                print(f"  {format_item(todo)}")
+    
+    def _control_todo(self, user_input: str):
+        """Handle todo add|start|done|drop|reopen|priority"""
+        parts = user_input.split(maxsplit=2)
+        verb = parts[1].lower()
+        if verb == "run":
+            self._run_todos(parts[2].strip() if len(parts) == 3 else "")
+            return
+        statuses = {"start": "in_progress", "done": "done", "drop": "dropped", "reopen": "open"}
+        try:
+            with self._context_lock:
+                if verb == "add" and len(parts) == 3:
+                    count = len(self.todos.items)
+                    item = self.todos.add(parts[2], notify=False)
+                    if item is None:
+                        message = "⚠️  Not added: that is not an actionable task"
+                    elif len(self.todos.items) > count:
+                        message = f"📝 Added {format_item(item)}"
+                    else:
+                        message = f"📝 Already listed as {format_item(item)}"
+                elif verb in statuses and len(parts) == 3:
+                    message = f"✅ {format_item(self.todos.update(parts[2], status=statuses[verb]))}"
+                elif verb == "priority" and len(parts) == 3 and len(parts[2].split()) == 2:
+                    todo_id, level = parts[2].split()
+                    message = f"✅ {format_item(self.todos.update(todo_id, priority=int(level)))}"
+                elif verb == "after" and len(parts) == 3:
+                    todo_id, *depends_on = parts[2].split()
+                    message = f"✅ {format_item(self.todos.update(todo_id, depends_on=depends_on))}"
+                else:
+                    print("💡 Usage: todo add <text> | todo start|done|drop|reopen <id> | todo priority <id> <1-3> | "
+                          "todo after <id> <ids> | todo run [parallelism]")
+                    return
+                self._save_context()
+        except (KeyError, ValueError) as e:
+            print(f"❌ {e.args[0] if e.args else e}")
+            return
+        print(message)
+    
+    def _run_todos(self, argument: str):
+        """Handle todo run [parallelism]: work through open TODOs concurrently in dependency order"""
+        try:
+            parallelism = int(argument) if argument else self._batch_parallelism('todo_parallelism')
+        except ValueError:
+            print("💡 Usage: todo run [parallelism]   e.g. todo run 3")
+            return
+        items = self.todos.active()[:MAX_SCHEDULED_TODOS]
+        if not items:
+            print("📋 No open TODO items to run.")
+            return
+        
+        graph = build_graph(items)
+        rounds = waves(graph, [item["id"] for item in items])
+        print(f"🗺️  Schedule for {len(items)} TODO item(s), up to {parallelism} at a time:")
+        for number, ids in enumerate(rounds, 1):
+            print(f"   {number}. {', '.join(ids)}")
+        for item in items:
+            if graph[item["id"]]:
+                print(f"   {item['id']} waits for {', '.join(sorted(graph[item['id']]))}")
+        cyclic = set(graph) - {todo_id for ids in rounds for todo_id in ids}
+        if cyclic:
+            print(f"   ⚠️  Dependency cycle, will not run: {', '.join(sorted(cyclic))}")
+        if not self._handle_file_operation(f"Work on {len(items)} TODO item(s) and apply each one's file changes "
+                                           f"without asking again (commands are held for review)"):
+            print("🛑 TODO run cancelled")
+            return
+        
+        locks = PathLocks()
+        held: List[Tuple[str, str]] = []  # (item id, command), reviewed once the run is over
+        scheduler = TodoScheduler(lambda item: self._run_todo_item(item, locks, held), parallelism,
+                                  on_progress=self._report_todo_progress)
+        self.file_digests.pause()
+        try:
+            outcome = scheduler.run(items)
+        finally:
+            self.file_digests.resume()
+        
+        icons = {"done": "✅", "failed": "❌", "blocked": "⛔"}
+        lines = []
+        for result in outcome["items"]:
+            lines.append(f"{icons[result['status']]} {result['id']} {result['status']} ({result['duration']:.1f}s)"
+                         + (f": {result['detail']}" if result['detail'] else ""))
+        done = sum(result["status"] == "done" for result in outcome["items"])
+        lines.append(f"⏱️  {done}/{len(items)} done in {outcome['wall_time']:.1f}s wall time "
+                     f"({outcome['work_time']:.1f}s of item work, up to {outcome['peak_concurrency']} at once)")
+        summary = "\n".join(lines)
+        print(summary)
+        self._update_context(f"todo run {parallelism}", summary, action_taken=f"todo_run:{done}/{len(items)}")
+        order = {item["id"]: number for number, item in enumerate(items)}
+        self._review_todo_commands(sorted(held, key=lambda entry: order[entry[0]]))
+    
+    def _run_todo_item(self, item: Dict[str, Any], locks: PathLocks, held: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """Ask the model for one TODO item's changes and apply its file actions while holding the files they touch
+
+        Commands are not run unattended: they are added to held for review after the run.
+        """
+        with self._prompt_lock:
+            prompt = self._build_system_prompt(TODO_TASK_PROMPT.format(id=item["id"], text=item["text"]))
+        reply = self._call_llm(prompt, quiet=True, priority=BATCH)
+        if reply.startswith("Error:"):
+            return {"ok": False, "detail": reply}
+        _, actions, _, needs_confirmation, question = parse_response(reply)
+        if not actions:
+            return {"ok": False, "detail": f"model asked: {question}" if needs_confirmation else "model proposed no changes"}
+        
+        commands = [action["command"] for action in actions if action["type"] == "command"]
+        held.extend((item["id"], command) for command in commands)
+        note = f", {len(commands)} command(s) held for review" if commands else ""
+        file_actions = [action for action in actions if action["type"] != "command"]
+        if not file_actions:
+            return {"ok": True, "detail": f"no file changes{note}"}
+        
+        plan = ActionPlan(self.project_dir, file_actions)
+        with locks.hold(action["path"] for action in file_actions):
+            self._report_todo_progress({"id": item["id"], "state": "applying",
+                                        "detail": f"{len(file_actions)} action(s)", "duration": None})
+            # Prepared only now, against whatever an earlier item wrote to the same files
+            plan.prepare()
+            if not plan.runnable:
+                return {"ok": False, "detail": "; ".join(action["error"] for action in plan.actions)}
+            results = plan.apply(self._run_streamed, self._record_file_operation)  # File actions only
+        problems = [entry for entry in results if entry["status"] != "applied"]
+        if any(entry["status"] in ("failed", "skipped") for entry in problems):
+            failed = next(entry for entry in problems if entry["status"] == "failed")
+            return {"ok": False, "detail": f"{failed['operation']} {failed['target']} failed"
+                                           + (f" ({failed['detail']})" if failed.get("detail") else "")}
+        applied = len(results) - len(problems)
+        return {"ok": True, "detail": f"{applied} action(s) applied" + (f", {len(problems)} rejected" if problems else "")
+                                      + note}
+    
+    def _review_todo_commands(self, held: List[Tuple[str, str]]):
+        """Offer the commands TODO items proposed one at a time, now that no item runs alongside them"""
+        if not held:
+            return
+        print(f"\n🧾 {len(held)} command(s) proposed by TODO items:")
+        for todo_id, command in held:
+            if self._handle_file_operation(f"Run command for {todo_id}: {command}"):
+                result, _ = self._run_streamed(command)
+                print(f"{'✅' if result['returncode'] == 0 else '❌'} {todo_id}: {command} (exit {result['returncode']})")
+            else:
+                print(f"⏭️  Skipped {todo_id}: {command}")
+    
+    def _report_todo_progress(self, event: Dict[str, Any]):
+        """Mirror a scheduled item's progress into the TODO store and notify listeners"""
+        statuses = {"started": "in_progress", "done": "done", "failed": "open"}
+        if event["state"] in statuses:
+            with self._context_lock:
+                self.todos.update(event["id"], status=statuses[event["state"]])
+                self._save_context()
+        icons = {"started": "▶️ ", "applying": "✍️ ", "done": "✅", "failed": "❌", "blocked": "⛔"}
+        timing = f" ({event['duration']:.1f}s)" if event["duration"] is not None else ""
+        print(f"   {icons[event['state']]} {event['id']} {event['state']}{timing}"
+              + (f": {event['detail']}" if event["detail"] else ""))
+        self._emit_response_event("todo_progress", event)
     
     def _show_files(self):
         """Show current directory contents"""
         print("📁 Current Directory Contents:")
         print(self._get_file_listing())
     
+    def _find_concept(self, query: str):
+        """Show the code locations that best match a concept"""
+        if not query:
+            print("💡 Usage: /find <concept>, e.g. /find login error handling")
+            return
+        index = self._get_semantic_index()
+        if index is not None and not index.ready.is_set():
+            print("⏳ The semantic index is still being built in the background; try again shortly.")
+            return
+        print(f"🔍 Searching code for: {query}")
+        self._refresh_symbol_index()  # Refreshes the manifest the semantic index catches up from
+        results = self._search_code(query, top_k=8)
+        if not results:
+            print("📭 No matching code found.")
+            return
+        for result in results:
+            print(f"  {result['score']:.2f}  {result['path']}:{result['start_line']}-{result['end_line']}")
+    
+    def _show_symbol(self, name: str):
+        """Show definitions, importers and callers of a symbol"""
+        if not name:
+            print("💡 Usage: where <symbol>, e.g. where login")
+            return
+        self._refresh_symbol_index()
+        definitions = self.symbol_index.where(name)
+        if not definitions:
+            print(f"📭 No definition of '{name}' found.")
+            return
+        for definition in definitions:
+            print(f"📍 {definition['kind']} {definition['qualname']} - "
+                  f"{definition['path']}:{definition['start_line']}-{definition['end_line']}")
+            importers = self.symbol_index.importers_of(definition['path'])
+            if importers:
+                print(f"   Imported by: {', '.join(importers)}")
+        callers = self.symbol_index.callers(name.split('.')[-1])
+        if callers:
+            print("📞 Used in:")
+            for caller in callers[:20]:
+                print(f"   {caller['caller']} ({caller['path']}:{caller['line']})")
+    
+    def _show_jobs(self):
+        """List background jobs"""
+        jobs = self.jobs.list_jobs()
+        if not jobs:
+            print("🧰 No background jobs.")
+            return
+        print("🧰 Background Jobs:")
+        for job in jobs:
+            line = f"  [{job['id']}] {job['status']:<8} {job['command']}"
+            result = job["result"]
+            if result:
+                cpu = f", cpu {result['cpu_time']:.1f}s" if result.get("cpu_time") is not None else ""
+                rss = f", rss {result['max_rss_kb'] // 1024} MB" if result.get("max_rss_kb") else ""
+                line += f"  (exit {result['returncode']}, {result['duration']:.1f}s{cpu}{rss})"
+            print(line)
+    
+    def _control_job(self, user_input: str):
+        """Handle the kill <id> and wait <id> built-ins"""
+        action, _, job_arg = user_input.partition(' ')
+        try:
+            job_id = int(job_arg.strip().lstrip('%'))
+        except ValueError:
+            print(f"💡 Usage: {action.lower()} <job id>")
+            return
+        if self.jobs.get(job_id) is None:
+            print(f"⚠️  No job with id {job_id}")
+            return
+        
+        if action.lower() == 'kill':
+            if self.jobs.kill(job_id):
+                print(f"🛑 Killed job {job_id}")
+            else:
+                print(f"⚠️  Job {job_id} is not running")
+            return
+        
+        print(f"⏳ Waiting for job {job_id}...")
+        result = self.jobs.wait(job_id)
+        if not result:
+            print(f"⚠️  Job {job_id} was cancelled before it started")
+            return
+        print(f"✅ Job {job_id} finished with exit code {result['returncode']} in {result['duration']:.1f}s")
+        tail = (result["stderr"] if result["returncode"] else result["stdout"]).strip()
+        if tail:
+            print("\n".join(tail.splitlines()[-20:]))
+    
+    def _apply_fix_file(self, file_path: str, content: str) -> bool:
+        """Show a proposed fix as a diff and write it once approved"""
+        full_path = self.project_dir / file_path
+        if full_path.exists() and looks_like_edit(content):
+            return self._edit_file(file_path, content)
+        if not full_path.exists():
+            if not self._handle_file_operation(f"Create file: {file_path}"):
+                return False
+            return self._create_file(file_path, content)
+        
+        with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
+            current = f.read()
+        if current == content:
+            print(f"ℹ️  Proposed {file_path} is unchanged")
+            return False
+        self._print_diff(file_path, current, content)
+        return self._modify_file(file_path, content)
+    
+    def _affected_test_command(self, command: str, changed: List[str]) -> Optional[str]:
+        """Narrow a pytest command to the tests affected by the given files"""
+        matcher = matcher_for_command(command)
+        if matcher.name != "pytest":
+            return None
+        self._refresh_symbol_index()
+        selection = self.test_selector.select(changed)
+        if selection["full_suite"] or not selection["nodes"]:
+            return None
+        return matcher.narrow_command(command, selection["nodes"], str(self.project_dir))
+    
+    def _run_affected_tests(self, paths: str):
+        """Handle the affected [files] built-in: run the tests impacted by changed files"""
+        self._refresh_symbol_index()
+        changed = paths.split() or self.change_tracker.changed_paths()
+        if not changed:
+            print("✅ No changed files - nothing to test")
+            return
+        selection = self.test_selector.select(changed)
+        if selection["full_suite"]:
+            print(f"🧪 Running the full suite: {selection['reason']}")
+            targets = selection["test_files"]
+        elif not selection["nodes"]:
+            print(f"✅ No tests exercise {', '.join(changed[:5])}")
+            return
+        else:
+            targets = selection["nodes"]
+            print(f"🧪 {len(targets)} affected test target(s) for {len(changed)} changed file(s) "
+                  f"({selection['reason']})")
+        
+        started_at = datetime.now().isoformat()
+        result = run_sharded(self.executor, targets, on_output=self._emit_command_output)
+        label = f"{PYTEST_COMMAND} <{len(targets) or 'all'} targets, {result['shards']} shards>"
+        distiller = LogDistiller(PYTEST_COMMAND)
+        distiller.feed_text(result["stdout"])
+        self._record_command_outcome(label, result, distiller)
+        self._record_build_attempt({
+            "command": label,
+            "phase": "affected",
+            "started_at": started_at,
+            "returncode": result["returncode"],
+            "wall_time": round(result["duration"], 3),
+            "cpu_time": round(result["cpu_time"], 3) if result["cpu_time"] is not None else None,
+            "max_rss_kb": result["max_rss_kb"],
+            "targets": len(targets),
+            "shards": result["shards"]
+        })
+        status = "✅ passed" if result["returncode"] == 0 else f"❌ failed (exit {result['returncode']})"
+        print(f"{status} in {result['duration']:.1f}s across {result['shards']} shard(s)")
+    
+    def _fix_build(self, command: str):
+        """Handle the fix <build command> built-in"""
+        if not command:
+            print("💡 Usage: fix <build command>   e.g. fix python -m pytest -q")
+            return
+        fixer = BuildFixer(
+            self.project_dir,
+            self._run_streamed,
+            lambda prompt: self._call_llm(prompt, num_predict=FIX_NUM_PREDICT, priority=BATCH),
+            self._apply_fix_file,
+            record_attempt=self._record_build_attempt,
+            related_files=self.symbol_index.imports_of,
+            affected_command=self._affected_test_command
+        )
+        self._refresh_symbol_index()
+        self.file_digests.pause()
+        try:
+            outcome = fixer.run(command)
+        finally:
+            self.file_digests.resume()
+        
+        messages = {
+            "passed": "✅ Build passes",
+            "max_iterations": "⚠️  Still failing after the maximum number of fix attempts",
+            "no_progress": "⚠️  Stopped: the last attempts did not change the errors",
+            "no_patch": "⚠️  Stopped: the model did not propose a usable patch",
+            "rejected": "🛑 Stopped: proposed changes were not approved",
+            "llm_error": "❌ Stopped: could not reach the model"
+        }
+        print(f"{messages[outcome['status']]} ({outcome['iterations']} fix attempt(s), {outcome['duration']:.1f}s)")
+        for attempt in outcome["attempts"]:
+            print(f"   #{attempt['iteration']} {attempt['phase']:<8} exit {attempt['returncode']:<4} "
+                  f"{attempt['wall_time']:.1f}s  {attempt['command']}")
+        if outcome["files_changed"]:
+            print(f"📝 Files changed: {', '.join(outcome['files_changed'])}")
+        self._update_context(f"fix {command}", f"Build fix loop finished: {outcome['status']}",
+                             action_taken=f"fix_build:{outcome['status']}")
+    
+    def _map_files(self, argument: str):
+        """Handle map <globs> <instruction>, map resume and map status"""
+        if argument in ("resume", "status"):
+            run = MapRun.latest(self.project_dir, unfinished_only=argument == "resume")
+            if run is None:
+                print("🗺️  No unfinished map run to resume." if argument == "resume" else "🗺️  No map runs yet.")
+                return
+            if argument == "status":
+                self._show_map_stats(run)
+                return
+            print(f"🗺️  Resuming map run {run.state['id']}: {run.state['instruction']} "
+                  f"({', '.join(f'{n} {status}' for status, n in run.counts().items())})")
+        else:
+            globs, _, instruction = argument.partition(" ")
+            if not instruction.strip():
+                print("💡 Usage: map <globs> <instruction>   e.g. map *.py,!tests/ replace print with logging")
+                print("          map resume | map status")
+                return
+            patterns = [pattern for pattern in globs.split(",") if pattern]
+            files = select_files(self.project_dir, patterns)
+            if not files:
+                print(f"🗺️  No project files match {globs}")
+                return
+            run = MapRun.create(self.project_dir, instruction.strip(), patterns, files)
+            print(f"🗺️  Map run {run.state['id']}: {len(files)} file(s), instruction: {instruction.strip()}")
+        
+        try:
+            parallelism = self._batch_parallelism('map_parallelism')
+        except ValueError:
+            print("❌ map_parallelism under llm_config must be a number or \"auto\"")
+            return
+        print(f"🧠 Generating with up to {parallelism} model pass(es) at a time; diffs are shown as they arrive")
+        print("💬 For each diff: y = approve, n = reject, a = approve this and all later ones, q = stop (resume later)")
+        approve_all = False
+        self.file_digests.pause()
+        try:
+            run.start(lambda prompt: self._call_llm(prompt, num_predict=MAP_NUM_PREDICT, quiet=True, priority=BATCH),
+                      parallelism)
+            for rel, entry in run.proposals():
+                timing = f" ({entry['duration']:.1f}s)" if "duration" in entry else ""
+                if entry["status"] != "proposed":
+                    icon = "➖" if entry["status"] == "unchanged" else "❌"
+                    print(f"{icon} {rel}: {entry['status']}{timing}" + (f" - {entry['detail']}" if entry.get("detail") else ""))
+                    continue
+                print(f"\n📄 {rel}{timing}")
+                diff = entry["diff"].splitlines()
+                print("\n".join(diff[:PLAN_DIFF_LINES]))
+                if len(diff) > PLAN_DIFF_LINES:
+                    print(f"... ({len(diff) - PLAN_DIFF_LINES} more diff lines)")
+                answer = "y" if approve_all else input("Approve this change? [y/n/a/q]: ").strip().lower()
+                if answer == "q":
+                    break
+                approve_all = approve_all or answer == "a"
+                run.decide(rel, answer in ("y", "yes", "a"))
+        finally:
+            # Also runs on Ctrl+C: files not generated or reviewed yet stay open for `map resume`
+            run.stop()
+            self.file_digests.resume()
+        
+        results = run.apply_approved(self._record_file_operation)
+        applied = sum(result["status"] == "applied" for result in results)
+        if results:
+            print(f"✅ Applied {applied} of {len(results)} approved file(s) as one batch")
+        self._show_map_stats(run)
+        if not run.finished:
+            print("⏸️  Map run paused; type 'map resume' to continue it")
+        self._update_context(f"map {argument}", f"Map run {run.state['id']}: {run.state['instruction']}",
+                             action_taken=f"map:{applied}/{len(run.files)}")
+    
+    def _show_map_stats(self, run: MapRun):
+        """Print a map run's outcome counts and per-file timings"""
+        stats = run.stats()
+        print(f"📊 Map run {run.state['id']}: " + ", ".join(f"{n} {status}" for status, n in stats["counts"].items()))
+        if stats["timed"]:
+            print(f"⏱️  {stats['timed']} model pass(es): {stats['total']:.1f}s total in {stats['wall_time']:.1f}s wall time, "
+                  f"mean {stats['mean']:.1f}s, median {stats['median']:.1f}s, max {stats['max']:.1f}s")
+            for slow in stats["slowest"]:
+                print(f"   🐢 {slow['path']}: {slow['duration']:.1f}s")
+        for rel, entry in run.files.items():
+            if entry["status"] in ("failed", "stale"):
+                print(f"   ❌ {rel}: {entry['status']} - {entry.get('detail', '')}")
+    
+    def _control_cache(self, user_input: str):
+        """Handle the cache on|off|clear built-in"""
+        action = user_input.lower().partition(' ')[2].strip()
+        llm_config = self.context.setdefault('llm_config', {})
+        if action in ('on', 'off'):
+            llm_config['command_cache'] = action == 'on'
+            self._save_context()
+            print(f"♻️  Command result cache {action}")
+        elif action == 'clear':
+            print(f"🧹 Removed {self.command_cache.clear()} cached command results")
+        else:
+            stats = self.command_cache.stats()
+            state = "on" if llm_config.get('command_cache', False) else "off"
+            print(f"♻️  Command result cache {state}: {stats['entries']} entries, "
+                  f"{stats['bytes'] // 1024} KB, {stats['hits']} hits / {stats['misses']} misses this session")
+    
+    def _set_persistent_shell(self, enabled: bool) -> bool:
+        """Start or stop the persistent shell used for foreground commands"""
+        if not enabled:
+            if self.shell:
+                self.shell.close()
+            self.shell = None
+            return True
+        if self.shell is None:
+            try:
+                shell = PersistentShell(self.project_dir)
+                shell.start()
+            except (ShellError, OSError, TimeoutError) as e:
+                print(f"⚠️  Persistent shell unavailable, using a fresh process per command: {e}")
+                return False
+            self.shell = shell
+        return True
+    
+    def _toggle_shell(self, user_input: str):
+        """Handle the shell on|off built-in"""
+        action = user_input.lower().partition(' ')[2]
+        if action in ('on', 'off') and not self._set_persistent_shell(action == 'on'):
+            return  # The warning already says commands use a fresh process
+        if action == 'on':
+            print(f"🐚 Persistent shell on (cwd: {self.shell.cwd})")
+        elif action == 'off':
+            print("🐚 Persistent shell off - each command runs in a fresh process")
+        elif self.shell:
+            print(f"🐚 Persistent shell on (cwd: {self.shell.cwd}, {self.shell.commands_run} commands, "
+                  f"{self.shell.restarts} restarts)")
+        else:
+            print("🐚 Persistent shell off. Use 'shell on' to enable it.")
+    
+    def _toggle_structured(self, user_input: str):
+        """Handle the structured on|off built-in"""
+        action = user_input.lower().partition(' ')[2]
+        llm_config = self.context.setdefault('llm_config', {})
+        if action in ('on', 'off'):
+            llm_config['structured_output'] = action == 'on'
+            self.structured_failures = 0
+            self._save_context()
+        state = "on" if llm_config.get('structured_output', False) else "off"
+        print(f"🧾 Structured JSON responses {state}")
+    
     def _test_llm_connection(self):
         """Test LLM connection with a simple prompt"""
         print("🧪 Testing LLM connection...")
@@ -568,6 +1762,20 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
         except Exception as e:
             print(f"❌ Test failed with error: {e}")
     
+    def _show_endpoints(self):
+        """List Ollama endpoints with health, load, request latency and learned concurrency"""
+        print("🌐 Ollama Endpoints:")
+        for stats in self.llm_pool.stats():
+            models = "models unknown" if stats["models"] is None else f"{len(stats['models'])} models"
+            print(f"  {stats['url']}  {'up' if stats['healthy'] else 'DOWN'}, {stats['outstanding']}/{stats['parallel']} busy, "
+                  f"{models}, {stats['requests']} requests ({stats['failures']} failed), "
+                  f"latency mean {stats['latency_mean']:.1f}s / p95 {stats['latency_p95']:.1f}s")
+            if stats["adaptive"]:
+                rates = ", ".join(f"{level}: {rate:.0f}" for level, rate in stats["adaptive"]["throughput"].items())
+                print(f"     adaptive limit {stats['adaptive']['limit']}, tokens/s by requests in flight: {rates or 'not measured yet'}")
+            if stats["last_error"]:
+                print(f"     last error: {stats['last_error']}")
+    
     def _handle_confirmation_response(self, user_input: str) -> str:
         """Handle user confirmation responses"""
         if not self.confirmation_mode:
@@ -575,35 +1783,37 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
         
         user_input_lower = user_input.lower().strip()
         
-        if user_input_lower in ['yes', 'y', 'proceed', 'continue', 'approve']:
+        if user_input_lower in APPROVE_ANSWERS:
             # User approved the action
             print(f"✅ Confirmation received: PROCEEDING with action")
-            self.confirmation_mode = False
-            self.pending_action = None
-            self.pending_question = None
-            
-            # Send the confirmation back to LLM to continue
-            follow_up_prompt = f"User has confirmed: '{user_input}'. Please proceed with the action you were planning."
-            try:
-                return self._call_llm(follow_up_prompt)
-            except Exception as e:
-                return f"Error continuing with action: {e}. Please provide a new instruction."
+            pending = self.context.get("pending_confirmation") or {}
+            plan = self.pending_plan if self.pending_action == "action_plan" else None
+            self._clear_pending_confirmation()
+            if plan:
+                # The approved plan is already parsed and prepared: apply it, no new generation needed
+                return self._apply_plan(plan)
+            return self._continue_after_confirmation(user_input, pending)
             
         elif user_input_lower in ['no', 'n', 'cancel', 'stop', 'deny']:
             # User denied the action
             print(f"❌ Confirmation received: CANCELLING action")
-            self.confirmation_mode = False
-            self.pending_action = None
-            self.pending_question = None
+            if self.pending_plan:
+                for action in self.pending_plan.actions:
+                    self._record_file_operation({
+                        "timestamp": datetime.now().isoformat(),
+                        "operation": action.get("operation", action["type"]),
+                        "target": action.get("path") or action.get("command"),
+                        "plan_created_at": self.pending_plan.created_at,
+                        "status": "declined"
+                    })
+            self._clear_pending_confirmation()
             
             return "Action cancelled by user. What would you like to do instead?"
             
         elif user_input_lower in ['exit', 'quit', 'q']:
             # User wants to exit confirmation mode
             print(f"🚪 Exiting confirmation mode")
-            self.confirmation_mode = False
-            self.pending_action = None
-            self.pending_question = None
+            self._clear_pending_confirmation()
             
             return "Confirmation mode exited. What would you like to do?"
             
@@ -614,6 +1824,12 @@ FORMAT YOUR RESPONSE CLEARLY AND STRUCTURED. Always end with a clear question or
 
 def main():
     """Main entry point"""
+    if sys.argv[1:2] in (["serve"], ["attach"]):
+        # Daemon mode builds on the asyncio agent, which itself imports this module
+        from ulca_server import main as server_main
+        server_main(sys.argv[1:])
+        return
+    
     # Get project directory
     project_dir = os.getcwd()
     